@@ -23,8 +23,21 @@ def version():
 
 
 from studiolibrary import config
+from studiolibrary import metrics
 from studiolibrary import resource
 from studiolibrary.utils import *
+from studiolibrary import lock
+from studiolibrary import pathindex
+from studiolibrary import snapshot
+from studiolibrary import storage
+from studiolibrary import manifest
+from studiolibrary.itemrecord import ItemRecord
+from studiolibrary.searchindex import SearchIndex
+from studiolibrary.facetindex import FacetIndex
+from studiolibrary.sortkeys import SortKeys
+from studiolibrary.searchexecutor import SearchTask, SearchExecutor
+from studiolibrary.watcher import DatabaseWatcher, FolderWatcher
 from studiolibrary.library import Library
+from studiolibrary.federatedlibrary import FederatedLibrary
 from studiolibrary.libraryitem import LibraryItem
 from studiolibrary.main import main
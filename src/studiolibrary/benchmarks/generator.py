@@ -0,0 +1,122 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import zlib
+import struct
+import random
+import logging
+
+
+__all__ = [
+    "generateLibrary",
+]
+
+logger = logging.getLogger(__name__)
+
+
+EXTENSIONS = [".pose", ".anim", ".mirror", ".set"]
+
+FILENAMES = {
+    ".pose": ["pose.json"],
+    ".anim": ["pose.json", "animation.ma"],
+    ".mirror": ["mirrortable.json"],
+    ".set": ["set.json"],
+}
+
+WORDS = [
+    "walk", "run", "jump", "idle", "cycle", "fall", "climb", "wave",
+    "smile", "blink", "hand", "face", "arm", "leg", "spine", "hero",
+    "mario", "luigi", "peach", "bowser", "left", "right", "open", "closed",
+]
+
+
+def _thumbnail():
+    """
+    Return the bytes for a small grey PNG image.
+
+    :rtype: bytes
+    """
+    def chunk(name, data):
+        crc = zlib.crc32(name + data) & 0xffffffff
+        return struct.pack(">I", len(data)) + name + data + struct.pack(">I", crc)
+
+    size = 8
+    rows = b"".join(b"\x00" + b"\x80\x80\x80" * size for _ in range(size))
+
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)),
+        chunk(b"IDAT", zlib.compress(rows)),
+        chunk(b"IEND", b""),
+    ])
+
+
+def generateLibrary(path, count=1000, depth=3, folders=4, seed=0):
+    """
+    Generate a synthetic library with the given number of items.
+
+    The items are spread over a tree of folders with the given depth and
+    number of sub folders per folder. Each item contains its data files,
+    a thumbnail and every third item has a metadata file with tags.
+
+    Example:
+        generateLibrary("/tmp/library", count=10000, depth=4)
+
+    :type path: str
+    :type count: int
+    :type depth: int
+    :type folders: int
+    :type seed: int
+    :rtype: list[str]
+    """
+    rand = random.Random(seed)
+    thumbnail = _thumbnail()
+
+    dirs = [path]
+    for level in range(depth):
+        dirs = [
+            "{0}/{1}{2}".format(dirname, rand.choice(WORDS).title(), i)
+            for dirname in dirs
+            for i in range(folders)
+        ]
+
+    paths = []
+
+    for i in range(count):
+        extension = EXTENSIONS[i % len(EXTENSIONS)]
+        name = "{0}_{1}_{2:06d}{3}".format(
+            rand.choice(WORDS), rand.choice(WORDS), i, extension
+        )
+
+        itemPath = "{0}/{1}".format(dirs[i % len(dirs)], name)
+        os.makedirs(os.path.join(itemPath, ".studiolibrary"))
+
+        for filename in FILENAMES[extension]:
+            with open(os.path.join(itemPath, filename), "w") as f:
+                f.write("{}")
+
+        with open(os.path.join(itemPath, "thumbnail.png"), "wb") as f:
+            f.write(thumbnail)
+
+        if i % 3 == 0:
+            metadata = {"tags": rand.sample(WORDS, 3), "color": "rgb(0,0,0)"}
+            metadataPath = os.path.join(itemPath, ".studiolibrary", "metadata.json")
+            with open(metadataPath, "w") as f:
+                json.dump(metadata, f)
+
+        paths.append(itemPath)
+
+    logger.info("Generated %s items in %s", count, path)
+
+    return paths
@@ -0,0 +1,290 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+"""
+Time the main library operations on a generated library.
+
+The results are printed as JSON and the exit code is 1 when any time is
+above its threshold. The thresholds are read from a JSON file of seconds
+for each operation, or from the results of a previous run multiplied by
+the tolerance.
+
+Example:
+    python -m studiolibrary.benchmarks.librarybenchmark --count 10000 --depth 4 > baseline.json
+    python -m studiolibrary.benchmarks.librarybenchmark --count 10000 --depth 4 --baseline baseline.json --tolerance 1.5
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import collections
+
+import studiolibrary
+import studiolibrary.benchmarks
+
+
+logger = logging.getLogger(__name__)
+
+
+SORT_BY = ["type:asc", "name:asc"]
+
+GROUP_BY = ["folder"]
+
+# The number of items saved and removed at once
+BATCH_SIZE = 100
+
+
+def qtApplication():
+    """
+    Get the Qt application needed for creating the items.
+
+    The offscreen platform is used on Linux when there is no display,
+    so the benchmarks can run on a build machine without Maya.
+
+    :rtype: QtWidgets.QApplication
+    """
+    if sys.platform.startswith("linux") and not (
+            os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")):
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    from studiovendor.Qt import QtWidgets
+
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def timeIt(func, repeat, setup=None):
+    """
+    Return the best time for calling the given function.
+
+    The setup function is called before each call and is not timed.
+
+    :type func: func
+    :type repeat: int
+    :type setup: func or None
+    :rtype: float
+    """
+    best = None
+
+    for i in range(repeat):
+        if setup:
+            setup()
+
+        t = time.time()
+        func()
+        t = time.time() - t
+
+        best = t if best is None else min(best, t)
+
+    return best
+
+
+def benchmarkLibrary(count=1000, depth=3, folders=4, repeat=3, seed=0):
+    """
+    Generate a library and time each of the library operations.
+
+    :type count: int
+    :type depth: int
+    :type folders: int
+    :type repeat: int
+    :type seed: int
+    :rtype: dict
+    """
+    qtApplication()
+
+    # The Maya items print the missing Maya modules when imported, which
+    # would break the results printed as JSON
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        studiolibrary.registerItems()
+    finally:
+        sys.stdout = stdout
+
+    path = studiolibrary.normPath(tempfile.mkdtemp(prefix="studiolibrary_benchmark_"))
+
+    try:
+        t = time.time()
+        paths = studiolibrary.benchmarks.generateLibrary(
+            path, count=count, depth=depth, folders=folders, seed=seed
+        )
+        generateTime = time.time() - t
+
+        library = studiolibrary.Library(path)
+        library.setSortBy(SORT_BY)
+        library.setGroupBy(GROUP_BY)
+
+        timings = collections.OrderedDict()
+
+        timings["sync"] = timeIt(lambda: library.sync(force=True), repeat)
+
+        timings["createItems"] = timeIt(
+            lambda: studiolibrary.Library(path).createItems(), repeat
+        )
+
+        def search(filters):
+            library.addQuery({"name": "benchmark", "operator": "or", "filters": filters})
+            return timeIt(library.search, repeat, setup=library.clearSearchCache)
+
+        timings["searchText"] = search([("*", "contains", "walk")])
+
+        folder = path + "/" + paths[0][len(path) + 1:].split("/")[0]
+        timings["searchFolder"] = search([
+            ("folder", "startswith", folder + "/"),
+            ("folder", "is", folder),
+        ])
+
+        queries = library.queries()
+        timings["searchFacet"] = timeIt(
+            lambda: library.facets(["type", "folder"], queries), repeat
+        )
+
+        library.removeQuery("benchmark")
+
+        records = library.records()
+
+        timings["sorted"] = timeIt(
+            lambda: studiolibrary.Library.sorted(records, SORT_BY), repeat
+        )
+
+        timings["groupItems"] = timeIt(
+            lambda: studiolibrary.Library.groupItems(records, GROUP_BY), repeat
+        )
+
+        items = library.itemsFromRecords(records[:BATCH_SIZE])
+
+        timings["saveItemData"] = timeIt(
+            lambda: library.saveItemData(items, emitDataChanged=False), repeat
+        )
+
+        renamed = [folder, folder + "_renamed"]
+
+        def renamePath():
+            library.renamePath(renamed[0], renamed[1])
+            renamed.reverse()
+
+        timings["renamePath"] = timeIt(renamePath, repeat)
+
+        data = library.read()
+        removed = [path_ for path_ in paths if path_ in data][-BATCH_SIZE:]
+        removedData = dict((path_, dict(data[path_])) for path_ in removed)
+
+        timings["removePaths"] = timeIt(
+            lambda: library.removePaths(removed),
+            repeat,
+            setup=lambda: library.update(removedData),
+        )
+    finally:
+        shutil.rmtree(path)
+
+    return collections.OrderedDict([
+        ("version", studiolibrary.version()),
+        ("python", platform.python_version()),
+        ("platform", platform.platform()),
+        ("count", len(paths)),
+        ("depth", depth),
+        ("folders", folders),
+        ("repeat", repeat),
+        ("generate", generateTime),
+        ("timings", timings),
+    ])
+
+
+def thresholdsFromBaseline(baseline, tolerance=1.5):
+    """
+    Get the threshold for each operation from the results of a previous run.
+
+    :type baseline: dict
+    :type tolerance: float
+    :rtype: dict
+    """
+    return dict(
+        (name, seconds * tolerance) for name, seconds in baseline["timings"].items()
+    )
+
+
+def checkThresholds(result, thresholds):
+    """
+    Get a message for each operation that took longer than its threshold.
+
+    :type result: dict
+    :type thresholds: dict
+    :rtype: list[str]
+    """
+    failures = []
+
+    for name, seconds in result["timings"].items():
+        threshold = thresholds.get(name)
+
+        if threshold is not None and seconds > threshold:
+            msg = "{0} took {1:.3f}s which is above the threshold of {2:.3f}s"
+            failures.append(msg.format(name, seconds, threshold))
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--folders", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="The file to save the results to")
+    parser.add_argument("--thresholds", help="A JSON file with the seconds for each operation")
+    parser.add_argument("--baseline", help="The results of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    args = parser.parse_args()
+
+    result = benchmarkLibrary(
+        count=args.count,
+        depth=args.depth,
+        folders=args.folders,
+        repeat=args.repeat,
+        seed=args.seed,
+    )
+
+    text = json.dumps(result, indent=4)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    thresholds = {}
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            thresholds.update(thresholdsFromBaseline(json.load(f), args.tolerance))
+
+    if args.thresholds:
+        with open(args.thresholds) as f:
+            thresholds.update(json.load(f))
+
+    failures = checkThresholds(result, thresholds)
+
+    for failure in failures:
+        sys.stderr.write(failure + "\n")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+"""
+Compare matching item data with the interpreted and the compiled queries.
+
+Example:
+    python -m studiolibrary.benchmarks.querybenchmark --count 100000
+"""
+
+import time
+import random
+import logging
+import argparse
+
+import studiolibrary
+
+
+logger = logging.getLogger(__name__)
+
+
+def generateItemData(count=10000, seed=0):
+    """
+    Generate item data that looks like the data saved when syncing.
+
+    :type count: int
+    :type seed: int
+    :rtype: list[dict]
+    """
+    from studiolibrary.benchmarks.generator import EXTENSIONS, WORDS
+
+    rand = random.Random(seed)
+    items = []
+
+    for i in range(count):
+        extension = EXTENSIONS[i % len(EXTENSIONS)]
+        folder = "P:/Library/{0}/{1}".format(
+            rand.choice(WORDS).title(), rand.choice(WORDS).title()
+        )
+        name = "{0}_{1}{2}".format(rand.choice(WORDS), i, extension)
+
+        items.append({
+            "name": name,
+            "path": folder + "/" + name,
+            "type": extension,
+            "folder": folder,
+            "category": folder.split("/")[-1],
+            "modified": 1592469832.26 + i,
+            "tags": rand.sample(WORDS, 2),
+        })
+
+    return items
+
+
+# The queries used by the library window for the folder, filter by menu
+# and search text widgets.
+QUERIES = [
+    {
+        "name": "folders",
+        "operator": "or",
+        "filters": [
+            ("folder", "is", "P:/Library/Mario/Walk"),
+            ("folder", "startswith", "P:/Library/Mario/Walk/"),
+        ],
+    },
+    {
+        "name": "filterByType",
+        "operator": "and",
+        "filters": [
+            ("type", "not", ".set"),
+            ("type", "not", ".mirror"),
+        ],
+    },
+    {
+        "name": "searchText",
+        "operator": "and",
+        "filters": [
+            ("*", "contains", "hero"),
+        ],
+    },
+]
+
+
+def timeMatch(items, match, repeat):
+    """
+    Return the best time and the number of items matched by the given function.
+
+    :type items: list[dict]
+    :type match: func
+    :type repeat: int
+    :rtype: (float, int)
+    """
+    best = None
+    count = 0
+
+    for i in range(repeat):
+        t = time.time()
+        count = sum(1 for data in items if match(data))
+        t = time.time() - t
+        best = t if best is None else min(best, t)
+
+    return best, count
+
+
+def benchmarkQueries(count=10000, repeat=3, queries=None):
+    """
+    Time Library.match against the function from Library.compileQueries.
+
+    :type count: int
+    :type repeat: int
+    :type queries: list[dict] or None
+    :rtype: dict
+    """
+    queries = QUERIES if queries is None else queries
+    items = generateItemData(count)
+
+    def interpreted(data):
+        return studiolibrary.Library.match(data, queries)
+
+    t = time.time()
+    match = studiolibrary.Library.compileQueries(queries)
+    compileTime = time.time() - t
+
+    interpretedTime, interpretedCount = timeMatch(items, interpreted, repeat)
+    compiledTime, compiledCount = timeMatch(items, match, repeat)
+
+    assert interpretedCount == compiledCount, "The compiled queries matched different items"
+
+    return {
+        "count": count,
+        "matched": compiledCount,
+        "compile": compileTime,
+        "interpreted": interpretedTime,
+        "compiled": compiledTime,
+        "speedup": interpretedTime / max(compiledTime, 1e-9),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    result = benchmarkQueries(count=args.count, repeat=args.repeat)
+
+    msg = "Matched {matched} of {count} items: interpreted {interpreted:.3f}s, " \
+          "compiled {compiled:.3f}s ({speedup:.1f}x)"
+    print(msg.format(**result))
+
+
+if __name__ == "__main__":
+    main()
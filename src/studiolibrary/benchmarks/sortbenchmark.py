@@ -0,0 +1,150 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+"""
+Compare sorting one field at a time with sorting once by composite keys.
+
+Example:
+    python -m studiolibrary.benchmarks.sortbenchmark --count 100000
+"""
+
+import time
+import logging
+import argparse
+
+import studiolibrary
+
+
+logger = logging.getLogger(__name__)
+
+
+# The sort orders available from the sort by menu
+SORT_BY = [
+    ["name:asc"],
+    ["modified:dsc"],
+    ["category:asc", "name:asc"],
+    ["category:dsc", "modified:dsc"],
+    ["type:asc", "category:dsc", "name:asc"],
+]
+
+
+def sortedByField(items, sortBy):
+    """
+    Sort the items with one sort for each field like older versions.
+
+    :type items: list[studiolibrary.ItemRecord]
+    :type sortBy: list[str]
+    :rtype: list[studiolibrary.ItemRecord]
+    """
+    for field in reversed(sortBy):
+
+        tokens = field.split(':')
+
+        reverse = False
+        if len(tokens) > 1:
+            field = tokens[0]
+            reverse = tokens[1] != 'asc'
+
+        def sortKey(item):
+
+            default = False if reverse else ''
+
+            return item.itemData().get(field, default)
+
+        items = sorted(items, key=sortKey, reverse=reverse)
+
+    return items
+
+
+def timeSort(func, repeat):
+    """
+    Return the best time for calling the given function.
+
+    :type func: func
+    :type repeat: int
+    :rtype: float
+    """
+    best = None
+
+    for i in range(repeat):
+        t = time.time()
+        func()
+        t = time.time() - t
+        best = t if best is None else min(best, t)
+
+    return best
+
+
+def benchmarkSort(count=10000, repeat=3, sortBy=None):
+    """
+    Time sorting by each field against sorting once and sorting by the
+    positions kept from the previous search.
+
+    :type count: int
+    :type repeat: int
+    :type sortBy: list[str] or None
+    :rtype: dict
+    """
+    from studiolibrary.benchmarks.querybenchmark import generateItemData
+
+    sortBy = sortBy or SORT_BY[-1]
+
+    items = [
+        studiolibrary.ItemRecord(itemData["path"], itemData, studiolibrary.LibraryItem)
+        for itemData in generateItemData(count)
+    ]
+
+    sortKeys = studiolibrary.SortKeys()
+
+    def sortCold():
+        return studiolibrary.SortKeys().sorted(items, sortBy)
+
+    def sortOnce():
+        sortKeys.clear()
+        return sortKeys.sorted(items, sortBy)
+
+    def sortCached():
+        return sortKeys.sorted(items, sortBy, allItems=items)
+
+    assert sortCached() == sortOnce(), "The cached positions sorted differently"
+
+    byField = timeSort(lambda: sortedByField(items, sortBy), repeat)
+    cold = timeSort(sortCold, repeat)
+    once = timeSort(sortOnce, repeat)
+    cached = timeSort(sortCached, repeat)
+
+    return {
+        "count": count,
+        "sortBy": ", ".join(sortBy),
+        "byField": byField,
+        "cold": cold,
+        "once": once,
+        "cached": cached,
+        "speedup": byField / max(cached, 1e-9),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    msg = "Sorted {count} items by {sortBy}: by field {byField:.3f}s, " \
+          "cold {cold:.3f}s, changed {once:.3f}s, cached {cached:.3f}s ({speedup:.1f}x)"
+
+    for sortBy in SORT_BY:
+        result = benchmarkSort(count=args.count, repeat=args.repeat, sortBy=sortBy)
+        print(msg.format(**result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+"""
+Compare the sequential and the threaded library walker.
+
+Example:
+    python -m studiolibrary.benchmarks.syncbenchmark --count 2000 --latency 0.002
+"""
+
+import os
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import functools
+import contextlib
+
+import studiolibrary
+import studiolibrary.benchmarks
+
+
+logger = logging.getLogger(__name__)
+
+
+@contextlib.contextmanager
+def simulateLatency(seconds):
+    """
+    Add the given delay to the file system calls used when walking.
+
+    Sleeping releases the GIL in the same way as waiting on network
+    storage, so this can be used to emulate a library on a file server.
+
+    :type seconds: float
+    """
+    if not seconds:
+        yield
+        return
+
+    def delayed(func):
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            time.sleep(seconds)
+            return func(*args, **kwargs)
+        return wrapped
+
+    names = [
+        (os, "listdir"),
+        (os.path, "isdir"),
+        (os.path, "exists"),
+        (os.path, "getmtime"),
+    ]
+
+    originals = [(module, name, getattr(module, name)) for module, name in names]
+
+    try:
+        for module, name, func in originals:
+            setattr(module, name, delayed(func))
+        yield
+    finally:
+        for module, name, func in originals:
+            setattr(module, name, func)
+
+
+def timeWalker(library, threads):
+    """
+    Return the time taken and the item data found by walking the library.
+
+    :type library: studiolibrary.Library
+    :type threads: int
+    :rtype: (float, list[dict])
+    """
+    t = time.time()
+    items = list(library.walker(library.path(), threads=threads))
+    return time.time() - t, items
+
+
+def benchmarkSync(count=1000, depth=3, threads=8, latency=0.0):
+    """
+    Time the sequential walker against the threaded walker.
+
+    :type count: int
+    :type depth: int
+    :type threads: int
+    :type latency: float
+    :rtype: dict
+    """
+    studiolibrary.registerItems()
+
+    path = tempfile.mkdtemp(prefix="studiolibrary_benchmark_")
+    try:
+        studiolibrary.benchmarks.generateLibrary(path, count=count, depth=depth)
+        library = studiolibrary.Library(path)
+
+        with simulateLatency(latency):
+            sequentialTime, sequential = timeWalker(library, threads=1)
+            threadedTime, threaded = timeWalker(library, threads=threads)
+    finally:
+        shutil.rmtree(path)
+
+    assert sequential == threaded, "The threaded walker returned different results"
+
+    return {
+        "count": len(sequential),
+        "threads": threads,
+        "latency": latency,
+        "sequential": sequentialTime,
+        "threaded": threadedTime,
+        "speedup": sequentialTime / max(threadedTime, 1e-9),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    result = benchmarkSync(
+        count=args.count,
+        depth=args.depth,
+        threads=args.threads,
+        latency=args.latency,
+    )
+
+    msg = "Walked {count} items: sequential {sequential:.3f}s, " \
+          "{threads} threads {threaded:.3f}s ({speedup:.1f}x)"
+    print(msg.format(**result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,534 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+"""
+Maintain libraries from the command line without the library window.
+
+The exit code is 0 when the command succeeded for every library and 1
+when it failed or found problems for any of them.
+
+Example:
+    python -m studiolibrary sync --threads 16 /library/data
+    python -m studiolibrary verify --fix /library/data
+    python -m studiolibrary compact /library/data
+    python -m studiolibrary stats --json /library/data
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import collections
+from multiprocessing.pool import ThreadPool
+
+from studiovendor import six
+
+import studiolibrary
+
+
+__all__ = [
+    "Progress",
+    "openLibrary",
+    "syncLibrary",
+    "verifyLibrary",
+    "compactLibrary",
+    "libraryStats",
+    "main",
+]
+
+
+logger = logging.getLogger(__name__)
+
+
+EXIT_SUCCESS = 0
+EXIT_FAILURE = 1
+
+
+class Progress(object):
+    """
+    Print the progress of a command to a stream without any widgets.
+
+    The progress replaces the current line when the stream is a terminal,
+    otherwise a line is printed at most once every few seconds so that
+    the log of an overnight job stays readable.
+
+    Example:
+        library.sync(progressCallback=Progress(prefix=library.path()))
+    """
+
+    # The seconds between updates for a terminal and for a log file
+    INTERVAL = 0.1
+    LOG_INTERVAL = 5.0
+
+    def __init__(self, stream=None, prefix="", quiet=False):
+        """
+        :type stream: file or None
+        :type prefix: str
+        :type quiet: bool
+        """
+        self._stream = stream or sys.stderr
+        self._prefix = prefix
+        self._quiet = quiet
+        self._time = None
+        self._start = time.time()
+        self._width = 0
+        self._isTerminal = hasattr(self._stream, "isatty") and self._stream.isatty()
+
+    def __call__(self, label, percent=None):
+        """
+        Show the given label for the current stage of the command.
+
+        :type label: str
+        :type percent: float or None
+        """
+        if self._quiet:
+            return
+
+        now = time.time()
+        interval = self.INTERVAL if self._isTerminal else self.LOG_INTERVAL
+
+        # The first and the last update are always shown
+        if self._time is not None and now - self._time < interval:
+            if percent is None or percent < 100:
+                return
+
+        self._time = now
+
+        text = u"[{0:.1f}s] {1}".format(now - self._start, label)
+        if self._prefix:
+            text = u"{0}: {1}".format(self._prefix, text)
+
+        if self._isTerminal:
+            self._stream.write(u"\r" + text.ljust(self._width))
+            self._width = len(text)
+        else:
+            self._stream.write(text + u"\n")
+
+        self._stream.flush()
+
+    def finish(self):
+        """End the line of progress shown in a terminal."""
+        if self._isTerminal and self._width:
+            self._stream.write(u"\n")
+            self._stream.flush()
+            self._width = 0
+
+
+def registerItems():
+    """
+    Register the items from the config without printing to stdout.
+
+    The Maya items print the missing Maya modules when imported, which
+    would break the results printed as JSON.
+    """
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        studiolibrary.registerItems()
+    finally:
+        sys.stdout = stdout
+
+
+def openLibrary(path):
+    """
+    Get the library for the given path without watching the database.
+
+    :type path: str
+    :raises: IOError
+    :rtype: studiolibrary.Library
+    """
+    path = studiolibrary.normPath(os.path.abspath(path))
+
+    if not os.path.isdir(path):
+        raise IOError(u'The library path does not exist "{0}"'.format(path))
+
+    library = studiolibrary.Library(path)
+    library.setWatchEnabled(False)
+
+    return library
+
+
+def databaseFiles(library):
+    """
+    Get the database files that exist on disc with their size in bytes.
+
+    :type library: studiolibrary.Library
+    :rtype: list[(str, int)]
+    """
+    files = []
+
+    for path in library.storage().files():
+        if os.path.isfile(path):
+            files.append((path, os.path.getsize(path)))
+
+    return files
+
+
+def syncLibrary(library, force=False, progress=None):
+    """
+    Sync the items on disc with the database of the given library.
+
+    :type library: studiolibrary.Library
+    :type force: bool
+    :type progress: func or None
+    :rtype: dict
+    """
+    t = time.time()
+
+    library.loadShards()
+    before = set(library.read())
+
+    library.sync(progressCallback=progress, force=force)
+
+    after = set(library.read())
+
+    return collections.OrderedDict([
+        ("items", len(after)),
+        ("added", len(after - before)),
+        ("removed", len(before - after)),
+        ("seconds", time.time() - t),
+    ])
+
+
+def verifyLibrary(library, threads=1, progress=None):
+    """
+    Find the items in the database that do not match the items on disc.
+
+    The paths are checked on a pool of threads, which hides the latency
+    of network storage.
+
+    :type library: studiolibrary.Library
+    :type threads: int
+    :type progress: func or None
+    :rtype: dict
+    """
+    storage = library.storage()
+
+    missingShards = []
+    if isinstance(storage, studiolibrary.storage.ShardedStorage):
+        for key in storage.shards(refresh=True):
+            path = storage.shardStorage(key).path()
+            if not os.path.exists(path):
+                missingShards.append(path)
+
+    library.loadShards()
+    data = library.read()
+    paths = sorted(data)
+
+    mismatched = [
+        path for path in paths if data[path].get("path", path) != path
+    ]
+
+    pool = None
+    if threads > 1:
+        pool = ThreadPool(threads)
+
+    missing = []
+
+    try:
+        if pool:
+            exists = pool.imap(os.path.exists, paths, 64)
+        else:
+            exists = (os.path.exists(path) for path in paths)
+
+        for i, (path, exists_) in enumerate(six.moves.zip(paths, exists)):
+            if not exists_:
+                missing.append(path)
+
+            if progress:
+                percent = float(i + 1) / len(paths) * 100
+                progress(u"Checked {0} of {1} items".format(i + 1, len(paths)), percent)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    return collections.OrderedDict([
+        ("items", len(paths)),
+        ("missing", missing),
+        ("mismatched", mismatched),
+        ("missingShards", missingShards),
+    ])
+
+
+def compactLibrary(library):
+    """
+    Compact the database of the given library.
+
+    :type library: studiolibrary.Library
+    :rtype: dict
+    """
+    library.loadShards()
+
+    before = sum(size for path, size in databaseFiles(library))
+
+    library.compact()
+
+    after = sum(size for path, size in databaseFiles(library))
+
+    return collections.OrderedDict([
+        ("before", before),
+        ("after", after),
+    ])
+
+
+def libraryStats(library):
+    """
+    Get the number of items of each type and the size of the database.
+
+    :type library: studiolibrary.Library
+    :rtype: dict
+    """
+    library.loadShards()
+
+    data = library.read()
+    storage = library.storage()
+
+    types = collections.Counter(
+        itemData.get("type") or "Unknown" for itemData in data.values()
+    )
+
+    shards = 0
+    if isinstance(storage, studiolibrary.storage.ShardedStorage):
+        shards = len(storage.shards(refresh=True))
+
+    files = databaseFiles(library)
+
+    modified = storage.mtime()
+    if modified is not None:
+        modified = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(modified))
+
+    return collections.OrderedDict([
+        ("path", library.path()),
+        ("database", library.databasePath()),
+        ("storage", storage.__class__.__name__),
+        ("shards", shards),
+        ("items", len(data)),
+        ("types", collections.OrderedDict(types.most_common())),
+        ("files", len(files)),
+        ("size", sum(size for path, size in files)),
+        ("modified", modified),
+    ])
+
+
+def formatSize(size):
+    """
+    Get the given number of bytes as text.
+
+    :type size: int
+    :rtype: str
+    """
+    for unit in ["B", "KB", "MB"]:
+        if size < 1024:
+            return u"{0:.0f} {1}".format(size, unit)
+        size /= 1024.0
+
+    return u"{0:.1f} GB".format(size)
+
+
+def runSync(library, args, progress):
+    result = syncLibrary(library, force=args.force, progress=progress)
+
+    msg = u"Synced {items} items ({added} added, {removed} removed) in {seconds:.2f} seconds"
+    return EXIT_SUCCESS, result, [msg.format(**result)]
+
+
+def runVerify(library, args, progress):
+    result = verifyLibrary(library, threads=args.threads, progress=progress)
+
+    lines = []
+    for path in result["missingShards"]:
+        lines.append(u'Missing shard "{0}"'.format(path))
+    for path in result["mismatched"]:
+        lines.append(u'The item data does not match the path "{0}"'.format(path))
+    for path in result["missing"]:
+        lines.append(u'Missing on disc "{0}"'.format(path))
+
+    failed = bool(lines)
+
+    if args.fix and result["missing"]:
+        library.removePaths(result["missing"])
+        lines.append(u"Removed {0} missing items".format(len(result["missing"])))
+        failed = bool(result["mismatched"] or result["missingShards"])
+
+    lines.append(u"Verified {0} items with {1} problems".format(
+        result["items"],
+        len(result["missing"]) + len(result["mismatched"]) + len(result["missingShards"]),
+    ))
+
+    return EXIT_FAILURE if failed else EXIT_SUCCESS, result, lines
+
+
+def runCompact(library, args, progress):
+    result = compactLibrary(library)
+
+    msg = u"Compacted the database from {0} to {1}"
+    msg = msg.format(formatSize(result["before"]), formatSize(result["after"]))
+
+    return EXIT_SUCCESS, result, [msg]
+
+
+def runStats(library, args, progress):
+    result = libraryStats(library)
+
+    lines = []
+    for name, value in result.items():
+        if name == "types":
+            for type_, count in value.items():
+                lines.append(u"  {0}: {1}".format(type_, count))
+            continue
+
+        if name == "size":
+            value = formatSize(value)
+
+        lines.append(u"{0}: {1}".format(name, value))
+
+    return EXIT_SUCCESS, result, lines
+
+
+def createParser():
+    """
+    Create the parser for the command line arguments.
+
+    :rtype: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m studiolibrary",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("paths", nargs="+", metavar="path", help="The library paths")
+    common.add_argument("--json", action="store_true", help="Print the results as JSON")
+    common.add_argument("--quiet", action="store_true", help="Do not show the progress")
+    common.add_argument("--verbose", action="store_true", help="Show the debug messages")
+
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+
+    sync = subparsers.add_parser(
+        "sync", parents=[common], help="Sync the items on disc with the database"
+    )
+    sync.add_argument("--force", action="store_true", help="List every folder again")
+    sync.add_argument("--threads", type=int, help="The number of threads for walking")
+    sync.set_defaults(func=runSync)
+
+    verify = subparsers.add_parser(
+        "verify", parents=[common], help="Find the items that are missing on disc"
+    )
+    verify.add_argument("--fix", action="store_true", help="Remove the missing items")
+    verify.add_argument("--threads", type=int, help="The number of threads for checking")
+    verify.set_defaults(func=runVerify)
+
+    compact = subparsers.add_parser(
+        "compact", parents=[common], help="Fold the changes into the database"
+    )
+    compact.set_defaults(func=runCompact)
+
+    stats = subparsers.add_parser(
+        "stats", parents=[common], help="Show the number of items and the database size"
+    )
+    stats.set_defaults(func=runStats)
+
+    return parser
+
+
+def main(args=None):
+    """
+    Run the command for each of the library paths.
+
+    :type args: list[str] or None
+    :rtype: int
+    """
+    parser = createParser()
+    args = parser.parse_args(args)
+
+    if not getattr(args, "func", None):
+        parser.print_help()
+        return EXIT_FAILURE
+
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=logging.DEBUG if args.verbose else logging.WARNING,
+        format="%(levelname)s: %(message)s",
+    )
+
+    if getattr(args, "threads", None):
+        studiolibrary.config.set("syncThreadCount", args.threads)
+    elif hasattr(args, "threads"):
+        args.threads = studiolibrary.config.get("syncThreadCount") or 1
+
+    registerItems()
+
+    code = EXIT_SUCCESS
+    results = collections.OrderedDict()
+
+    for path in args.paths:
+        progress = Progress(prefix=path, quiet=args.quiet)
+
+        try:
+            library = openLibrary(path)
+            code_, result, lines = args.func(library, args, progress)
+        except Exception as error:
+            logger.debug("The %s command failed", args.command, exc_info=True)
+            code_, result, lines = EXIT_FAILURE, {"error": str(error)}, []
+            sys.stderr.write(u"{0}: {1}\n".format(path, error))
+        finally:
+            progress.finish()
+
+        code = max(code, code_)
+        results[path] = result
+
+        if not args.json:
+            for line in lines:
+                print(u"{0}: {1}".format(path, line))
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+
+    return code
+
+
+def testCommands():
+    """Test the exit codes of the commands on a generated library."""
+    import shutil
+    import tempfile
+
+    import studiolibrary.benchmarks
+
+    path = studiolibrary.normPath(tempfile.mkdtemp())
+
+    try:
+        paths = studiolibrary.benchmarks.generateLibrary(path, count=100, depth=2)
+
+        assert main(["sync", "--quiet", path]) == EXIT_SUCCESS
+        assert main(["verify", "--quiet", path]) == EXIT_SUCCESS
+        assert libraryStats(openLibrary(path))["items"] >= len(paths)
+
+        shutil.rmtree(paths[0])
+        assert main(["verify", "--quiet", path]) == EXIT_FAILURE
+        assert main(["verify", "--quiet", "--fix", path]) == EXIT_SUCCESS
+        assert paths[0] not in openLibrary(path).read()
+
+        assert main(["compact", "--quiet", path]) == EXIT_SUCCESS
+        assert main(["stats", "--quiet", path + "/missing"]) == EXIT_FAILURE
+    finally:
+        shutil.rmtree(path)
+
+
+def testsuite():
+    testCommands()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
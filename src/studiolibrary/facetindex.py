@@ -0,0 +1,254 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+
+__all__ = [
+    "FacetIndex",
+]
+
+
+class FacetIndex(object):
+    """
+    An index of the paths for each value of the item data fields.
+
+    Only fields with fewer distinct values than the number of items, such
+    as type, category and folder, are worth indexing. Since every filter
+    condition is false for empty values, only the paths with a value are
+    kept, and a filter is answered by checking each distinct value once
+    instead of each item.
+
+    Example:
+        index = FacetIndex()
+        index.addField("type", data.items())
+        print(index.counts("type"))
+        # {'.anim': 2, '.pose': 1}
+    """
+
+    # Fields with more distinct values than this are not indexed when the
+    # values are not shared by at least two items on average
+    MAX_UNIQUE_VALUES = 1000
+
+    def __init__(self):
+        self._fields = {}
+        self._values = {}
+        self._ignored = set()
+
+    def fields(self):
+        """
+        Get the fields that are indexed.
+
+        :rtype: list[str]
+        """
+        return list(self._fields.keys())
+
+    def hasField(self, field):
+        """
+        Check if the given field is indexed.
+
+        :type field: str
+        :rtype: bool
+        """
+        return field in self._fields
+
+    def isIgnored(self, field):
+        """
+        Check if the given field cannot be indexed.
+
+        :type field: str
+        :rtype: bool
+        """
+        return field in self._ignored
+
+    def addField(self, field, items):
+        """
+        Index the values of the given field for all the given items.
+
+        The field is ignored when a value cannot be hashed or when most
+        of the values are unique.
+
+        :type field: str
+        :type items: collections.Iterable[(str, dict)]
+        :rtype: bool
+        """
+        values = {}
+        paths = {}
+
+        try:
+            for path, itemData in items:
+                value = itemData.get(field)
+                if value:
+                    values.setdefault(value, set()).add(path)
+                    paths[path] = value
+        except TypeError:
+            self._ignored.add(field)
+            return False
+
+        if len(values) > self.MAX_UNIQUE_VALUES and len(values) * 2 > len(paths):
+            self._ignored.add(field)
+            return False
+
+        self._fields[field] = values
+
+        for path, value in paths.items():
+            self._values.setdefault(path, {})[field] = value
+
+        return True
+
+    def add(self, path, itemData):
+        """
+        Add or replace the values of the indexed fields for the given path.
+
+        :type path: str
+        :type itemData: dict
+        """
+        self.remove(path)
+
+        for field, values in list(self._fields.items()):
+            value = itemData.get(field)
+
+            if not value:
+                continue
+
+            try:
+                values.setdefault(value, set()).add(path)
+            except TypeError:
+                self.removeField(field)
+                self._ignored.add(field)
+                continue
+
+            self._values.setdefault(path, {})[field] = value
+
+    def update(self, data):
+        """
+        Add or replace the values for all the items in the given data.
+
+        :type data: dict
+        """
+        for path, itemData in data.items():
+            self.add(path, itemData)
+
+    def remove(self, path):
+        """
+        Remove the values of the given path.
+
+        :type path: str
+        """
+        for field, value in self._values.pop(path, {}).items():
+            values = self._fields.get(field)
+            if values is None:
+                continue
+
+            paths = values.get(value)
+            if paths is not None:
+                paths.discard(path)
+                if not paths:
+                    del values[value]
+
+    def removeField(self, field):
+        """
+        Remove the index of the given field.
+
+        :type field: str
+        """
+        if self._fields.pop(field, None) is not None:
+            for values in self._values.values():
+                values.pop(field, None)
+
+    def clear(self):
+        """Remove all the fields from the index."""
+        self._fields = {}
+        self._values = {}
+        self._ignored = set()
+
+    def values(self, field):
+        """
+        Get the paths for each value of the given field.
+
+        :type field: str
+        :rtype: dict
+        """
+        return self._fields.get(field, {})
+
+    def paths(self, field, match):
+        """
+        Get the paths with a value for the field that is matched by the function.
+
+        :type field: str
+        :type match: func
+        :rtype: set[str]
+        """
+        paths = set()
+
+        for value, paths_ in self.values(field).items():
+            if match(value):
+                paths.update(paths_)
+
+        return paths
+
+    def counts(self, field, paths=None):
+        """
+        Get the number of the given paths for each value of the field.
+
+        All the paths are counted when paths is None.
+
+        :type field: str
+        :type paths: set[str] or None
+        :rtype: dict
+        """
+        counts = {}
+
+        for value, paths_ in self.values(field).items():
+            if paths is None:
+                counts[value] = len(paths_)
+            elif len(paths_) < len(paths):
+                counts[value] = len(paths_.intersection(paths))
+            else:
+                counts[value] = len(paths.intersection(paths_))
+
+        return counts
+
+
+def testFacetIndex():
+    """Test that the index counts the values after adding and removing paths."""
+    data = {
+        "/library/Mario/jump.anim": {"type": ".anim", "tags": ["hero"]},
+        "/library/Mario/walk.anim": {"type": ".anim", "tags": ["hero"]},
+        "/library/Luigi/idle.pose": {"type": ".pose"},
+        "/library/Luigi/Luigi": {"type": ""},
+    }
+
+    index = FacetIndex()
+
+    assert index.addField("type", data.items())
+    assert not index.addField("tags", data.items())
+    assert index.isIgnored("tags")
+
+    assert index.counts("type") == {".anim": 2, ".pose": 1}
+    assert index.counts("type", set(["/library/Mario/jump.anim"])) == {".anim": 1, ".pose": 0}
+    assert index.paths("type", lambda value: value != ".anim") == set(["/library/Luigi/idle.pose"])
+
+    index.add("/library/Mario/jump.anim", {"type": ".pose"})
+    index.remove("/library/Luigi/idle.pose")
+    index.add("/library/Luigi/run.set", {"type": ".set"})
+
+    assert index.counts("type") == {".anim": 1, ".pose": 1, ".set": 1}
+
+    index.remove("/library/Mario/walk.anim")
+    assert ".anim" not in index.values("type")
+
+
+def testsuite():
+    testFacetIndex()
+
+
+if __name__ == "__main__":
+    testsuite()
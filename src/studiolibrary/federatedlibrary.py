@@ -0,0 +1,516 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import logging
+import functools
+import threading
+import collections
+
+from studiovendor.Qt import QtCore
+
+import studiolibrary
+
+
+__all__ = [
+    "FederatedLibrary",
+]
+
+
+logger = logging.getLogger(__name__)
+
+
+class FederatedSearch(object):
+    """Find the records of one library on a thread of its own."""
+
+    def __init__(self, library, queries, limit=None, sortBy=None, callback=None):
+        """
+        :type library: studiolibrary.Library
+        :type queries: list[dict]
+        :type limit: int or None
+        :type sortBy: list[str] or None
+        :type callback: func or None
+        """
+        self._library = library
+        self._queries = queries
+        self._limit = limit
+        self._sortBy = sortBy
+        self._callback = callback
+        self._results = None
+        self._error = None
+        self._skipped = False
+        self._notified = False
+        self._done = threading.Event()
+
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+
+    def start(self):
+        """Start finding the records on the thread."""
+        self._thread.start()
+
+    def run(self):
+        """The starting point for the thread."""
+        try:
+            self._results = self._library.findRecords(
+                self._queries, limit=self._limit, sortBy=self._sortBy
+            )
+        except Exception as error:
+            logger.warning(u'Cannot search the library "%s": %s', self._library.path(), error)
+            self._error = error
+        finally:
+            self._done.set()
+
+        if self._callback:
+            self._callback(self)
+
+    def key(self):
+        """
+        Get the queries, the limit and the sort fields of the search.
+
+        :rtype: tuple
+        """
+        return self._queries, self._limit, self._sortBy
+
+    def isDone(self):
+        """
+        Check if the search has finished.
+
+        :rtype: bool
+        """
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the search to finish for the given number of seconds.
+
+        :type timeout: float or None
+        :rtype: bool
+        """
+        return self._done.wait(timeout)
+
+    def results(self):
+        """
+        Get the records found or None if the search failed or has not finished.
+
+        :rtype: list[studiolibrary.ItemRecord] or None
+        """
+        return self._results
+
+    def error(self):
+        """
+        Get the error raised by the search.
+
+        :rtype: Exception or None
+        """
+        return self._error
+
+
+class FederatedLibrary(QtCore.QObject):
+    """
+    Search several libraries at once and merge the results.
+
+    Each library is searched on a thread of its own, so the search index,
+    the sort keys and the previous results of each library are reused.
+    The results of the libraries that answer within the timeout are
+    merged and sorted by the sortBy fields. The items with equal values
+    keep the order of the libraries.
+
+    A library that is still searching after the timeout, such as a
+    library on a network drive that is offline, is skipped and searched
+    again once it has finished. The libraryFinished signal is emitted
+    when a skipped library has finished.
+
+    The libraries must not be searched by anything else at the same time,
+    so fromSettings creates new libraries for the configured paths.
+
+    Example:
+        federatedLibrary = FederatedLibrary.fromSettings()
+        items = federatedLibrary.findItems([{'filters': [('name', 'contains', 'walk')]}])
+    """
+
+    libraryFinished = QtCore.Signal(str)
+
+    def __init__(self, libraries=None, *args):
+        """
+        :type libraries: list[(str, studiolibrary.Library)] or None
+        """
+        QtCore.QObject.__init__(self, *args)
+
+        self._libraries = collections.OrderedDict()
+        self._searches = {}
+        self._sortBy = []
+        self._timeout = None
+        self._sortKeys = studiolibrary.SortKeys()
+        self._pending = []
+        self._errors = {}
+        self._lock = threading.Lock()
+
+        for name, library in libraries or []:
+            self.addLibrary(name, library)
+
+    @classmethod
+    def fromSettings(cls):
+        """
+        Create a federated library for all the libraries in the user settings.
+
+        The default library is searched first.
+
+        :rtype: FederatedLibrary
+        """
+        settings = studiolibrary.readSettings()
+        default = studiolibrary.defaultLibrary()
+
+        names = sorted(settings, key=lambda name: (name != default, name))
+
+        libraries = []
+        for name in names:
+            path = settings[name].get("path")
+            if path:
+                libraries.append((name, studiolibrary.Library(path)))
+
+        return cls(libraries)
+
+    def addLibrary(self, name, library):
+        """
+        Add the given library to be searched with the given name.
+
+        :type name: str
+        :type library: studiolibrary.Library
+        """
+        self._libraries[name] = library
+        self._searches.pop(name, None)
+
+    def removeLibrary(self, name):
+        """
+        Remove the library with the given name.
+
+        :type name: str
+        """
+        self._libraries.pop(name, None)
+        self._searches.pop(name, None)
+
+    def library(self, name):
+        """
+        Get the library with the given name.
+
+        :type name: str
+        :rtype: studiolibrary.Library or None
+        """
+        return self._libraries.get(name)
+
+    def libraries(self):
+        """
+        Get the names and the libraries in the order they are merged.
+
+        :rtype: list[(str, studiolibrary.Library)]
+        """
+        return list(self._libraries.items())
+
+    def sortBy(self):
+        """
+        Get the fields that the merged results are sorted by.
+
+        :rtype: list[str]
+        """
+        return self._sortBy
+
+    def setSortBy(self, fields):
+        """
+        Set the fields that the merged results are sorted by.
+
+        :type fields: list[str]
+        """
+        self._sortBy = list(fields or [])
+
+    def timeout(self):
+        """
+        Get the seconds to wait for the libraries before merging the results.
+
+        :rtype: float
+        """
+        if self._timeout is None:
+            timeout = studiolibrary.config.get("federatedSearchTimeout")
+            return 2.0 if timeout is None else timeout
+
+        return self._timeout
+
+    def setTimeout(self, seconds):
+        """
+        Set the seconds to wait for the libraries before merging the results.
+
+        :type seconds: float or None
+        """
+        self._timeout = seconds
+
+    def pending(self):
+        """
+        Get the names of the libraries skipped by the last search.
+
+        :rtype: list[str]
+        """
+        return self._pending
+
+    def errors(self):
+        """
+        Get the errors raised by the libraries in the last search.
+
+        :rtype: dict
+        """
+        return self._errors
+
+    def isSearching(self):
+        """
+        Check if any of the libraries is still searching.
+
+        :rtype: bool
+        """
+        return any(not search.isDone() for search in self._searches.values())
+
+    def findItems(self, queries, limit=None, timeout=None):
+        """
+        Get the items from all the libraries that match the given queries.
+
+        :type queries: list[dict]
+        :type limit: int or None
+        :type timeout: float or None
+        :rtype: list[studiolibrary.LibraryItem]
+        """
+        items = []
+
+        for library, record in self.findRecords(queries, limit=limit, timeout=timeout):
+            items.extend(library.itemsFromRecords([record]))
+
+        return items
+
+    def findRecords(self, queries, limit=None, timeout=None):
+        """
+        Get the library and the record for the matches in all the libraries.
+
+        Only the records of the libraries that have finished within the
+        timeout are returned, and only the first records up to the limit.
+
+        :type queries: list[dict]
+        :type limit: int or None
+        :type timeout: float or None
+        :rtype: list[(studiolibrary.Library, studiolibrary.ItemRecord)]
+        """
+        timeout = self.timeout() if timeout is None else timeout
+        sortBy = self.sortBy()
+
+        key = (list(queries), limit, sortBy)
+
+        searches = collections.OrderedDict()
+        for name in self._libraries:
+            searches[name] = self.startSearch(name, *key)
+
+        end = time.time() + timeout
+
+        pending = []
+        errors = {}
+        results = []
+        paths = set()
+
+        for name, search in searches.items():
+            # A library that is busy with another search is not waited for
+            if search.key() != key or not search.wait(max(0, end - time.time())):
+                pending.append(name)
+                continue
+
+            if search.error() is not None:
+                errors[name] = search.error()
+                continue
+
+            library = self._libraries[name]
+
+            # The same path in another library is only shown once
+            for record in search.results():
+                if record.path() not in paths:
+                    paths.add(record.path())
+                    results.append((library, record))
+
+        if pending:
+            logger.debug("Skipped the libraries that are still searching: %s", pending)
+
+        with self._lock:
+            for name in pending:
+                search = searches[name]
+                search._skipped = True
+
+                # Emit the libraries that finished since they were skipped
+                if search.isDone() and not search._notified:
+                    search._notified = True
+                    QtCore.QTimer.singleShot(0, functools.partial(self.libraryFinished.emit, name))
+
+        self._pending = pending
+        self._errors = errors
+
+        return self.sorted(results, sortBy, limit)
+
+    def startSearch(self, name, queries, limit, sortBy):
+        """
+        Start searching the library with the given name.
+
+        A new search is only started when the previous search of the
+        library has finished, otherwise the previous search is returned.
+
+        :type name: str
+        :type queries: list[dict]
+        :type limit: int or None
+        :type sortBy: list[str]
+        :rtype: FederatedSearch
+        """
+        search = self._searches.get(name)
+
+        if search is not None and not search.isDone():
+            return search
+
+        search = FederatedSearch(
+            self._libraries[name],
+            list(queries),
+            limit=limit,
+            sortBy=sortBy,
+            callback=self._searchFinished,
+        )
+
+        self._searches[name] = search
+        search.start()
+
+        return search
+
+    def sorted(self, results, sortBy, limit=None):
+        """
+        Sort the given library and record pairs by the given fields.
+
+        The sort is stable, so the records with equal values keep the
+        order of the libraries and the order within each library.
+
+        :type results: list[(studiolibrary.Library, studiolibrary.ItemRecord)]
+        :type sortBy: list[str]
+        :type limit: int or None
+        :rtype: list[(studiolibrary.Library, studiolibrary.ItemRecord)]
+        """
+        records = [record for library, record in results]
+        positions = dict((record, i) for i, record in enumerate(records))
+
+        records = self._sortKeys.sorted(records, sortBy, limit=limit)
+
+        return [results[positions[record]] for record in records]
+
+    def _searchFinished(self, search):
+        """
+        Triggered on the search thread when a library has finished.
+
+        :type search: FederatedSearch
+        """
+        with self._lock:
+            if not search._skipped or search._notified:
+                return
+            search._notified = True
+
+        for name, search_ in list(self._searches.items()):
+            if search_ is search:
+                self.libraryFinished.emit(name)
+
+
+def testFederatedLibrary():
+    """Test that a slow library does not block the results of the others."""
+    import os
+    import shutil
+    import tempfile
+
+    class SlowLibrary(studiolibrary.Library):
+
+        def __init__(self, *args):
+            studiolibrary.Library.__init__(self, *args)
+            self.event = threading.Event()
+
+        def findRecords(self, *args, **kwargs):
+            self.event.wait(10)
+            return studiolibrary.Library.findRecords(self, *args, **kwargs)
+
+    class OfflineLibrary(studiolibrary.Library):
+
+        def findRecords(self, *args, **kwargs):
+            raise IOError("The library is offline")
+
+    paths = [studiolibrary.normPath(tempfile.mkdtemp()) for i in range(3)]
+
+    try:
+        app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+        module = "studiolibrary.libraryitem.LibraryItem"
+
+        libraries = [
+            ("props", studiolibrary.Library(paths[0])),
+            ("character", studiolibrary.Library(paths[1])),
+            ("mocap", SlowLibrary(paths[2])),
+            ("offline", OfflineLibrary(paths[2])),
+        ]
+
+        names = ["walk", "jump", "run", "idle"]
+
+        for i, (name, library) in enumerate(libraries[:3]):
+            data = {}
+            for j, name_ in enumerate(names):
+                itemPath = "{0}/{1}{2}.anim".format(library.path(), name_, i)
+                data[itemPath] = {"name": os.path.basename(itemPath), "__class__": module}
+            library.save(data)
+
+        federatedLibrary = FederatedLibrary(libraries)
+        federatedLibrary.setSortBy(["name:asc"])
+        federatedLibrary.setTimeout(0.2)
+
+        finished = []
+        federatedLibrary.libraryFinished.connect(finished.append)
+
+        queries = [{"filters": [("name", "contains", "j")]}]
+
+        items = federatedLibrary.findItems(queries)
+
+        assert [item.name() for item in items] == ["jump0.anim", "jump1.anim"]
+        assert federatedLibrary.pending() == ["mocap"]
+        assert list(federatedLibrary.errors()) == ["offline"]
+
+        # The library that was skipped is emitted once it has finished
+        libraries[2][1].event.set()
+
+        end = time.time() + 5
+        while not finished and time.time() < end:
+            app.processEvents()
+            time.sleep(0.01)
+
+        assert finished == ["mocap"]
+
+        # The results are merged in a stable order across the libraries
+        federatedLibrary.setSortBy(["name:dsc"])
+        records = federatedLibrary.findRecords([], limit=5)
+        names_ = [record.itemData()["name"] for library, record in records]
+
+        assert names_ == ["walk2.anim", "walk1.anim", "walk0.anim", "run2.anim", "run1.anim"]
+        assert not federatedLibrary.pending()
+
+        # Equal values keep the order of the libraries
+        federatedLibrary.setSortBy(["__class__:asc"])
+        records = federatedLibrary.findRecords(queries)
+        assert [library for library, record in records] == [libraries[0][1], libraries[1][1], libraries[2][1]]
+    finally:
+        for path in paths:
+            shutil.rmtree(path)
+
+
+def testsuite():
+    testFederatedLibrary()
+
+
+if __name__ == "__main__":
+    testsuite()
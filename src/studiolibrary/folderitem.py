@@ -88,6 +88,17 @@ class FolderItem(studiolibrary.LibraryItem):
         if os.path.isdir(path):
             return True
 
+    @classmethod
+    def matchEntry(cls, path, entry):
+        """
+        Return True if the given directory entry is a directory.
+
+        :type path: str
+        :type entry: os.DirEntry
+        :rtype: bool
+        """
+        return entry.is_dir()
+
     def itemData(self):
         """
         Reimplementing this method to set a trash folder icon.
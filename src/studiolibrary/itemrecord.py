@@ -0,0 +1,99 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+
+__all__ = [
+    "ItemRecord",
+]
+
+
+class ItemRecord(object):
+    """
+    A lightweight entry in the library used for searching, sorting and grouping.
+
+    The Qt item for the record is only created when it is needed for
+    display, and is kept so that it can be reused by the next search.
+
+    The record has the same itemData and path methods as the library item,
+    so it can be passed to Library.match, Library.sorted and
+    Library.groupItems.
+    """
+
+    __slots__ = ("_path", "_itemData", "_cls", "_item")
+
+    def __init__(self, path, itemData, cls, item=None):
+        """
+        :type path: str
+        :type itemData: dict
+        :type cls: studiolibrary.LibraryItem.__class__
+        :type item: studiolibrary.LibraryItem or None
+        """
+        self._path = path
+        self._itemData = itemData
+        self._cls = cls
+        self._item = item
+
+    def __repr__(self):
+        return "ItemRecord({0!r}, {1})".format(self._path, self._cls.__name__)
+
+    def path(self):
+        """
+        Get the path of the item.
+
+        :rtype: str
+        """
+        return self._path
+
+    def itemData(self):
+        """
+        Get the item data saved in the database.
+
+        :rtype: dict
+        """
+        return self._itemData
+
+    def itemClass(self):
+        """
+        Get the library item class used for creating the Qt item.
+
+        :rtype: studiolibrary.LibraryItem.__class__
+        """
+        return self._cls
+
+    def hasItem(self):
+        """
+        Check if the Qt item has been created.
+
+        :rtype: bool
+        """
+        return self._item is not None
+
+    def item(self, library=None, libraryWindow=None):
+        """
+        Get the Qt item for the record and create it the first time.
+
+        :type library: studiolibrary.Library or None
+        :type libraryWindow: studiolibrary.LibraryWindow or None
+        :rtype: studiolibrary.LibraryItem
+        """
+        item = self._item
+
+        if item is None:
+            item = self._cls(
+                self._path,
+                library=library,
+                libraryWindow=libraryWindow,
+            )
+            item.setItemData(self._itemData)
+            self._item = item
+
+        return item
@@ -12,9 +12,13 @@
 
 import os
 import copy
+import json
+import contextlib
+import hashlib
 import time
 import logging
 import collections
+from multiprocessing.pool import ThreadPool
 
 from studiovendor import six
 from studiovendor.Qt import QtCore
@@ -74,18 +78,43 @@ class Library(QtCore.QObject):
         },
     ]
 
+    # The order to check the filters of a query that needs all of them to
+    # match. The conditions that are cheap and reject most items go first.
+    FilterOrder = {
+        "is": 0,
+        "startswith": 1,
+        "contains": 2,
+        "not": 3,
+        "not_contains": 4,
+    }
+
     dataChanged = QtCore.Signal()
     searchStarted = QtCore.Signal()
     searchFinished = QtCore.Signal()
     searchTimeFinished = QtCore.Signal()
+    resultsFetched = QtCore.Signal(object)
+    pathsAdded = QtCore.Signal(object)
+    pathsRemoved = QtCore.Signal(object)
 
     def __init__(self, path=None, libraryWindow=None, *args):
         QtCore.QObject.__init__(self, *args)
 
         self._path = path
-        self._mtime = None
+        self._version = None
+        self._versionTime = 0
         self._data = {}
-        self._items = []
+        self._readPaths = set()
+        self._records = []
+        self._recordsData = None
+        self._recordsByPath = {}
+        self._searchIndex = None
+        self._facetIndex = None
+        self._sortKeys = studiolibrary.SortKeys()
+        self._searchCache = collections.OrderedDict()
+        self._searchCacheHits = 0
+        self._searchCacheMisses = 0
+        self._generation = 0
+        self._lastSearch = None
         self._fields = []
         self._sortBy = []
         self._groupBy = []
@@ -95,8 +124,20 @@ class Library(QtCore.QObject):
         self._groupedResults = {}
         self._searchTime = 0
         self._searchEnabled = True
+        self._searchExecutor = None
+        self._searchAsync = False
+        self._searchAsyncState = None
+        self._searchTask = None
+        self._searchPageSize = 0
         self._registeredItems = None
         self._libraryWindow = libraryWindow
+        self._storage = None
+        self._storageKey = None
+        self._databasePath = None
+        self._watcher = None
+        self._watchEnabled = False
+        self._folderWatcher = None
+        self._liveUpdateEnabled = False
 
         self.setPath(path)
         self.setDirty(True)
@@ -172,6 +213,76 @@ class Library(QtCore.QObject):
         """Check if search is enabled for the library."""
         return self._searchEnabled
 
+    def setSearchAsync(self, enabled):
+        """
+        Enable or disable searching on a worker thread.
+
+        :type enabled: bool
+        """
+        self._searchAsync = enabled
+
+        if not enabled and self._searchExecutor:
+            self._searchExecutor.cancel()
+
+    def isSearchAsync(self):
+        """
+        Check if the search runs on a worker thread.
+
+        :rtype: bool
+        """
+        return self._searchAsync
+
+    def setSearchPageSize(self, size):
+        """
+        Set the number of items to create for each page of the results.
+
+        A size of 0 creates the items for all the results.
+
+        :type size: int
+        """
+        self._searchPageSize = size or 0
+
+    def searchPageSize(self):
+        """
+        Get the number of items to create for each page of the results.
+
+        :rtype: int
+        """
+        return self._searchPageSize
+
+    def searchExecutor(self):
+        """
+        Get the executor for running the search on a worker thread.
+
+        :rtype: studiolibrary.SearchExecutor
+        """
+        if self._searchExecutor is None:
+            self._searchExecutor = studiolibrary.SearchExecutor(self)
+            self._searchExecutor.finished.connect(self._searchTaskFinished)
+            self._searchExecutor.failed.connect(self._searchTaskFailed)
+
+        return self._searchExecutor
+
+    def isSearching(self):
+        """
+        Check if a search is running on a worker thread.
+
+        :rtype: bool
+        """
+        return self._searchExecutor is not None and self._searchExecutor.isRunning()
+
+    def waitForSearch(self, msecs=-1):
+        """
+        Wait for the search on the worker thread and emit its results.
+
+        :type msecs: int
+        :rtype: bool
+        """
+        if not self._searchExecutor:
+            return True
+
+        return self._searchExecutor.wait(msecs)
+
     def recursiveDepth(self):
         """
         Return the recursive search depth.
@@ -211,773 +322,3766 @@ class Library(QtCore.QObject):
         :type path: str
         """
         self._path = path
+        self._storage = None
+        self._databasePath = None
+
+        if self._watcher:
+            self._watcher.clear()
+
+        if self._folderWatcher:
+            self._folderWatcher.clear()
 
     def databasePath(self):
         """
         Return the path to the database.
+
+        The path is only resolved from the config once for each path.
         
         :rtype: str 
         """
-        formatString = studiolibrary.config.get('databasePath')
-        return studiolibrary.formatPath(formatString, path=self.path())
+        if self._databasePath is None:
+            formatString = studiolibrary.config.get('databasePath')
+            self._databasePath = studiolibrary.formatPath(formatString, path=self.path())
 
-    def distinct(self, field, queries=None, sortBy="name"):
+        return self._databasePath
+
+    def setWatchEnabled(self, enabled):
         """
-        Get all the values for the given field.
-        
-        :type field: str
-        :type queries None or list[dict]
-        :type sortBy: str
-        :rtype: list 
+        Enable or disable watching the database for changes on disc.
+
+        When the database is watched, reading and searching do not check
+        the version of the database until it has changed. The changes are
+        only seen while the Qt event loop is running.
+
+        The watcher is not notified of the changes saved by other machines
+        on some network file systems, so the version is still checked every
+        "databaseWatchInterval" seconds.
+
+        :type enabled: bool
         """
-        results = {}
-        queries = queries or []
-        queries.extend(self._globalQueries.values())
+        self._watchEnabled = enabled
 
-        items = self.createItems()
-        for item in items:
-            value = item.itemData().get(field)
-            if value:
-                results.setdefault(value, {'count': 0, 'name': value})
-                match = self.match(item.itemData(), queries)
-                if match:
-                    results[value]['count'] += 1
+        if not enabled and self._watcher:
+            self._watcher.clear()
 
-        def sortKey(facet):
-            return facet.get(sortBy)
+    def isWatchEnabled(self):
+        """
+        Check if the database should be watched for changes on disc.
 
-        return sorted(results.values(), key=sortKey)
+        :rtype: bool
+        """
+        return self._watchEnabled
 
-    def mtime(self):
+    def isWatching(self):
         """
-        Return when the database was last modified.
+        Check if the changes to the database are being watched.
 
-        :rtype: float or None
+        The database can only be watched once its folder exists.
+
+        :rtype: bool
         """
-        path = self.databasePath()
-        mtime = None
+        return self._watcher is not None and self._watcher.isWatching()
+
+    def isVersionWatched(self):
+        """
+        Check if the watcher can be trusted instead of checking the version.
+
+        :rtype: bool
+        """
+        if not self.isWatching():
+            return False
 
-        if os.path.exists(path):
-            mtime = os.path.getmtime(path)
+        interval = studiolibrary.config.get("databaseWatchInterval")
 
-        return mtime
+        return not interval or time.time() - self._versionTime < interval
 
-    def setDirty(self, value):
+    def watchDatabase(self):
+        """Watch the files of the database if they are not watched yet."""
+        if self._watcher is None:
+            self._watcher = studiolibrary.DatabaseWatcher(self)
+            self._watcher.changed.connect(self._databaseChanged)
+
+        # The files change when the shards of the database are loaded
+        files = self.storage().files()
+        if not self._watcher.isWatching() or files != self._watcher.paths():
+            self._watcher.setPaths(files)
+
+    def setLiveUpdateEnabled(self, enabled):
         """
-        Update the model object with the current database timestamp.
+        Enable or disable updating the items when they change on disc.
 
-        :type: bool
+        The folders in the library are watched for created, removed and
+        renamed items, and only the changed items are synced. The changes
+        are emitted with the pathsAdded and pathsRemoved signals.
+
+        :type enabled: bool
         """
-        if value:
-            self._mtime = None
-        else:
-            self._mtime = self.mtime()
+        self._liveUpdateEnabled = enabled
 
-    def isDirty(self):
+        # The folders are watched when the records are created for a new path
+        if enabled and self.path():
+            self.folderWatcher().setPaths(self.watchFolders())
+        elif self._folderWatcher:
+            self._folderWatcher.clear()
+
+    def isLiveUpdateEnabled(self):
         """
-        Return True if the database has changed on disc.
+        Check if the items are updated when they change on disc.
 
         :rtype: bool
         """
-        return not self._items or self._mtime != self.mtime()
+        return self._liveUpdateEnabled
 
-    def read(self):
+    def folderWatcher(self):
         """
-        Read the database from disc and return a dict object.
+        Get the watcher for the folders in the library.
 
-        :rtype: dict
+        :rtype: studiolibrary.FolderWatcher
         """
-        if self.path():
-            if self.isDirty():
-                self._data = studiolibrary.readJson(self.databasePath())
-                self.setDirty(False)
-        else:
-            logger.info('No path set for reading the data from disc.')
+        if self._folderWatcher is None:
+            self._folderWatcher = studiolibrary.FolderWatcher(self)
+            self._folderWatcher.foldersChanged.connect(self.syncFolders)
 
-        return self._data
+        return self._folderWatcher
 
-    def save(self, data):
+    def watchFolders(self):
         """
-        Write the given dict object to the database on disc.
+        Get the root and the folders that can contain items.
 
-        :type data: dict
-        :rtype: None
+        :rtype: list[str]
         """
-        if self.path():
-            studiolibrary.saveJson(self.databasePath(), data)
+        folders = [studiolibrary.normPath(self.path())]
+
+        for record in self.records():
+            if record.itemClass().ENABLE_NESTED_ITEMS:
+                folders.append(record.path())
+
+        return folders
+
+    def _databaseChanged(self):
+        """Triggered when the files of the database have changed on disc."""
+        # Ignore the changes written by this library since the last read
+        if self._version is not None and self._version != self.version():
+            logger.debug("The database has changed on disc")
             self.setDirty(True)
-        else:
-            logger.info('No path set for saving the data to disc.')
 
-    def clear(self):
-        """Clear all the item data."""
-        self._items = []
-        self._results = []
-        self._groupedResults = {}
-        self._registeredItems = None
-        self.dataChanged.emit()
+    def storage(self):
+        """
+        Get the storage backend used for reading and writing the database.
 
-    def registeredItems(self):
+        The backend is resolved from the extension of the database path.
+        The database is split into shards when the shard depth is set.
+
+        :rtype: studiolibrary.storage.Storage
         """
-        Get registered items for the library.
+        path = self.databasePath()
+        depth = self.shardDepth()
 
-        :rtype: list[LibraryItem.__class__]
+        if not self._storage or self._storageKey != (path, depth):
+            if depth:
+                self._storage = studiolibrary.storage.createShardedStorage(
+                    path, self.path(), depth
+                )
+            else:
+                self._storage = studiolibrary.storage.createStorage(path, self.path())
+
+            self._storageKey = (path, depth)
+
+        return self._storage
+
+    def shardDepth(self):
         """
-        return studiolibrary.registeredItems()
+        Get the number of folders below the root to split the database by.
 
-    def isValidPath(self, path):
+        The database is not split when the depth is zero.
+
+        :rtype: int
         """
-        Check if the given item path should be ignored.
+        return studiolibrary.config.get("databaseShardDepth") or 0
+
+    def isSharded(self):
+        """
+        Check if the database is split into shards that are loaded on demand.
 
-        :type path: str
         :rtype: bool
         """
-        for ignore in studiolibrary.config.get('ignorePaths', []):
-            if ignore in path:
-                return False
-        return True
+        return self.shardDepth() > 0
 
-    def walker(self, path):
+    def loadShards(self, folders=None):
         """
-        Walk the given root path for valid items and return the item data.
+        Load the shards of the database with the items in the given folders.
 
-        :type path: str
+        All the shards are loaded when folders is None. The data is read
+        again the next time it is needed when any new shard was loaded.
 
-        :rtype: collections.Iterable[dict]
+        :type folders: list[str] or None
+        :rtype: bool
         """
-        path = studiolibrary.normPath(path)
-        maxDepth = self.recursiveDepth()
-        startDepth = path.count(os.path.sep)
+        if not self.path() or not self.isSharded():
+            return False
 
-        for root, dirs, files in os.walk(path, followlinks=True):
+        storage = self.storage()
 
-            files.extend(dirs)
+        keys = None
+        if folders is not None:
+            keys = storage.shardsForFolders(folders)
 
-            for filename in files:
+        if storage.load(keys):
+            self.setDirty(True)
+            return True
 
-                # Normalise the path for consistent matching
-                path = studiolibrary.normPath(os.path.join(root, filename))
+        return False
 
-                # Ignore any paths that have been specified in the config
-                if not self.isValidPath(path):
-                    continue
+    @staticmethod
+    def queryFolders(queries):
+        """
+        Get the folders that contain all the items matched by the given queries.
 
-                # Match the path with a registered item
-                item = self.itemFromPath(path)
+        Only the folder filters and the filters for the folder items are
+        used. None is returned when the items can be in any folder.
+
+        Example:
+            queries = [{'operator': 'or', 'filters': [
+                ('folder', 'startswith', '/library/Mario/'),
+                ('folder', 'is', '/library/Mario'),
+            ]}]
+            print(Library.queryFolders(queries))
+            # ['/library/Mario/', '/library/Mario']
+
+        :type queries: list[dict]
+        :rtype: list[str] or None
+        """
+        folders = None
 
-                remove = False
-                if item:
+        def restricts(filter_):
+            key, cond, value = filter_
+            if key == "folder":
+                return cond in ("is", "startswith")
+            return key == "type" and cond == "is" and value == "Folder"
 
-                    # Yield the item data that matches the current path
-                    yield item.createItemData()
+        for query in queries:
+            filters = query.get("filters", [])
 
-                    # Stop walking if the item doesn't support nested items
-                    if not item.ENABLE_NESTED_ITEMS:
-                        remove = True
+            if query.get("operator", "and") == "or":
+                if not filters or not all(restricts(f) for f in filters):
+                    continue
+            else:
+                # Any of the filters must match when they are all required
+                filters = [f for f in filters if restricts(f)][:1]
+                if not filters:
+                    continue
 
-                if remove and filename in dirs:
-                    dirs.remove(filename)
+            folders_ = [value for key, cond, value in filters if key == "folder"]
 
-            if maxDepth == 1:
-                break
+            if folders is None or len(folders_) < len(folders):
+                folders = folders_
 
-            # Stop walking the directory if the maximum depth has been reached
-            currentDepth = root.count(os.path.sep)
-            if (currentDepth - startDepth) >= maxDepth:
-                del dirs[:]
+        return folders
 
-    def sync(self, progressCallback=None):
+    def distinct(self, field, queries=None, sortBy="name"):
         """
-        Sync the file system with the database.
+        Get all the values for the given field.
+        
+        :type field: str
+        :type queries None or list[dict]
+        :type sortBy: str
+        :rtype: list 
+        """
+        return self.facets([field], queries=queries, sortBy=sortBy)[field]
 
-        :type progressCallback: None or func
+    def facets(self, fields, queries=None, sortBy="name"):
         """
-        if not self.path():
-            logger.info('No path set for syncing data')
-            return
+        Get the values of the given fields and the number of items matched.
 
-        if progressCallback:
-            progressCallback("Syncing")
+        Every value of the fields is returned, with the number of items
+        that have the value and match the given and global queries.
 
-        new = {}
-        old = self.read()
-        items = list(self.walker(self.path()))
-        count = len(items)
+        Example:
+            print(library.facets(["type"], queries))
+            # {'type': [{'count': 10, 'name': '.anim'}, {'count': 0, 'name': '.pose'}]}
 
-        for i, item in enumerate(items):
-            percent = (float(i+1)/float(count))
-            if progressCallback:
-                percent *= 100
-                label = "{0:.0f}%".format(percent)
-                progressCallback(label, percent)
+        :type fields: list[str]
+        :type queries: None or list[dict]
+        :type sortBy: str
+        :rtype: dict
+        """
+        queries = list(queries or [])
+        queries.extend(self._globalQueries.values())
 
-            path = item.get("path")
-            new[path] = old.get(path, {})
-            new[path].update(item)
+        self.loadShards(self.queryFolders(queries))
 
-        if progressCallback:
-            progressCallback("Post Callbacks")
+        paths = self.findPaths(queries)
+        facetIndex = self.facetIndex(fields)
 
-        self.postSync(new)
+        results = {}
 
-        if progressCallback:
-            progressCallback("Saving Cache")
+        for field in fields:
+            if facetIndex.hasField(field):
+                counts = facetIndex.counts(field, paths)
+            else:
+                counts = self.countValues(field, paths)
 
-        self.save(new)
+            facets = [{'count': count, 'name': value} for value, count in counts.items()]
 
-        self.dataChanged.emit()
+            def sortKey(facet):
+                return facet.get(sortBy)
 
-    def postSync(self, data):
+            results[field] = sorted(facets, key=sortKey)
+
+        return results
+
+    def countValues(self, field, paths=None):
         """
-        Use this function to execute code on the data after sync, but before save and dataChanged.emit
+        Count the values of a field that cannot be indexed for the given paths.
 
-        :type data: dict
-        :rtype: None
+        :type field: str
+        :type paths: set[str] or None
+        :rtype: dict
         """
-        pass
+        counts = {}
 
-    def createItems(self):
+        for record in self.records():
+            value = record.itemData().get(field)
+            if value:
+                counts.setdefault(value, 0)
+                if paths is None or record.path() in paths:
+                    counts[value] += 1
+
+        return counts
+
+    def findPaths(self, queries):
         """
-        Create all the items for the model.
+        Get the paths that match the given queries using the indexes.
 
-        :rtype: list[studiolibrary.LibraryItem] 
+        Only the filters that cannot be answered by the search and facet
+        indexes are matched with the item data of the found paths. None is
+        returned when every path matches.
+
+        :type queries: list[dict]
+        :rtype: set[str] or None
         """
-        # Check if the cache has changed since the last read call
-        if self.isDirty():
+        paths, queries = self.searchText(queries, facets=True)
 
-            logger.debug("Creating items")
+        if not queries:
+            return paths
 
-            self._items = []
+        match = self.compileQueries(queries)
 
-            data = self.read()
+        if paths is None:
+            records = self.records()
+        else:
+            recordsByPath = self._recordsByPath
+            records = [recordsByPath[path] for path in paths if path in recordsByPath]
 
-            modules = []
-            for itemData in data.values():
-                if '__class__' in itemData:
-                    modules.append(itemData.get("__class__"))
-            modules = set(modules)
+        return set(r.path() for r in records if match(r.itemData()))
 
-            classes = {}
-            for module in modules:
-                classes[module] = studiolibrary.resolveModule(module)
+    def mtime(self):
+        """
+        Return when the database was last modified.
 
-            for path in data.keys():
-                module = data[path].get("__class__")
-                cls = classes.get(module)
-                if cls:
-                    item = cls(path, library=self, libraryWindow=self._libraryWindow)
-                    item.setItemData(data[path])
-                    self._items.append(item)
-                else:
-                    # This is to support the older database data before v2.6.
-                    # Will remove in a later version.
-                    item = self.itemFromPath(path, library=self, libraryWindow=self._libraryWindow)
-                    if item:
-                        item.setItemData(data[path])
-                        self._items.append(item)
+        :rtype: float or None
+        """
+        return self.storage().mtime()
 
-        return self._items
+    def version(self):
+        """
+        Return a value that changes whenever the database is written.
 
-    def itemFromPath(self, path, **kwargs):
+        :rtype: list
         """
-        Return a new item instance for the given path.
+        return self.storage().version()
 
-        :type path: str
-        :rtype: studiolibrary.LibraryItem or None
+    def setDirty(self, value):
         """
-        path = studiolibrary.normPath(path)
+        Update the model object with the current database version.
 
-        for cls in self.registeredItems():
-            if cls.match(path):
-                return cls(path, **kwargs)
+        :type: bool
+        """
+        if value:
+            self._version = None
+        else:
+            self._version = self.version()
+            self._versionTime = time.time()
 
-    def itemsFromPaths(self, paths, **kwargs):
+    def isDirty(self):
         """
-        Return new item instances for the given paths.
+        Return True if the database has changed on disc.
 
-        :type paths: list[str]:
-        :rtype: collections.Iterable[studiolibrary.LibraryItem]
+        :rtype: bool
         """
-        for path in paths:
-            item = self.itemFromPath(path, **kwargs)
-            if item:
-                yield item
+        if self.isVersionWatched():
+            return not self._records or self._version is None
 
-    def itemsFromUrls(self, urls, **kwargs):
+        return not self._records or self._version != self.version()
+
+    def read(self):
         """
-        Return new item instances for the given QUrl objects.
+        Read the database from disc and return a dict object.
 
-        :type urls: list[QtGui.QUrl]
-        :rtype: list[studiolibrary.LibraryItem]
+        :rtype: dict
         """
-        items = []
-        for path in studiolibrary.pathsFromUrls(urls):
+        if self.path():
+            if self._watchEnabled:
+                self.watchDatabase()
 
-            item = self.itemFromPath(path, **kwargs)
+            # The version is only checked when the database is not watched
+            if self._version is None or not self.isVersionWatched():
+                version = self.version()
+                self._versionTime = time.time()
 
-            if item:
-                data = item.createItemData()
-                item.setItemData(data)
+                # Get the version before reading so that any changes
+                # written while reading are read again next time
+                if version != self._version:
+                    with studiolibrary.metrics.timer("library.read"):
+                        self._data = self.storage().read()
 
-                items.append(item)
+                    studiolibrary.metrics.increment("library.read.items", len(self._data))
+
+                    self._readPaths = set(self._data.keys())
+                    self._version = version
+        else:
+            logger.info('No path set for reading the data from disc.')
+
+        return self._data
+
+    def save(self, data):
+        """
+        Write the given dict object to the database on disc.
+
+        :type data: dict
+        :rtype: None
+        """
+        if self.path():
+            with self.storage().lock():
+
+                # Merge with the changes saved by other users since reading.
+                # The modified time cannot be trusted to detect them since
+                # some file systems only store it to the nearest second.
+                data = self.merge(data)
+                self.storage().save(data)
+
+            self.setDirty(True)
+        else:
+            logger.info('No path set for saving the data to disc.')
+
+    def compact(self):
+        """
+        Remove the space used by old changes from the database on disc.
+
+        :rtype: None
+        """
+        if self.path():
+            self.storage().compact()
+            self.setDirty(True)
+        else:
+            logger.info('No path set for compacting the database.')
+
+    def merge(self, data):
+        """
+        Merge the given data with the current data on disc.
+
+        The items removed from the data since the last read are removed,
+        the other items are updated and any items added by other users
+        are kept.
+
+        :type data: dict
+        :rtype: dict
+        """
+        data_ = self.storage().read()
+
+        for path in self._readPaths - set(data.keys()):
+            data_.pop(path, None)
+
+        for path, itemData in data.items():
+            data_.setdefault(path, {})
+            data_[path].update(itemData)
+
+        return data_
+
+    def update(self, data):
+        """
+        Insert or update the given item data in the database on disc.
+
+        Only the given paths are written when the storage supports it.
+
+        :type data: dict
+        :rtype: None
+        """
+        if self.path():
+            with self.storage().lock():
+                current = self.isCurrent()
+                self.storage().update(data)
+
+                # Update the records in place unless other users have
+                # changed the database since it was read
+                if current:
+                    self.updateRecords(data)
+                    self.setDirty(False)
+                else:
+                    self.setDirty(True)
+        else:
+            logger.info('No path set for saving the data to disc.')
+
+    def isCurrent(self):
+        """
+        Check if the data in memory is the same as the database on disc.
+
+        The version of the storage is used instead of the modified time,
+        which some file systems only store to the nearest second.
+
+        :rtype: bool
+        """
+        return self._version is not None and self._version == self.version()
+
+    def updateRecords(self, data):
+        """
+        Update the item data, records and search index for the given data.
+
+        :type data: dict
+        """
+        classes = {}
+        replaced = {}
+        self._generation += 1
+        self._sortKeys.clear()
+
+        for path, itemData in data.items():
+            if path not in self._data:
+                self._readPaths.add(path)
+
+            # The item data and the records are replaced instead of changed,
+            # since a search task may be reading them on a worker thread
+            itemData_ = dict(self._data.get(path) or {})
+            itemData_.update(itemData)
+            self._data[path] = itemData_
+
+            old = self._recordsByPath.get(path)
+            item = old.item() if old is not None and old.hasItem() else None
+
+            record = self.createRecord(path, itemData_, classes, item)
+
+            if old is not None:
+                replaced[path] = record
+            elif record:
+                self._records.append(record)
+
+            if record:
+                self._recordsByPath[path] = record
+            else:
+                self._recordsByPath.pop(path, None)
+
+            if self._searchIndex is not None:
+                if record:
+                    self._searchIndex.add(path, itemData_)
+                else:
+                    self._searchIndex.remove(path)
+
+            if self._facetIndex is not None:
+                if record:
+                    self._facetIndex.add(path, itemData_)
+                else:
+                    self._facetIndex.remove(path)
+
+            self._fields = list(set(self._fields) | set(itemData_.keys()))
+
+        if replaced:
+            records = []
+            for record in self._records:
+                record = replaced.get(record.path(), record)
+                if record:
+                    records.append(record)
+            self._records = records
+
+    def removeRecords(self, paths):
+        """
+        Remove the item data, records and search index for the given paths.
+
+        :type paths: list[str]
+        """
+        paths = set(paths)
+        self._generation += 1
+        self._sortKeys.clear()
+
+        for path in paths:
+            self._data.pop(path, None)
+            self._readPaths.discard(path)
+            self._recordsByPath.pop(path, None)
+
+            if self._searchIndex is not None:
+                self._searchIndex.remove(path)
+
+            if self._facetIndex is not None:
+                self._facetIndex.remove(path)
+
+        self._records = [r for r in self._records if r.path() not in paths]
+
+    def clear(self):
+        """Clear all the item data."""
+        self._records = []
+        self._recordsData = None
+        self._recordsByPath = {}
+        self._searchIndex = None
+        self._facetIndex = None
+        self._sortKeys.clear()
+        self._generation += 1
+        self._lastSearch = None
+        self._searchTask = None
+        self._results = []
+        self._groupedResults = {}
+        self._registeredItems = None
+        self.dataChanged.emit()
+
+    def registeredItems(self):
+        """
+        Get registered items for the library.
+
+        :rtype: list[LibraryItem.__class__]
+        """
+        return studiolibrary.registeredItems()
+
+    def isValidPath(self, path):
+        """
+        Check if the given item path should be ignored.
+
+        :type path: str
+        :rtype: bool
+        """
+        for ignore in studiolibrary.config.get('ignorePaths', []):
+            if ignore in path:
+                return False
+        return True
+
+    def manifestPath(self):
+        """
+        Get the path to the sync manifest stored next to the database.
+
+        :rtype: str
+        """
+        return os.path.join(os.path.dirname(self.databasePath()), "manifest.json")
+
+    def manifest(self):
+        """
+        Get the manifest of directories visited by the last sync.
+
+        :rtype: studiolibrary.manifest.Manifest
+        """
+        return studiolibrary.manifest.Manifest(
+            self.manifestPath(),
+            self.path(),
+            key=self.manifestKey(),
+        )
+
+    def manifestKey(self):
+        """
+        Get a key for the configuration that changes which items are found.
+
+        The manifest is not used when the registered items, the ignored
+        paths or the metadata path have changed since the last sync.
+
+        :rtype: str
+        """
+        config = {
+            "items": [cls.__module__ + "." + cls.__name__ for cls in self.registeredItems()],
+            "ignorePaths": studiolibrary.config.get("ignorePaths", []),
+            "metadataPath": studiolibrary.config.get("metadataPath"),
+            "recursiveDepth": self.recursiveDepth(),
+        }
+
+        text = json.dumps(config, sort_keys=True)
+        return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+    def metadataPath(self, path):
+        """
+        Get the metadata path for the given item path.
+
+        :type path: str
+        :rtype: str
+        """
+        formatString = studiolibrary.config.get("metadataPath")
+
+        # Avoid resolving the environment variables for the default format
+        if formatString.count("{") == 1 and "{path}" in formatString:
+            return formatString.replace("{path}", path)
+
+        return studiolibrary.formatPath(formatString, path)
+
+    def itemStamp(self, path):
+        """
+        Get the modified times of the given item path and its metadata.
+
+        Editing the metadata of an item doesn't change the modified time
+        of the directory the item is in, so the stamp is compared instead.
+
+        :type path: str
+        :rtype: list[float or None]
+        """
+        stamp = []
+
+        for path_ in (path, self.metadataPath(path)):
+            try:
+                stamp.append(os.path.getmtime(path_))
+            except OSError:
+                stamp.append(None)
+
+        return stamp
+
+    def syncThreadCount(self):
+        """
+        Get the number of threads used for walking the library when syncing.
+
+        :rtype: int
+        """
+        return studiolibrary.config.get('syncThreadCount') or 1
+
+    def listDirectory(self, root, manifest=None, cache=None, ancestors=frozenset()):
+        """
+        List the items and the sub directories to walk for the given directory.
+
+        The returned items are either the cached item data or a new item
+        instance that still needs to create its item data.
+
+        Cached item data is only returned when the stamp of the item is
+        the same as the stamp saved in the manifest.
+
+        The ancestors hold the device and inode of the parent directories
+        so that symlinks pointing back to a parent are not walked again.
+        The sub directories are returned with their own ancestors.
+
+        :type root: str
+        :type manifest: studiolibrary.manifest.Manifest or None
+        :type cache: dict or None
+        :type ancestors: frozenset
+
+        :rtype: (list[dict or studiolibrary.LibraryItem], list[(str, frozenset)])
+        """
+        cache = cache or {}
+        items, names, subdirs = [], [], []
+        stamps = {}
+
+        try:
+            stat = os.stat(root)
+        except OSError:
+            return items, subdirs
+
+        # Stop walking symlinks that point back to a parent directory
+        key = (stat.st_dev, stat.st_ino)
+        if key in ancestors:
+            return items, subdirs
+
+        ancestors = ancestors | frozenset([key])
+
+        mtime = stat.st_mtime
+
+        # Support drive roots which already end with a slash. eg: "C:/"
+        prefix = root if root.endswith("/") else root + "/"
+
+        cached = None
+        if manifest:
+            cached = manifest.get(root, mtime)
+
+        if cached:
+            names = cached.get("items", [])
+            subdirs = cached.get("dirs", [])
+            stamps_ = cached.get("stamps", {})
+            for name in names:
+                path = prefix + name
+                stamp = self.itemStamp(path)
+                stamps[name] = stamp
+
+                # Create the item data again when the item or the metadata has changed
+                if stamp == stamps_.get(name) and "__class__" in cache.get(path, {}):
+                    items.append(cache[path])
+                else:
+                    item = self.itemFromPath(path)
+                    if item:
+                        items.append(item)
+        else:
+            entries = studiolibrary.scanDir(root)
+            entries.sort(key=lambda entry: entry.name)
+
+            for entry in entries:
+                name = entry.name
+                path = prefix + name
+
+                # Ignore any paths that have been specified in the config
+                if not self.isValidPath(path):
+                    continue
+
+                # Match the path with a registered item
+                cls = self.itemClassFromPath(path, entry)
+                isdir = entry.is_dir()
+
+                if cls:
+                    names.append(name)
+                    if manifest:
+                        stamps[name] = self.itemStamp(path)
+                    items.append(cls(path))
+
+                    # Stop walking if the item doesn't support nested items
+                    if not cls.ENABLE_NESTED_ITEMS:
+                        isdir = False
+
+                if isdir:
+                    subdirs.append(name)
+
+        if manifest:
+            manifest.set(root, mtime, names, subdirs, stamps)
+
+        return items, [(prefix + name, ancestors) for name in subdirs]
+
+    def walker(self, path, manifest=None, cache=None, threads=1):
+        """
+        Walk the given root path for valid items and return the item data.
+
+        When a manifest is given, the directories that have not been
+        modified since the last sync are not listed again and the item
+        data for their items is taken from the given cache.
+
+        When threads is greater than one, each depth level of directories
+        is listed and the item data is created on a pool of threads.
+        The item data is still returned in the same order.
+
+        :type path: str
+        :type manifest: studiolibrary.manifest.Manifest or None
+        :type cache: dict or None
+        :type threads: int
+
+        :rtype: collections.Iterable[dict]
+        """
+        pool = None
+        if threads > 1:
+            pool = ThreadPool(threads)
+
+        def createItemData(item):
+            if isinstance(item, dict):
+                return item
+            return item.createItemData()
+
+        def listDirectory(args):
+            root, ancestors = args
+            return self.listDirectory(
+                root,
+                manifest=manifest,
+                cache=cache,
+                ancestors=ancestors,
+            )
+
+        try:
+            depth = 0
+            maxDepth = self.recursiveDepth()
+            dirs = [(studiolibrary.normPath(path), frozenset())]
+
+            while dirs:
+                if pool:
+                    results = pool.map(listDirectory, dirs)
+                else:
+                    results = [listDirectory(root) for root in dirs]
+
+                items = []
+                dirs = []
+                for items_, dirs_ in results:
+                    items.extend(items_)
+                    dirs.extend(dirs_)
+
+                if pool:
+                    for itemData in pool.imap(createItemData, items, 8):
+                        yield itemData
+                else:
+                    for item in items:
+                        yield createItemData(item)
+
+                # Stop walking when the maximum depth has been reached
+                if maxDepth == 1 or depth >= maxDepth:
+                    break
+
+                depth += 1
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+    @studiolibrary.metrics.timed("library.sync")
+    def sync(self, progressCallback=None, force=False):
+        """
+        Sync the file system with the database.
+
+        Only the directories that have changed since the last sync are
+        listed again unless force is True.
+
+        :type progressCallback: None or func
+        :type force: bool
+        """
+        if not self.path():
+            logger.info('No path set for syncing data')
+            return
+
+        if progressCallback:
+            progressCallback("Syncing")
+
+        new = {}
+
+        self.loadShards()
+        old = self.read()
+
+        manifest = self.manifest()
+        if force:
+            manifest.clear()
+
+        items = []
+        walker = self.walker(
+            self.path(),
+            manifest=manifest,
+            cache=old,
+            threads=self.syncThreadCount(),
+        )
+
+        for itemData in walker:
+            items.append(itemData)
+            if progressCallback and len(items) % 100 == 0:
+                progressCallback("Found {0} items".format(len(items)))
+
+        count = len(items)
+
+        for i, item in enumerate(items):
+            percent = (float(i+1)/float(count))
+            if progressCallback:
+                percent *= 100
+                label = "{0:.0f}%".format(percent)
+                progressCallback(label, percent)
+
+            path = item.get("path")
+            new[path] = old.get(path, {})
+            new[path].update(item)
+
+        if progressCallback:
+            progressCallback("Post Callbacks")
+
+        self.postSync(new)
+
+        if progressCallback:
+            progressCallback("Saving Cache")
+
+        self.save(new)
+        manifest.save()
+
+        self.dataChanged.emit()
+
+    def postSync(self, data):
+        """
+        Use this function to execute code on the data after sync, but before save and dataChanged.emit
+
+        :type data: dict
+        :rtype: None
+        """
+        pass
+
+    def records(self):
+        """
+        Get the records for all the items in the database.
+
+        The records are created again when the database has changed. The
+        Qt items that have already been created are reused for the records
+        with the same path and item class.
+
+        :rtype: list[studiolibrary.ItemRecord]
+        """
+        data = self.read()
+
+        # Check if the data has been read again since the last call
+        if data is not self._recordsData:
+
+            logger.debug("Creating records")
+
+            t = time.time()
+
+            items = {}
+            for record in self._records:
+                if record.hasItem():
+                    items[record.path()] = record.item()
+
+            classes = {}
+            records = []
+
+            for path in data.keys():
+                record = self.createRecord(path, data[path], classes, items.get(path))
+                if record:
+                    records.append(record)
+
+            self._records = records
+            self._recordsData = data
+            self._generation += 1
+            self._sortKeys.clear()
+            self._recordsByPath = dict((r.path(), r) for r in records)
+            self._searchIndex = None
+            self._facetIndex = None
+            self._fields = self.fieldsFromData(data)
+
+            studiolibrary.metrics.record("library.createRecords", time.time() - t, t)
+
+            if self._liveUpdateEnabled:
+                self.folderWatcher().addPaths(self.watchFolders())
+
+        return self._records
+
+    def itemClassFromData(self, path, itemData, classes=None):
+        """
+        Get the item class saved in the given item data.
+
+        :type path: str
+        :type itemData: dict
+        :type classes: dict or None
+        :rtype: studiolibrary.LibraryItem.__class__ or None
+        """
+        classes = {} if classes is None else classes
+        module = itemData.get("__class__")
+
+        if module:
+            if module not in classes:
+                classes[module] = studiolibrary.resolveModule(module)
+            return classes[module]
+
+        # This is to support the older database data before v2.6.
+        # Will remove in a later version.
+        return self.itemClassFromPath(studiolibrary.normPath(path))
+
+    def createRecord(self, path, itemData, classes=None, item=None):
+        """
+        Create a record for the given item data.
+
+        The given Qt item is reused if it has the same item class.
+
+        :type path: str
+        :type itemData: dict
+        :type classes: dict or None
+        :type item: studiolibrary.LibraryItem or None
+        :rtype: studiolibrary.ItemRecord or None
+        """
+        cls = self.itemClassFromData(path, itemData, classes)
+
+        if not cls:
+            return None
+
+        if item is not None:
+            if type(item) is cls:
+                item.setItemData(itemData)
+            else:
+                item = None
+
+        return studiolibrary.ItemRecord(path, itemData, cls, item)
+
+    def facetIndex(self, fields=None):
+        """
+        Get the index of the paths for each value of the given fields.
+
+        The fields are indexed from the records the first time they are
+        used after reading the database, and are then kept up to date with
+        the changes saved by the library.
+
+        :type fields: list[str] or None
+        :rtype: studiolibrary.FacetIndex
+        """
+        records = self.records()
+
+        if self._facetIndex is None:
+            self._facetIndex = studiolibrary.FacetIndex()
+
+        facetIndex = self._facetIndex
+
+        for field in fields or []:
+            if not facetIndex.hasField(field) and not facetIndex.isIgnored(field):
+                t = time.time()
+
+                facetIndex.addField(field, ((r.path(), r.itemData()) for r in records))
+
+                logger.debug("Creating the facet index for %s took %s", field, time.time() - t)
+
+        return facetIndex
+
+    def facetPaths(self, key, cond, value):
+        """
+        Get the paths matched by the given filter using the facet index.
+
+        None is returned when the field cannot be indexed.
+
+        :type key: str
+        :type cond: str
+        :type value: object
+        :rtype: set[str] or None
+        """
+        facetIndex = self.facetIndex([key])
+
+        if not facetIndex.hasField(key):
+            return None
+
+        try:
+            match = self.compileFilter(key, cond, value)
+        except ValueError:
+            return None
+
+        return facetIndex.paths(key, lambda value_: match({key: value_}))
+
+    def searchIndex(self):
+        """
+        Get the full text index of the item data.
+
+        The index is created from the records the first time it is used
+        after reading the database, and is then kept up to date with the
+        changes saved by the library.
+
+        :rtype: studiolibrary.SearchIndex
+        """
+        records = self.records()
+
+        if self._searchIndex is None:
+            t = time.time()
+
+            searchIndex = studiolibrary.SearchIndex()
+            for record in records:
+                searchIndex.add(record.path(), record.itemData())
+
+            self._searchIndex = searchIndex
+
+            logger.debug("Creating the search index took %s", time.time() - t)
+
+        return self._searchIndex
+
+    @staticmethod
+    def fieldsFromData(data):
+        """
+        Get the names of all the fields used by the given item data.
+
+        :type data: dict or studiolibrary.snapshot.SnapshotData
+        :rtype: list[str]
+        """
+        if isinstance(data, studiolibrary.snapshot.SnapshotData):
+            return data.fields()
+
+        fields = set()
+        for itemData in data.values():
+            fields.update(itemData.keys())
+
+        return list(fields)
+
+    def createItems(self):
+        """
+        Create all the items for the model.
+
+        Prefer using the records when not all the items are shown, since
+        creating a Qt item for every record is slow for large libraries.
+
+        :rtype: list[studiolibrary.LibraryItem] 
+        """
+        return self.itemsFromRecords(self.records())
+
+    @studiolibrary.metrics.timed("library.createItems")
+    def itemsFromRecords(self, records):
+        """
+        Get the Qt items for the given records and create the missing ones.
+
+        :type records: list[studiolibrary.ItemRecord]
+        :rtype: list[studiolibrary.LibraryItem]
+        """
+        return [
+            record.item(library=self, libraryWindow=self._libraryWindow)
+            for record in records
+        ]
+
+    def itemFromPath(self, path, **kwargs):
+        """
+        Return a new item instance for the given path.
+
+        :type path: str
+        :rtype: studiolibrary.LibraryItem or None
+        """
+        path = studiolibrary.normPath(path)
+
+        cls = self.itemClassFromPath(path)
+        if cls:
+            return cls(path, **kwargs)
+
+    def itemDispatchTable(self):
+        """
+        Get the lookup tables for matching paths with the registered items.
+
+        The extension table maps the extensions set on the items to the item
+        class and its registration order. Items without an extension, or
+        that reimplement the match method, are returned as matchers.
+
+        :rtype: (dict, list[(int, str, LibraryItem.__class__)], list[(int, LibraryItem.__class__)])
+        """
+        classes = tuple(self.registeredItems())
+
+        if self._registeredItems and self._registeredItems[0] == classes:
+            return self._registeredItems[1]
+
+        extensions = {}
+        suffixes = []
+        matchers = []
+
+        for i, cls in enumerate(classes):
+            extensions_ = cls.EXTENSIONS
+            if not extensions_ and cls.EXTENSION:
+                extensions_ = [cls.EXTENSION]
+
+            customMatch = getattr(cls.match, "__func__", None) is not \
+                getattr(studiolibrary.LibraryItem.match, "__func__", None)
+
+            if customMatch or not extensions_:
+                matchers.append((i, cls))
+                continue
+
+            for ext in extensions_:
+                if ext.startswith(".") and ext.count(".") == 1:
+                    extensions.setdefault(ext, (i, cls))
+                else:
+                    suffixes.append((i, ext, cls))
+
+        table = (extensions, suffixes, matchers)
+        self._registeredItems = (classes, table)
+
+        return table
+
+    def itemClassFromPath(self, path, entry=None):
+        """
+        Return the first registered item class that supports the given path.
+
+        The path should already be normalized. When a directory entry is
+        given the matchers can use its cached type information.
+
+        :type path: str
+        :type entry: os.DirEntry or None
+        :rtype: LibraryItem.__class__ or None
+        """
+        extensions, suffixes, matchers = self.itemDispatchTable()
+
+        index, cls = extensions.get(os.path.splitext(path)[1], (None, None))
+
+        for i, ext, cls_ in suffixes:
+            if index is not None and i >= index:
+                break
+            if path.endswith(ext):
+                index, cls = i, cls_
+
+        for i, cls_ in matchers:
+            if index is not None and i >= index:
+                break
+            if entry is None:
+                match = cls_.match(path)
+            else:
+                match = cls_.matchEntry(path, entry)
+            if match:
+                return cls_
+
+        return cls
+
+    def itemsFromPaths(self, paths, **kwargs):
+        """
+        Return new item instances for the given paths.
+
+        :type paths: list[str]:
+        :rtype: collections.Iterable[studiolibrary.LibraryItem]
+        """
+        for path in paths:
+            item = self.itemFromPath(path, **kwargs)
+            if item:
+                yield item
+
+    def itemsFromUrls(self, urls, **kwargs):
+        """
+        Return new item instances for the given QUrl objects.
+
+        :type urls: list[QtGui.QUrl]
+        :rtype: list[studiolibrary.LibraryItem]
+        """
+        items = []
+        for path in studiolibrary.pathsFromUrls(urls):
+
+            item = self.itemFromPath(path, **kwargs)
+
+            if item:
+                data = item.createItemData()
+                item.setItemData(data)
+
+                items.append(item)
+            else:
+                msg = 'Cannot find the item for path "{0}"'
+                msg = msg.format(path)
+                logger.warning(msg)
+
+        return items
+
+    @studiolibrary.metrics.timed("library.findItems")
+    def findItems(self, queries, limit=None, offset=0):
+        """
+        Get the items that match the given queries.
+        
+        Examples:
+            
+            queries = [
+                {
+                    'operator': 'or',
+                    'filters': [
+                        ('folder', 'is' '/library/proj/test'),
+                        ('folder', 'startswith', '/library/proj/test'),
+                    ]
+                },
+                {
+                    'operator': 'and',
+                    'filters': [
+                        ('path', 'contains' 'test'),
+                        ('path', 'contains', 'run'),
+                    ]
+                }
+            ]
+            
+            print(library.find(queries))
+
+        Only the items from the offset to the limit are returned when a
+        limit is given, and only those items are sorted and created.
+            
+        :type queries: list[dict]            
+        :type limit: int or None
+        :type offset: int
+        :rtype: list[studiolibrary.LibraryItem]
+        """
+        return self.itemsFromRecords(self.findRecords(queries, limit, offset))
+
+    def findRecords(self, queries, limit=None, offset=0, sortBy=None):
+        """
+        Get the records that match the given queries without creating Qt items.
+
+        The records are sorted by the sortBy fields of the library when
+        sortBy is None.
+
+        :type queries: list[dict]
+        :type limit: int or None
+        :type offset: int
+        :type sortBy: list[str] or None
+        :rtype: list[studiolibrary.ItemRecord]
+        """
+        task = self.createSearchTask(queries, limit=limit, offset=offset, sortBy=sortBy)
+        results = task.run()
+
+        self.setLastSearch(task)
+
+        return results
+
+    def createSearchTask(self, queries, groupBy=None, limit=None, offset=0, sortBy=None):
+        """
+        Create a task for finding the records that match the given queries.
+
+        The search index is used and the queries are compiled before the
+        task is created, so the task can run on another thread without
+        using the library.
+
+        :type queries: list[dict]
+        :type groupBy: list[str] or None
+        :type limit: int or None
+        :type offset: int
+        :type sortBy: list[str] or None
+        :rtype: studiolibrary.SearchTask
+        """
+        queries = copy.copy(queries)
+        queries.extend(self._globalQueries.values())
+
+        logger.debug("Search queries:")
+        for query in queries:
+            logger.debug('Query: %s', query)
+
+        self.loadShards(self.queryFolders(queries))
+
+        allRecords = tuple(self.records())
+        records = allRecords
+        sortBy = self.sortBy() if sortBy is None else sortBy
+        state = (queries, list(sortBy or []), self._generation)
+
+        # Filter the previous results when the queries can only match
+        # fewer items, such as when typing more text in the search widget
+        refine = self.isRefinedSearch(*state)
+        if refine:
+            records, isSorted = self._lastSearch[-2:]
+
+        paths, queries = self.searchText(queries)
+        match = self.compileQueries(queries) if queries else None
+
+        # Filtering the previous results keeps them in the same order
+        if refine and isSorted:
+            sortBy = None
+
+        return studiolibrary.SearchTask(
+            tuple(records),
+            allRecords=allRecords,
+            paths=paths,
+            match=match,
+            sortBy=sortBy,
+            groupBy=groupBy,
+            sortKeys=self._sortKeys,
+            state=state,
+            limit=limit,
+            offset=offset,
+        )
+
+    def setLastSearch(self, task):
+        """
+        Keep the results of the given task for refining the next search.
+
+        :type task: studiolibrary.SearchTask
+        """
+        state = task.state()
+
+        if state[-1] == self._generation:
+            self._lastSearch = state + (task.results(), task.isSorted())
+
+    def isRefinedSearch(self, queries, sortBy, generation):
+        """
+        Check if the given search can be found from the previous results.
+
+        :type queries: list[dict]
+        :type sortBy: list[str]
+        :type generation: int
+        :rtype: bool
+        """
+        if self._lastSearch is None:
+            return False
+
+        queries_, sortBy_, generation_, results, isSorted = self._lastSearch
+
+        return generation == generation_ \
+            and sortBy == sortBy_ \
+            and self.narrowsQueries(queries, queries_)
+
+    @classmethod
+    def narrowsFilter(cls, filter_, other):
+        """
+        Check if the items matched by the filter are also matched by the other.
+
+        :type filter_: (str, str, object)
+        :type other: (str, str, object)
+        :rtype: bool
+        """
+        key, cond, value = filter_
+        otherKey, otherCond, otherValue = other
+
+        if isinstance(value, six.string_types):
+            value = value.lower()
+
+        if isinstance(otherValue, six.string_types):
+            otherValue = otherValue.lower()
+
+        if key != otherKey or cond != otherCond:
+            return False
+
+        if value == otherValue:
+            return True
+
+        if not isinstance(value, six.string_types) or \
+                not isinstance(otherValue, six.string_types):
+            return False
+
+        if cond == 'contains':
+            return otherValue in value
+
+        if cond == 'startswith':
+            return value.startswith(otherValue)
+
+        return False
+
+    @classmethod
+    def narrowsQuery(cls, query, other):
+        """
+        Check if the items matched by the query are also matched by the other.
+
+        :type query: dict
+        :type other: dict
+        :rtype: bool
+        """
+        filters = query.get('filters') or []
+        otherFilters = other.get('filters') or []
+
+        # A query without filters matches every item
+        if not otherFilters:
+            return True
+
+        if not filters:
+            return False
+
+        operator = query.get('operator', 'and')
+        otherOperator = other.get('operator', 'and')
+
+        if operator not in ('and', 'or') or otherOperator not in ('and', 'or'):
+            return operator == otherOperator and \
+                list(filters) == list(otherFilters)
+
+        def narrows(otherFilter):
+            if operator == 'and':
+                return any(cls.narrowsFilter(f, otherFilter) for f in filters)
+            return all(cls.narrowsFilter(f, otherFilter) for f in filters)
+
+        if otherOperator == 'and':
+            return all(narrows(f) for f in otherFilters)
+
+        if operator == 'and':
+            return any(narrows(f) for f in otherFilters)
+
+        return all(
+            any(cls.narrowsFilter(f, otherFilter) for otherFilter in otherFilters)
+            for f in filters
+        )
+
+    @classmethod
+    def narrowsQueries(cls, queries, other):
+        """
+        Check if the items matched by the queries are also matched by the other.
+
+        This is true when every query in the other queries matches all the
+        items of one of the given queries, such as when a search term is
+        extended or another AND filter is added.
+
+        :type queries: list[dict]
+        :type other: list[dict]
+        :rtype: bool
+        """
+        return all(
+            any(cls.narrowsQuery(query, otherQuery) for query in queries)
+            for otherQuery in other
+        )
+
+    def searchText(self, queries, facets=False):
+        """
+        Use the search index to find the paths for the "*" contains filters.
+
+        The filters that are fully answered by the index are removed from
+        the returned queries. The remaining queries still need to be
+        matched with the paths, and all the paths are searched when None
+        is returned. The facet index is also used for the other filters
+        when facets is True.
+
+        :type queries: list[dict]
+        :type facets: bool
+        :rtype: (set[str] or None, list[dict])
+        """
+        result = None
+        queries_ = []
+
+        for query in queries:
+            filters = query.get('filters') or []
+            operator = query.get('operator', 'and')
+
+            found = []
+            filters_ = []
+
+            for filter_ in filters:
+                key, cond, value = filter_
+                paths, exact = None, False
+
+                if key == '*' and cond == 'contains' and isinstance(value, six.string_types):
+                    paths, exact = self.searchIndex().search(value)
+
+                elif facets and key != '*':
+                    paths = self.facetPaths(key, cond, value)
+                    exact = paths is not None
+
+                if paths is not None:
+                    found.append(paths)
+
+                if not exact:
+                    filters_.append(filter_)
+
+            if operator == 'or':
+                # Any filter that was not indexed could match any path
+                if found and len(found) == len(filters):
+                    paths = set().union(*found)
+                    result = paths if result is None else result & paths
+                if filters_:
+                    queries_.append(query)
+
+            else:
+                for paths in found:
+                    result = paths if result is None else result & paths
+                if filters_:
+                    queries_.append(dict(query, filters=filters_))
+
+        return result, queries_
+
+    def queries(self, exclude=None):
+        """
+        Get all the queries for the dataset excluding the given ones.
+        
+        :type exclude: list[str] or None
+        
+        :rtype: list[dict] 
+        """
+        queries = []
+        exclude = exclude or []
+
+        for query in self._queries.values():
+            if query.get('name') not in exclude:
+                queries.append(query)
+
+        return queries
+
+    def addGlobalQuery(self, query):
+        """
+        Add a global query to library.
+        
+        :type query: dict 
+        """
+        self._globalQueries[query["name"]] = query
+
+    def addQuery(self, query):
+        """
+        Add a search query to the library.
+        
+        Examples:
+            addQuery({
+                'name': 'My Query',
+                'operator': 'or',
+                'filters': [
+                    ('folder', 'is' '/library/proj/test'),
+                    ('folder', 'startswith', '/library/proj/test'),
+                ]
+            })
+        
+        :type query: dict
+        """
+        self._queries[query["name"]] = query
+
+    def removeQuery(self, name):
+        """
+        Remove the query with the given name.
+        
+        :type name: str 
+        """
+        if name in self._queries:
+            del self._queries[name]
+
+    def queryExists(self, name):
+        """
+        Check if the given query name exists.
+        
+        :type name: str
+        :rtype: bool 
+        """
+        return name in self._queries
+
+    def search(self, limit=None, offset=0):
+        """
+        Run a search using the queries added to this dataset.
+
+        When the search is async the results are emitted with the
+        searchFinished signal after the search on the worker thread has
+        finished, and any search that is still running is cancelled.
+
+        Only the items for the first page of the results are created when
+        there is a limit, and the next pages are created with fetchMore.
+        The search page size is used when the limit is None.
+
+        :type limit: int or None
+        :type offset: int
+        """
+        if not self.isSearchEnabled():
+            logger.debug('Search is disabled')
+            return
+
+        # The stages of the search are shown from this mark in debug mode
+        studiolibrary.metrics.mark("search")
+
+        t = time.time()
+
+        logger.debug("Searching items")
+
+        self.searchStarted.emit()
+
+        queries = self.queries()
+        limit = (self.searchPageSize() if limit is None else limit) or None
+
+        # Read any changes on disc before using the generation in the key
+        self.loadShards(self.queryFolders(queries + list(self._globalQueries.values())))
+        self.records()
+
+        key = self.searchCacheKey(queries, limit, offset)
+        cached = self._searchCache.pop(key, None) if key else None
+
+        if cached:
+            self._searchCacheHits += 1
+            studiolibrary.metrics.increment("library.searchCache.hits")
+
+            if self._searchExecutor:
+                self._searchExecutor.cancel()
+
+        else:
+            self._searchCacheMisses += 1
+            studiolibrary.metrics.increment("library.searchCache.misses")
+
+            task = self.createSearchTask(
+                queries, groupBy=self.groupBy(), limit=limit, offset=offset
+            )
+
+            if self.isSearchAsync():
+                self._searchAsyncState = (key, t)
+                self.searchExecutor().start(task)
+                return
+
+            task.run()
+            self.setLastSearch(task)
+
+            cached = self._resultsFromTask(task)
+
+        self._setSearchResults(key, cached, t)
+
+    def _resultsFromTask(self, task):
+        """
+        Create the items for the first page of the results of the given task.
+
+        :type task: studiolibrary.SearchTask
+        :rtype: (list[studiolibrary.LibraryItem], dict, studiolibrary.SearchTask)
+        """
+        # The Qt items can only be created on the main thread
+        results = []
+        groupedResults = collections.OrderedDict()
+
+        for group, records in task.groupedResults().items():
+            items = self.itemsFromRecords(records)
+            groupedResults[group] = items
+            results.extend(items)
+
+        return results, groupedResults, task
+
+    def _searchTaskFinished(self, task):
+        """
+        Triggered on the main thread when the search task has finished.
+
+        :type task: studiolibrary.SearchTask
+        """
+        key, t = self._searchAsyncState
+        self._searchAsyncState = None
+
+        self.setLastSearch(task)
+
+        # The data changed while searching so the results are not cached
+        if task.state()[-1] != self._generation:
+            key = None
+
+        self._setSearchResults(key, self._resultsFromTask(task), t)
+
+    def _searchTaskFailed(self, task):
+        """
+        Triggered on the main thread when the search task has raised an error.
+
+        The error has been logged by the worker and the results of the
+        previous search are kept.
+
+        :type task: studiolibrary.SearchTask
+        """
+        self._searchAsyncState = None
+
+    def _setSearchResults(self, key, results, t):
+        """
+        Set the results of a search, add them to the cache and emit them.
+
+        :type key: tuple or None
+        :type results: (list[studiolibrary.LibraryItem], dict, studiolibrary.SearchTask)
+        :type t: float
+        """
+        self._results, self._groupedResults, self._searchTask = results
+
+        if key:
+            self._searchCache[key] = results
+
+            while len(self._searchCache) > self.searchCacheSize():
+                self._searchCache.popitem(last=False)
+
+        self.searchFinished.emit()
+
+        self._searchTime = time.time() - t
+
+        studiolibrary.metrics.record("library.search", self._searchTime, t)
+
+        self.searchTimeFinished.emit()
+
+        logger.debug('Search time: %s', self._searchTime)
+
+    def resultCount(self):
+        """
+        Get the number of items found by the last search.
+
+        This includes the items in the pages that have not been fetched.
+
+        :rtype: int
+        """
+        if self._searchTask is None:
+            return len(self._results)
+
+        return self._searchTask.count()
+
+    def canFetchMore(self):
+        """
+        Check if there are more pages of results to fetch.
+
+        :rtype: bool
+        """
+        task = self._searchTask
+
+        return task is not None and task.hasMore(task.offset() + len(self._results))
+
+    @studiolibrary.metrics.timed("library.fetchMore")
+    def fetchMore(self, limit=None):
+        """
+        Create the items for the next page of the results of the last search.
+
+        The new items are added to the results and emitted grouped with
+        the resultsFetched signal.
+
+        :type limit: int or None
+        :rtype: list[studiolibrary.LibraryItem]
+        """
+        if not self.canFetchMore():
+            return []
+
+        t = time.time()
+
+        task = self._searchTask
+        limit = (self.searchPageSize() if limit is None else limit) or None
+
+        groups = task.fetch(task.offset() + len(self._results), limit)
+
+        results = []
+        groupedResults = collections.OrderedDict()
+
+        # The results are changed in place so the cache keeps the new items
+        for group, records in groups.items():
+            items = self.itemsFromRecords(records)
+            groupedResults[group] = items
+            self._groupedResults.setdefault(group, []).extend(items)
+            results.extend(items)
+
+        self._results.extend(results)
+
+        logger.debug("Fetch more took %s", time.time() - t)
+
+        self.resultsFetched.emit(groupedResults)
+
+        return results
+
+    def generation(self):
+        """
+        Get the number of times the data has changed since it was first read.
+
+        :rtype: int
+        """
+        return self._generation
+
+    def searchCacheSize(self):
+        """
+        Get the number of search results to keep in the search cache.
+
+        :rtype: int
+        """
+        size = studiolibrary.config.get("searchCacheSize")
+        return 32 if size is None else size
+
+    def searchCacheKey(self, queries, limit=None, offset=0):
+        """
+        Get the key for the search cache from the given queries.
+
+        The key contains the global queries, the sort and group fields,
+        the page and the generation of the data. The order and the names
+        of the queries are ignored. None is returned when the queries
+        cannot be used as a key.
+
+        :type queries: list[dict]
+        :type limit: int or None
+        :type offset: int
+        :rtype: tuple or None
+        """
+        queries = list(queries) + list(self._globalQueries.values())
+
+        try:
+            queries = tuple(sorted(set(
+                (
+                    query.get('operator', 'and'),
+                    tuple(tuple(filter_) for filter_ in query.get('filters') or []),
+                )
+                for query in queries
+            ), key=repr))
+        except TypeError:
+            return None
+
+        return (
+            queries,
+            tuple(self.sortBy() or []),
+            tuple(self.groupBy() or []),
+            limit,
+            offset,
+            self._generation,
+        )
+
+    def searchCacheStats(self):
+        """
+        Get the number of searches found in the cache and the number missed.
+
+        :rtype: dict
+        """
+        return {
+            "hits": self._searchCacheHits,
+            "misses": self._searchCacheMisses,
+            "size": len(self._searchCache),
+        }
+
+    def clearSearchCache(self):
+        """
+        Remove all the search results from the cache.
+
+        The results kept for refining the next search are also removed.
+        """
+        self._searchCache.clear()
+        self._lastSearch = None
+
+    def results(self):
+        """
+        Return the items found after a search is ran.
+        
+        :rtype: list[Item] 
+        """
+        return self._results
+
+    def groupedResults(self):
+        """
+        Get the results grouped after a search is ran.
+        
+        :rtype: dict
+        """
+        return self._groupedResults
+
+    def searchTime(self):
+        """
+        Return the time taken to run a search.
+        
+        :rtype: float 
+        """
+        return self._searchTime
+
+    def addItem(self, item):
+        """
+        Add the given item to the database.    
+    
+        :type item: studiolibrary.LibraryItem
+        :rtype: None 
+        """
+        self.saveItemData([item])
+
+    def addItems(self, items):
+        """
+        Add the given items to the database.
+        
+        :type items: list[studiolibrary.LibraryItem]
+        """
+        self.saveItemData(items)
+
+    def saveItemData(self, items, emitDataChanged=True):
+        """
+        Add the given items to the database.
+
+        :type items: list[studiolibrary.LibraryItem]
+        :type emitDataChanged: bool
+        """
+        logger.debug("Save item data %s", items)
+
+        data = {}
+        for item in items:
+            data.setdefault(item.path(), {})
+            data[item.path()].update(item.itemData())
+
+        self.update(data)
+
+        if emitDataChanged:
+            self.search()
+            self.dataChanged.emit()
+
+    def addPaths(self, paths, data=None):
+        """
+        Add the given path and the given data to the database.    
+    
+        :type paths: list[str]
+        :type data: dict or None
+        :rtype: None 
+        """
+        data = data or {}
+        self.updatePaths(paths, data)
+
+    def updatePaths(self, paths, data):
+        """
+        Update the given paths with the given data in the database.
+
+        :type paths: list[str]
+        :type data: dict
+        :rtype: None
+        """
+        paths = studiolibrary.normPaths(paths)
+        self.update(dict((path, dict(data)) for path in paths))
+
+    def copyPath(self, src, dst):
+        """
+        Copy the given source path to the given destination path.
+
+        :type src: str
+        :type dst: str
+        :rtype: str
+        """
+        self.addPaths([dst])
+        return dst
+
+    def renamePath(self, src, dst):
+        """
+        Rename the source path to the given name.
+
+        :type src: str
+        :type dst: str
+        :rtype: str
+        """
+        self.renamePaths({src: dst})
+        return dst
+
+    def renamePaths(self, mapping):
+        """
+        Rename or move each source path and its children to the destination.
+
+        Example:
+            library.renamePaths({
+                "P:/Library/Mario/jump.anim": "P:/Library/Luigi/jump.anim",
+                "P:/Library/Mario/walk.anim": "P:/Library/Luigi/walk.anim",
+            })
+
+        :type mapping: dict or list[(str, str)]
+        :rtype: None
+        """
+        if self.path():
+            self.storage().renamePaths(mapping)
+            self.setDirty(True)
+        else:
+            logger.info('No path set for renaming the data on disc.')
+
+    def removePath(self, path):
+        """
+        Remove the given path from the database.
+
+        :type path: str
+        :rtype: None
+        """
+        self.removePaths([path])
+
+    def removePaths(self, paths):
+        """
+        Remove the given paths from the database.
+
+        :type paths: list[str]
+        :rtype: None
+        """
+        paths = studiolibrary.normPaths(paths)
+
+        if self.path():
+            with self.storage().lock():
+                current = self.isCurrent()
+                self.storage().remove(paths)
+
+                if current:
+                    self.removeRecords(paths)
+                    self.setDirty(False)
+                else:
+                    self.setDirty(True)
+        else:
+            logger.info('No path set for removing the data from disc.')
+
+    def syncFolders(self, folders):
+        """
+        Sync the items in the given folders without walking the library.
+
+        The item data is only created for the new items and for the items
+        in new folders. The items that no longer exist are removed with
+        their children. A renamed item is removed and added again.
+
+        :type folders: list[str]
+        :rtype: (list[str], list[str])
+        """
+        if not self.path():
+            logger.info('No path set for syncing folders')
+            return [], []
+
+        folders = set(studiolibrary.normPaths(folders))
+
+        self.loadShards(folders)
+        data = self.read()
+
+        children = {}
+        for path in data:
+            dirname = os.path.dirname(path)
+            if dirname in folders:
+                children.setdefault(dirname, set()).add(path)
+
+        added = {}
+        removed = set()
+
+        for folder in sorted(folders):
+            if not os.path.isdir(folder):
+                continue
+
+            items, subdirs = self.listDirectory(folder)
+            subdirs = set(subdir for subdir, ancestors in subdirs)
+            known = children.get(folder, set())
+
+            removed.update(known.difference(item.path() for item in items))
+
+            for item in items:
+                path = item.path()
+                if path in known or path in added:
+                    continue
+
+                added[path] = item.createItemData()
+
+                # Sync everything in a new folder, such as an extracted archive
+                if path in subdirs:
+                    for itemData in self.walker(path, threads=self.syncThreadCount()):
+                        added[itemData["path"]] = itemData
+
+        if removed:
+            prefixes = tuple(path + "/" for path in removed)
+            removed.update(path for path in data if path.startswith(prefixes))
+            removed.difference_update(added)
+
+        removed = sorted(removed)
+
+        if removed:
+            self.removePaths(removed)
+
+        if added:
+            self.update(added)
+
+            if self._liveUpdateEnabled:
+                self.folderWatcher().addPaths(self.watchFolders())
+
+        if removed:
+            self.pathsRemoved.emit(removed)
+
+        if added:
+            self.pathsAdded.emit(sorted(added))
+
+        return sorted(added), removed
+
+    @staticmethod
+    def match(data, queries):
+        """
+        Match the given data with the given queries.
+        
+        Examples:
+            
+            queries = [
+                {
+                    'operator': 'or',
+                    'filters': [
+                        ('folder', 'is' '/library/proj/test'),
+                        ('folder', 'startswith', '/library/proj/test'),
+                    ]
+                },
+                {
+                    'operator': 'and',
+                    'filters': [
+                        ('path', 'contains' 'test'),
+                        ('path', 'contains', 'run'),
+                    ]
+                }
+            ]
+            
+            print(library.find(queries))
+        """
+        matches = []
+
+        for query in queries:
+
+            filters = query.get('filters')
+            operator = query.get('operator', 'and')
+
+            if not filters:
+                continue
+
+            match = False
+
+            for key, cond, value in filters:
+
+                if key == '*':
+                    itemValue = six.text_type(data)
+                else:
+                    itemValue = data.get(key)
+
+                if isinstance(value, six.string_types):
+                    value = value.lower()
+
+                if isinstance(itemValue, six.string_types):
+                    itemValue = itemValue.lower()
+
+                if not itemValue:
+                    match = False
+
+                elif cond == 'contains':
+                    match = value in itemValue
+
+                elif cond == 'not_contains':
+                    match = value not in itemValue
+
+                elif cond == 'is':
+                    match = value == itemValue
+
+                elif cond == 'not':
+                    match = value != itemValue
+
+                elif cond == 'startswith':
+                    match = itemValue.startswith(value)
+
+                if operator == 'or' and match:
+                    break
+
+                if operator == 'and' and not match:
+                    break
+
+            matches.append(match)
+
+        return all(matches)
+
+    @classmethod
+    def compileFilter(cls, key, cond, value):
+        """
+        Compile the given filter into a function that matches item data.
+
+        The function returns the same result as Library.match for a query
+        with only the given filter. Values that Library.match cannot compare
+        do not match instead of raising an error, since the compiled filters
+        may be checked in a different order.
+
+        :type key: str
+        :type cond: str
+        :type value: object
+        :rtype: func
+        """
+        if isinstance(value, six.string_types):
+            value = value.lower()
+
+        stringTypes = six.string_types
+        textType = six.text_type
+
+        if key == '*':
+            # Match the text of all the item data as a single field
+            matchText = cls.compileFilter('text', cond, value)
+
+            def match(data):
+                return matchText({'text': textType(data)})
+
+            return match
+
+        if cond == 'contains':
+            def match(data):
+                itemValue_ = data.get(key)
+                if isinstance(itemValue_, stringTypes):
+                    itemValue_ = itemValue_.lower()
+                try:
+                    return bool(itemValue_) and value in itemValue_
+                except TypeError:
+                    return False
+
+        elif cond == 'not_contains':
+            def match(data):
+                itemValue_ = data.get(key)
+                if isinstance(itemValue_, stringTypes):
+                    itemValue_ = itemValue_.lower()
+                try:
+                    return bool(itemValue_) and value not in itemValue_
+                except TypeError:
+                    return False
+
+        elif cond == 'is':
+            def match(data):
+                itemValue_ = data.get(key)
+                if isinstance(itemValue_, stringTypes):
+                    itemValue_ = itemValue_.lower()
+                return bool(itemValue_) and value == itemValue_
+
+        elif cond == 'not':
+            def match(data):
+                itemValue_ = data.get(key)
+                if isinstance(itemValue_, stringTypes):
+                    itemValue_ = itemValue_.lower()
+                return bool(itemValue_) and value != itemValue_
+
+        elif cond == 'startswith':
+            def match(data):
+                itemValue_ = data.get(key)
+                return isinstance(itemValue_, stringTypes) and \
+                    bool(itemValue_) and itemValue_.lower().startswith(value)
+
+        else:
+            raise ValueError(u"Unknown filter condition {0}".format(cond))
+
+        return match
+
+    @classmethod
+    def compileQueries(cls, queries):
+        """
+        Compile the given queries into a single function that matches item data.
+
+        The function returns the same result as calling Library.match with
+        the given queries. Each filter value is only lowercased once, and
+        the filters are checked in the order of Library.FilterOrder with
+        the full text filters last.
+
+        Example:
+            match = Library.compileQueries(queries)
+            results = [data for data in items if match(data)]
+
+        :type queries: list[dict]
+        :rtype: func
+        """
+        compiled = []
+
+        for query in queries:
+            filters = query.get('filters')
+            operator = query.get('operator', 'and')
+
+            if not filters:
+                continue
+
+            conds = [cond for key, cond, value in filters]
+
+            # Fall back to the interpreter for the behaviour of unknown
+            # conditions and operators, which depends on the filter order
+            if operator not in ('and', 'or') or not all(c in cls.FilterOrder for c in conds):
+                compiled.append((2, cls._interpretQuery(query)))
+                continue
+
+            def order(filter_):
+                key, cond, value = filter_
+                return key == '*', cls.FilterOrder[cond]
+
+            if operator == 'and':
+                filters = sorted(filters, key=order)
+
+            matches = [cls.compileFilter(*filter_) for filter_ in filters]
+
+            if len(matches) == 1:
+                match = matches[0]
+            elif operator == 'and':
+                match = cls._matchAll(matches)
             else:
-                msg = 'Cannot find the item for path "{0}"'
-                msg = msg.format(path)
-                logger.warning(msg)
+                match = cls._matchAny(matches)
 
-        return items
+            compiled.append((min(order(f) for f in filters), match))
 
-    def findItems(self, queries):
+        compiled.sort(key=lambda item: item[0])
+
+        return cls._matchAll([match for _, match in compiled])
+
+    @staticmethod
+    def _matchAll(matches):
         """
-        Get the items that match the given queries.
+        :type matches: list[func]
+        :rtype: func
+        """
+        if len(matches) == 1:
+            return matches[0]
+
+        def match(data):
+            for match_ in matches:
+                if not match_(data):
+                    return False
+            return True
+
+        return match
+
+    @staticmethod
+    def _matchAny(matches):
+        """
+        :type matches: list[func]
+        :rtype: func
+        """
+        def match(data):
+            for match_ in matches:
+                if match_(data):
+                    return True
+            return False
+
+        return match
+
+    @classmethod
+    def _interpretQuery(cls, query):
+        """
+        :type query: dict
+        :rtype: func
+        """
+        queries = [query]
+
+        def match(data):
+            return cls.match(data, queries)
+
+        return match
+
+    @staticmethod
+    @studiolibrary.metrics.timed("library.sorted")
+    def sorted(items, sortBy, sortKeys=None, allItems=None, limit=None):
+        """
+        Return the given data sorted using the sortBy argument.
+
+        The items are sorted by all the fields with a single sort. Empty
+        values sort first, then numbers, then text in natural order so
+        that "item2" comes before "item10". When all the items in the
+        library are given, the sort keys keep the order of all the items
+        for sorting the results of the next search. When a limit is given
+        only the first items are found, without sorting the other items.
         
-        Examples:
+        Example:
+            items = library.records()
             
-            queries = [
-                {
-                    'operator': 'or',
-                    'filters': [
-                        ('folder', 'is' '/library/proj/test'),
-                        ('folder', 'startswith', '/library/proj/test'),
-                    ]
-                },
-                {
-                    'operator': 'and',
-                    'filters': [
-                        ('path', 'contains' 'test'),
-                        ('path', 'contains', 'run'),
-                    ]
-                }
-            ]
+            sortBy = ['index:asc', 'name']
+            # sortBy = ['index:dsc', 'name']
             
-            print(library.find(queries))
+            print(Library.sorted(items, sortBy))
             
-        :type queries: list[dict]            
-        :rtype: list[studiolibrary.LibraryItem]
+        :type items: list[Item]
+        :type sortBy: list[str]
+        :type sortKeys: studiolibrary.SortKeys or None
+        :type allItems: list[Item] or None
+        :type limit: int or None
+        :rtype: list[Item]
         """
-        fields = []
-        results = []
+        logger.debug('Sort by: %s', sortBy)
 
-        queries = copy.copy(queries)
-        queries.extend(self._globalQueries.values())
+        t = time.time()
 
-        logger.debug("Search queries:")
-        for query in queries:
-            logger.debug('Query: %s', query)
+        sortKeys = sortKeys or studiolibrary.SortKeys()
+        items = sortKeys.sorted(items, sortBy, allItems=allItems, limit=limit)
+
+        logger.debug("Sort items took %s", time.time() - t)
+
+        return items
+
+    @staticmethod
+    @studiolibrary.metrics.timed("library.groupItems")
+    def groupItems(items, fields):
+        """
+        Group the given items by the given field.
+
+        :type items: list[Item]
+        :type fields: list[str]
+        :rtype: dict
+        """
+        logger.debug('Group by: %s', fields)
+
+        # Only support for top level grouping at the moment.
+        if fields:
+            field = fields[0]
+        else:
+            return {'None': items}
+
+        t = time.time()
+
+        results_ = {}
+        tokens = field.split(':')
+
+        reverse = False
+        if len(tokens) > 1:
+            field = tokens[0]
+            reverse = tokens[1] != 'asc'
 
-        items = self.createItems()
         for item in items:
-            match = self.match(item.itemData(), queries)
-            if match:
-                results.append(item)
-            fields.extend(item.itemData().keys())
+            value = item.itemData().get(field)
+            if value:
+                group = results_.get(value)
+                if group is None:
+                    group = results_[value] = []
+                group.append(item)
+
+        groups = sorted(results_.keys(), reverse=reverse)
 
-        self._fields = list(set(fields))
+        results = collections.OrderedDict()
+        for group in groups:
+            results[group] = results_[group]
 
-        if self.sortBy():
-            results = self.sorted(results, self.sortBy())
+        logger.debug("Group Items Took %s", time.time() - t)
 
         return results
 
-    def queries(self, exclude=None):
+    @classmethod
+    def sortedGroups(cls, items, sortBy, groupBy, limit=None, sortKeys=None, allItems=None):
         """
-        Get all the queries for the dataset excluding the given ones.
-        
-        :type exclude: list[str] or None
-        
-        :rtype: list[dict] 
+        Group the given items and sort the items in each group.
+
+        When a limit is given, only the first items in the order they are
+        shown are returned. The groups after the limit are not sorted and
+        a group that is larger than the limit is only partially sorted.
+
+        :type items: list[Item]
+        :type sortBy: list[str] or None
+        :type groupBy: list[str] or None
+        :type limit: int or None
+        :type sortKeys: studiolibrary.SortKeys or None
+        :type allItems: list[Item] or None
+        :rtype: list[(str, list[Item])]
         """
-        queries = []
-        exclude = exclude or []
+        groups = []
 
-        for query in self._queries.values():
-            if query.get('name') not in exclude:
-                queries.append(query)
+        for group, items_ in cls.groupItems(items, groupBy).items():
+            if limit is not None and limit <= 0:
+                break
 
-        return queries
+            if sortBy:
+                items_ = cls.sorted(items_, sortBy, sortKeys, allItems, limit=limit)
+            elif limit is not None:
+                items_ = items_[:limit]
 
-    def addGlobalQuery(self, query):
-        """
-        Add a global query to library.
-        
-        :type query: dict 
-        """
-        self._globalQueries[query["name"]] = query
+            if limit is not None:
+                limit -= len(items_)
 
-    def addQuery(self, query):
-        """
-        Add a search query to the library.
-        
-        Examples:
-            addQuery({
-                'name': 'My Query',
-                'operator': 'or',
-                'filters': [
-                    ('folder', 'is' '/library/proj/test'),
-                    ('folder', 'startswith', '/library/proj/test'),
-                ]
+            groups.append((group, items_))
+
+        return groups
+
+
+@contextlib.contextmanager
+def _testLibrary(items=None, config=None):
+    """
+    Create a library in a new temporary folder and remove it after testing.
+
+    The given item classes are registered and the given config values are
+    set while testing. The registered items and the config values are
+    restored afterwards.
+
+    Example:
+        with _testLibrary(items=[FolderItem]) as library:
+            library.sync()
+
+    :type items: list[studiolibrary.LibraryItem.__class__] or None
+    :type config: dict or None
+    :rtype: Library
+    """
+    import shutil
+    import tempfile
+
+    config = config or {}
+    config_ = dict((key, studiolibrary.config.get(key)) for key in config)
+    registered = list(studiolibrary.registeredItems())
+    path = studiolibrary.normPath(tempfile.mkdtemp())
+
+    try:
+        for key, value in config.items():
+            studiolibrary.config.set(key, value)
+
+        if items is not None:
+            studiolibrary.utils.clearRegisteredItems()
+            for cls in items:
+                studiolibrary.registerItem(cls)
+
+        yield Library(path)
+    finally:
+        for key, value in config_.items():
+            studiolibrary.config.set(key, value)
+
+        studiolibrary.utils.clearRegisteredItems()
+        for cls in registered:
+            studiolibrary.registerItem(cls)
+
+        shutil.rmtree(path)
+
+
+def testRecords(count=20000):
+    """
+    Test that the records hold the item data without creating the Qt items.
+
+    :type count: int
+    """
+    with _testLibrary() as library:
+        path = library.path()
+
+        module = "studiolibrary.libraryitem.LibraryItem"
+        data = {}
+
+        for i in range(count):
+            itemPath = "{0}/Mario{1}/item{2}.anim".format(path, i % 10, i)
+            data[itemPath] = {
+                "name": "item{0}.anim".format(i),
+                "path": itemPath,
+                "category": "Mario{0}".format(i % 10),
+                "__class__": module,
+            }
+
+        library.save(data)
+        library.read()
+
+        records = library.records()
+        assert len(records) == count
+        assert not any(record.hasItem() for record in records)
+
+        # The records hold the item data without an instance dictionary
+        record = dict((r.path(), r) for r in records)[path + "/Mario3/item3.anim"]
+        assert record.itemData() == data[record.path()]
+        assert record.itemClass() is studiolibrary.LibraryItem
+        assert not hasattr(record, "__dict__")
+
+        # The Qt item is created from the record the first time it is needed
+        item = record.item(library=library)
+        assert record.hasItem() and record.item() is item
+        assert item.path() == record.path()
+        assert item.itemData()["category"] == "Mario3"
+
+        # Only the results of a search create Qt items
+        library.clear()
+        library.setSortBy(["name"])
+        items = library.findItems([{"filters": [("category", "is", "Mario1")]}])
+
+        assert len(items) == count / 10
+        assert sum(r.hasItem() for r in library.records()) == count / 10
+
+        # The Qt items are reused by the next search
+        assert library.findItems([{"filters": [("name", "is", "item1.anim")]}])[0] is items[0]
+
+
+def testSearchText():
+    """Test that the search index finds the same items as matching the text."""
+    with _testLibrary() as library:
+        path = library.path()
+
+        module = "studiolibrary.libraryitem.LibraryItem"
+        data = {}
+
+        for i, name in enumerate(["jump", "walk", "jumping", "run", "idle"]):
+            itemPath = "{0}/Mario{1}/{2}.anim".format(path, i % 2, name)
+            data[itemPath] = {"name": name + ".anim", "path": itemPath, "__class__": module}
+
+        library.save(data)
+
+        def check(*filters, **kwargs):
+            queries = [{"operator": kwargs.get("operator", "and"), "filters": filters}]
+            found = [r.path() for r in library.findRecords(queries)]
+            expected = [r.path() for r in library.records() if library.match(r.itemData(), queries)]
+            assert found == expected, (filters, found, expected)
+            return found
+
+        assert len(check(("*", "contains", "jump"))) == 2
+        assert len(check(("*", "contains", "JUMP"), ("*", "contains", "ing"))) == 1
+        assert len(check(("*", "contains", "jump"), ("*", "contains", "walk"), operator="or")) == 3
+        assert len(check(("*", "contains", "mario1/walk"))) == 1
+        assert len(check(("*", "contains", "/"))) == 5
+        assert len(check(("*", "contains", "jump"), ("name", "is", "jump.anim"))) == 1
+        assert len(check(("*", "contains", "jump"), ("name", "is", "run.anim"), operator="or")) == 3
+
+        # The index is updated with the changes saved by the library
+        library.updatePaths([path + "/Mario1/walk.anim"], {"tags": ["jumpy"]})
+        library.removePaths([path + "/Mario0/jump.anim"])
+
+        assert library._searchIndex is not None
+        assert len(check(("*", "contains", "jump"))) == 2
+
+
+def testRefinedSearch():
+    """Test that refining the search text filters the previous results."""
+    with _testLibrary() as library:
+        path = library.path()
+
+        module = "studiolibrary.libraryitem.LibraryItem"
+        data = {}
+
+        for i, name in enumerate(["walk", "walk_cycle", "walk_cy_2", "walk_run", "jump"]):
+            itemPath = "{0}/Mario/{1}.anim".format(path, name)
+            data[itemPath] = {"name": name + ".anim", "path": itemPath, "__class__": module}
+
+        library.save(data)
+        library.setSortBy(["name:dsc"])
+
+        def search(*filters, **kwargs):
+            queries = [{"name": "search", "operator": kwargs.get("operator", "and"), "filters": filters}]
+            refined = library.isRefinedSearch(queries, library.sortBy(), library.generation())
+            found = [r.path() for r in library.findRecords(queries)]
+            expected = [r.path() for r in library.sorted(library.records(), library.sortBy())
+                        if library.match(r.itemData(), queries)]
+            assert found == expected, (filters, found, expected)
+            return len(found), refined
+
+        assert search(("*", "contains", "walk")) == (4, False)
+        assert search(("*", "contains", "walk_")) == (3, True)
+        assert search(("*", "contains", "walk_"), ("*", "contains", "CY")) == (2, True)
+        assert search(("*", "contains", "walk_")) == (3, False)
+        assert search(("*", "contains", "walk_cy"), ("*", "contains", "run"), operator="or") == (3, False)
+        assert search(("*", "contains", "walk_cy"), ("*", "contains", "walk_run"), operator="or") == (3, True)
+        assert search(("*", "contains", "walk_c")) == (2, False)
+
+        # The previous results are not used after the data has changed
+        library.updatePaths([path + "/Mario/jump.anim"], {"name": "walk_cy.anim"})
+        assert search(("*", "contains", "walk_cy")) == (3, False)
+
+        narrows = Library.narrowsQueries
+        assert narrows([{"filters": [("folder", "startswith", "/a/b")]}], [{"filters": [("folder", "startswith", "/a")]}])
+        assert not narrows([{"filters": [("folder", "is", "/a/b")]}], [{"filters": [("folder", "is", "/a")]}])
+        assert narrows([{"filters": [("type", "is", ".anim")]}, {"filters": []}], [])
+        assert not narrows([{"filters": []}], [{"filters": [("type", "is", ".anim")]}])
+
+
+def testAsyncSearch():
+    """Test that the search on a worker thread only emits the latest results."""
+    with _testLibrary() as library:
+        path = library.path()
+
+        module = "studiolibrary.libraryitem.LibraryItem"
+        data = {}
+
+        for i in range(2000):
+            itemPath = "{0}/Mario{1}/item{2}.anim".format(path, i % 4, i)
+            data[itemPath] = {"name": "item{0}.anim".format(i), "folder": path + "/Mario" + str(i % 4), "__class__": module}
+
+        library.save(data)
+        library.setSortBy(["name:dsc"])
+        library.setGroupBy(["folder"])
+
+        def selectFolder(name):
+            library.addQuery({
+                "name": "sidebar",
+                "filters": [("folder", "startswith", path + "/" + name)],
             })
-        
-        :type query: dict
-        """
-        self._queries[query["name"]] = query
+            library.search()
+
+        finished = []
+        library.searchFinished.connect(lambda: finished.append(library.results()))
+
+        selectFolder("Mario")
+        expected = library.results()
+        library.clearSearchCache()
+
+        library.setSearchAsync(True)
+
+        selectFolder("Mario")
+        assert library.isSearching()
+        selectFolder("Mario1")
+        selectFolder("Mario")
+        library.waitForSearch()
+
+        assert not library.isSearching()
+        assert len(finished) == 2, finished
+        assert finished[-1] == expected
+        assert list(library.groupedResults().keys()) == [path + "/Mario" + str(i) for i in range(4)]
+
+        # The records of a running task are not changed by the updates
+        task = library.createSearchTask(library.queries())
+        record = task._records[0]
+        itemData = dict(record.itemData())
+
+        library.updateRecords({record.path(): {"name": "changed.anim"}})
+
+        assert record.itemData() == itemData
+        assert library._recordsByPath[record.path()].itemData()["name"] == "changed.anim"
+        assert len(library.records()) == 2000
+
+        library.updateRecords({record.path(): itemData})
+
+        # A search that fails on the worker thread keeps the previous results
+        errors = [ValueError("Cannot match the item data")]
+        createSearchTask = library.createSearchTask
+
+        def createFailingTask(*args, **kwargs):
+            task = createSearchTask(*args, **kwargs)
+            match = task._match or (lambda itemData: True)
+
+            def matchOnce(itemData):
+                if errors:
+                    raise errors.pop()
+                return match(itemData)
+
+            task._match = matchOnce
+            return task
+
+        library.clearSearchCache()
+        library.createSearchTask = createFailingTask
+        del finished[:]
+
+        selectFolder("Mario")
+        library.waitForSearch()
+
+        del library.createSearchTask
+        assert not library.isSearching()
+        assert not errors
+        assert not finished, finished
+        assert library.results() == expected
+
+        task = library.createSearchTask(library.queries())
+        task.cancel()
+
+        try:
+            task.run()
+            assert False, "The cancelled task should not finish"
+        except studiolibrary.searchexecutor.SearchCancelled:
+            pass
+
+
+def testPagedSearch():
+    """Test that fetching the pages of a search gives all the results in order."""
+    with _testLibrary() as library:
+        path = library.path()
+
+        module = "studiolibrary.libraryitem.LibraryItem"
+        data = {}
+
+        for i in range(1000):
+            itemPath = "{0}/Mario{1}/item{2}.anim".format(path, i % 3, i)
+            folder = path + "/Mario" + str(i % 3) if i % 100 else ""
+            data[itemPath] = {"name": "item{0}.anim".format(i), "folder": folder, "__class__": module}
+
+        library.save(data)
+        library.setSortBy(["name:dsc"])
+        library.setGroupBy(["folder"])
+        library.addQuery({"name": "search", "filters": [("*", "contains", "item")]})
+
+        library.search()
+        expected = list(library.results())
+        expectedGroups = list(library.groupedResults().keys())
+        assert not library.canFetchMore()
+
+        fetched = []
+        library.resultsFetched.connect(fetched.append)
+        library.setSearchPageSize(300)
+
+        for async_ in [False, True]:
+            library.clearSearchCache()
+            library.setSearchAsync(async_)
+            library.search()
+            library.waitForSearch()
+
+            assert library.results() == expected[:300]
+            assert library.resultCount() == 1000
+
+            while library.canFetchMore():
+                library.fetchMore()
+
+            assert library.results() == expected
+            assert list(library.groupedResults().keys()) == expectedGroups
+
+        assert len(fetched) == 6, len(fetched)
+
+        # Searching for a page only sorts the records needed for the page
+        queries = library.queries()
+        records = library.findRecords(queries)
+        assert library.findRecords(queries, limit=10) == records[:10]
+        assert library.findRecords(queries, limit=10, offset=95) == records[95:105]
+        assert library.findRecords(queries, limit=10, offset=995) == records[995:]
+
+
+def testCompactWhileUpdating():
+    """Test that updating the database does not wait for a compaction."""
+    import threading
+
+    with _testLibrary(config={"lockTimeout": 5}) as library:
+        path = library.path()
+        storage = library.storage()
+
+        library.save({path + "/jump.anim": {}})
+        library.addPaths([path + "/walk.anim"])
+
+        # The compaction waits for the file lock held by this thread
+        with storage.lock():
+            thread = threading.Thread(target=storage.compact)
+            thread.start()
+            time.sleep(0.2)
+
+            t = time.time()
+            library.addPaths([path + "/run.anim"])
+            assert time.time() - t < 1, time.time() - t
+
+        thread.join(10)
+
+        assert not thread.is_alive()
+        assert not os.path.exists(storage.journalPath())
+        assert not os.path.exists(storage.compactingPath())
+        assert sorted(Library(path).read()) == [
+            path + "/jump.anim",
+            path + "/run.anim",
+            path + "/walk.anim",
+        ]
+
+
+def testJournal():
+    """Test that the changes are appended to the journal and replayed."""
+    with _testLibrary(config={"databaseJournalSize": 1024 * 1024}) as library:
+        path = library.path()
+        storage = library.storage()
+
+        storage.save({path + "/jump.anim": {"name": "jump"}})
+        storage.update({path + "/walk.anim": {"name": "walk"}})
+        storage.update({path + "/jump.anim": {"tags": ["hero"]}})
+        storage.remove([path + "/walk.anim"])
+        storage.rename(path + "/jump.anim", path + "/run.anim")
+
+        expected = {path + "/run.anim": {"name": "jump", "tags": ["hero"]}}
+
+        # The changes are only in the journal until it is compacted
+        assert storage.readJson() == {path + "/jump.anim": {"name": "jump"}}
+        assert studiolibrary.storage.JsonStorage(storage.path(), path).read() == expected
+
+        # A partial line from an interrupted write is ignored
+        with open(storage.journalPath(), "a") as f:
+            f.write('{"op": "update", "data": {"{root}/idle')
+
+        assert Library(path).read() == expected
+
+        # The next change is appended on a new line after the partial line
+        storage.update({path + "/idle.anim": {"name": "idle"}})
+        expected[path + "/idle.anim"] = {"name": "idle"}
+
+        assert Library(path).read() == expected
+
+        # Changes are appended to a new journal while the old one is compacted
+        os.rename(storage.journalPath(), storage.compactingPath())
+        storage.update({path + "/idle.anim": {"name": "idle2"}})
+        expected[path + "/idle.anim"] = {"name": "idle2"}
+
+        assert Library(path).read() == expected
+
+        storage.compact()
+
+        assert not os.path.exists(storage.compactingPath())
+        assert os.path.exists(storage.journalPath())
+        assert storage.readJson()[path + "/idle.anim"] == {"name": "idle"}
+        assert Library(path).read() == expected
+
+        storage.compact()
+
+        assert not os.path.exists(storage.journalPath())
+        assert storage.readJson() == expected
+
+    # The whole database is written when the journal is disabled
+    with _testLibrary(config={"databaseJournalSize": 0}) as library:
+        path = library.path()
+        storage = library.storage()
+
+        storage.save({path + "/jump.anim": {}})
+        storage.update({path + "/walk.anim": {}})
+        storage.rename(path + "/walk.anim", path + "/run.anim")
+
+        assert not os.path.exists(storage.journalPath())
+        assert sorted(storage.readJson()) == [path + "/jump.anim", path + "/run.anim"]
+
+
+def testBackgroundCompaction():
+    """Test that compacting on the background thread never loses changes."""
+    import threading
+
+    with _testLibrary(config={"databaseJournalSize": 512}) as library:
+        path = library.path()
+        storage = library.storage()
+
+        storage.save({})
+
+        def append(name):
+            for i in range(25):
+                storage.update({path + "/{0}{1}.anim".format(name, i): {"index": i}})
+
+        threads = [threading.Thread(target=append, args=(name,)) for name in "abcd"]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # The journal is compacted on a thread once it is too large
+        assert storage._compactThread is not None
+
+        storage._compactThread.join(10)
+
+        data = Library(path).read()
+        assert len(data) == 100, len(data)
+        assert data[path + "/d24.anim"] == {"index": 24}
+
+        storage.compact()
+
+        assert not os.path.exists(storage.journalPath())
+        assert not os.path.exists(storage.compactingPath())
+        assert storage.readJson() == data
+
+
+def testRenamePaths():
+    """Test that renaming a folder renames its nested items and their paths."""
+    configs = [
+        {},
+        {"databaseJournalSize": 0},
+        {"databasePath": "{root}/.studiolibrary/database.db"},
+        {"databaseShardDepth": 1},
+    ]
+
+    for config in configs:
+        with _testLibrary(config=config) as library:
+            path = library.path()
+
+            library.save({
+                path + "/Mario": {"folder": path},
+                path + "/Mario/Sub/jump.anim": {
+                    "folder": path + "/Mario/Sub",
+                    "refs": [path + "/Mario/walk.anim", {"path": path + "/Mario"}],
+                },
+                path + "/Mario/walk.anim": {"folder": path + "/Mario"},
+                path + "/Mario2/idle.anim": {"folder": path + "/Mario2"},
+                path + "/Luigi/run.anim": {"refs": [path + "/Mario/walk.anim"]},
+            })
+
+            library.renamePaths({
+                path + "/Mario": path + "/Peach/Mario",
+                path + "/Luigi/run.anim": path + "/Luigi/sprint.anim",
+            })
+
+            # The shards are only read when searching their folders
+            storage = Library(path).storage()
+            if config.get("databaseShardDepth"):
+                data = storage.readAll()
+            else:
+                data = storage.read()
+
+            assert sorted(data) == [
+                path + "/Luigi/sprint.anim",
+                path + "/Mario2/idle.anim",
+                path + "/Peach/Mario",
+                path + "/Peach/Mario/Sub/jump.anim",
+                path + "/Peach/Mario/walk.anim",
+            ], config
+
+            # The folder of the renamed folder itself is unchanged
+            assert data[path + "/Peach/Mario"]["folder"] == path
+            assert data[path + "/Peach/Mario/walk.anim"]["folder"] == path + "/Peach/Mario"
+            assert dict(data[path + "/Peach/Mario/Sub/jump.anim"]) == {
+                "folder": path + "/Peach/Mario/Sub",
+                "refs": [path + "/Peach/Mario/walk.anim", {"path": path + "/Peach/Mario"}],
+            }, config
+
+            # Paths from items outside the renamed folder are not renamed
+            assert data[path + "/Luigi/sprint.anim"]["refs"] == [path + "/Mario/walk.anim"]
+            assert data[path + "/Mario2/idle.anim"]["folder"] == path + "/Mario2"
+
+
+def testSqliteStorage():
+    """Test the upgrade, the generation and the transactions of the SQLite storage."""
+    import sqlite3
+    import threading
+
+    databasePath = "{root}/.studiolibrary/database.db"
+
+    with _testLibrary(config={"databasePath": databasePath, "databaseTimeout": 0.2}) as library:
+        path = library.path()
+        storage = library.storage()
+
+        # A version 0 database has the paths relative to the database file
+        os.makedirs(os.path.dirname(storage.path()))
+        connection = sqlite3.connect(storage.path())
+        connection.execute("CREATE TABLE items (path TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        connection.execute(
+            "INSERT INTO items (path, data) VALUES (?, ?)",
+            ("../../Mario/jump.anim", '{"folder": "../../Mario", "description": "../.."}'),
+        )
+        connection.commit()
+        connection.close()
+
+        itemPath = path + "/Mario/jump.anim"
+        expected = {itemPath: {"folder": path + "/Mario", "description": "../.."}}
+
+        assert storage.read() == expected, storage.read()
+
+        connection = sqlite3.connect(storage.path())
+        assert connection.execute("PRAGMA user_version").fetchone()[0] == storage.VERSION
+        assert connection.execute("SELECT path FROM items").fetchall() == [("{root}/Mario/jump.anim",)]
+        connection.close()
+
+        # Each write increments the generation but reading does not
+        generation = storage.version()[0]
+
+        storage.update({itemPath: {"name": "jump"}})
+        storage.remove([path + "/Mario/walk.anim"])
+        storage.rename(path + "/Mario", path + "/Luigi")
+        storage.read()
+
+        assert storage.version()[0] == generation + 3
+
+        try:
+            with storage.connect() as connection:
+                connection.execute("DELETE FROM items")
+                raise ValueError("Cannot save the item data")
+        except ValueError:
+            pass
+
+        # A failed write is rolled back without changing the generation
+        assert storage.version()[0] == generation + 3
+        assert sorted(storage.read()) == [path + "/Luigi/jump.anim"]
+
+        # Updating waits for the write lock before reading the rows
+        other = sqlite3.connect(storage.path(), isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        try:
+            storage.update({path + "/Luigi/jump.anim": {"tags": ["hero"]}})
+            assert False, "The update should wait for the write lock"
+        except sqlite3.OperationalError:
+            pass
+        finally:
+            other.execute("ROLLBACK")
+            other.close()
+
+        studiolibrary.config.set("databaseTimeout", 30)
+
+        # Concurrent updates of the same item are merged without losing fields
+        def update(name):
+            for i in range(20):
+                storage.update({path + "/Luigi/jump.anim": {name + str(i): i}})
+
+        threads = [threading.Thread(target=update, args=(name,)) for name in "ab"]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        itemData = storage.read()[path + "/Luigi/jump.anim"]
+        for name in "ab":
+            for i in range(20):
+                assert itemData[name + str(i)] == i, itemData
+        assert itemData["folder"] == path + "/Luigi"
+
+
+def testConcurrentUpdates():
+    """Test that updates by other users are found without the modified time."""
+    for extension in [".json", ".db"]:
+        databasePath = "{root}/.studiolibrary/database" + extension
+
+        with _testLibrary(config={"databasePath": databasePath}) as library:
+            path = library.path()
+
+            library.save({path + "/jump.anim": {}})
+            library.addPaths([path + "/walk.anim"])
+            library.read()
+
+            files = library.storage().files()
+            mtimes = [os.path.getmtime(f) if os.path.exists(f) else None for f in files]
+
+            # Another user updates the database within the same second
+            Library(path).addPaths([path + "/run.anim"])
+            for f, mtime in zip(files, mtimes):
+                if mtime is not None:
+                    os.utime(f, (mtime, mtime))
+
+            assert not library.isCurrent()
+
+            # The records are not updated in place when the database has changed
+            library.addPaths([path + "/idle.anim"])
+            library.removePaths([path + "/jump.anim"])
+
+            assert sorted(library.read()) == [
+                path + "/idle.anim",
+                path + "/run.anim",
+                path + "/walk.anim",
+            ], extension
+
+            assert library.isCurrent()
+
+
+def testWatchDatabase():
+    """Test that searching a watched database does not check the files."""
+    import time
+
+    with _testLibrary(config={"databaseWatchInterval": 10}) as library:
+        path = library.path()
+
+        app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+        module = "studiolibrary.libraryitem.LibraryItem"
+        data = {}
+
+        for i in range(10):
+            itemPath = "{0}/Mario/item{1}.anim".format(path, i)
+            data[itemPath] = {"name": "item{0}.anim".format(i), "__class__": module}
+
+        library.setWatchEnabled(True)
+        library.save(data)
+        library.search()
+
+        assert library.isWatching()
+        assert len(library.results()) == 10
+
+        # Searching again does not stat or resolve the database path
+        calls = []
+        stat = os.stat
+
+        def countStat(*args, **kwargs):
+            calls.append(args)
+            return stat(*args, **kwargs)
+
+        os.stat = countStat
+        try:
+            library.setSortBy(["name:dsc"])
+            library.search()
+        finally:
+            os.stat = stat
+
+        assert not calls, calls
+        assert not library.isDirty()
+
+        # Saving the item data in this library does not mark it dirty
+        library.saveItemData(library.results()[:1])
+        app.processEvents()
+        assert not library.isDirty()
+
+        # The changes saved by another library are seen once emitted
+        other = Library(path)
+        other.removePaths([path + "/Mario/item0.anim"])
+
+        end = time.time() + 5
+        while not library.isDirty() and time.time() < end:
+            app.processEvents()
+            time.sleep(0.01)
 
-    def removeQuery(self, name):
-        """
-        Remove the query with the given name.
-        
-        :type name: str 
-        """
-        if name in self._queries:
-            del self._queries[name]
+        library.search()
+        assert len(library.results()) == 9
 
-    def queryExists(self, name):
-        """
-        Check if the given query name exists.
-        
-        :type name: str
-        :rtype: bool 
-        """
-        return name in self._queries
+        # The version is still checked when the watcher is not notified
+        library._watcher.blockSignals(True)
+        studiolibrary.config.set("databaseWatchInterval", 0.1)
 
-    def search(self):
-        """Run a search using the queries added to this dataset."""
-        if not self.isSearchEnabled():
-            logger.debug('Search is disabled')
-            return
+        other.removePaths([path + "/Mario/item1.anim"])
+        library.search()
+        assert len(library.results()) == 9
 
-        t = time.time()
+        time.sleep(0.2)
+        assert library.isDirty()
 
-        logger.debug("Searching items")
+        library.search()
+        assert len(library.results()) == 8
 
-        self.searchStarted.emit()
 
-        self._results = self.findItems(self.queries())
+def testWalk():
+    """Test that walking the library matches the items and skips symlink loops."""
+    from studiolibrary.folderitem import FolderItem
 
-        self._groupedResults = self.groupItems(self._results, self.groupBy())
+    class AnimItem(studiolibrary.LibraryItem):
+        EXTENSION = ".anim"
 
-        self.searchFinished.emit()
+    class PoseItem(studiolibrary.LibraryItem):
+        EXTENSIONS = [".pose", ".pose.json"]
 
-        self._searchTime = time.time() - t
+    class SetItem(studiolibrary.LibraryItem):
+        @classmethod
+        def match(cls, path):
+            return path.endswith("_set")
 
-        self.searchTimeFinished.emit()
+    items = [AnimItem, PoseItem, SetItem, FolderItem]
 
-        logger.debug('Search time: %s', self._searchTime)
+    with _testLibrary(items=items, config={"ignorePaths": ["/."]}) as library:
+        path = library.path()
 
-    def results(self):
-        """
-        Return the items found after a search is ran.
-        
-        :rtype: list[Item] 
-        """
-        return self._results
+        extensions, suffixes, matchers = library.itemDispatchTable()
+        assert extensions == {".anim": (0, AnimItem), ".pose": (1, PoseItem)}, extensions
+        assert suffixes == [(1, ".pose.json", PoseItem)], suffixes
+        assert matchers == [(2, SetItem), (3, FolderItem)], matchers
 
-    def groupedResults(self):
-        """
-        Get the results grouped after a search is ran.
-        
-        :rtype: dict
-        """
-        return self._groupedResults
+        for name in ["Mario/jump.anim/nested.anim", "Mario/Sub", "Mario/.hidden"]:
+            os.makedirs(path + "/" + name)
 
-    def searchTime(self):
-        """
-        Return the time taken to run a search.
-        
-        :rtype: float 
-        """
-        return self._searchTime
+        for name in ["Mario/walk.pose", "Mario/idle.pose.json", "Mario/hero_set", "Mario/notes.txt"]:
+            with open(path + "/" + name, "w") as f:
+                f.write("")
 
-    def addItem(self, item):
-        """
-        Add the given item to the database.    
-    
-        :type item: studiolibrary.LibraryItem
-        :rtype: None 
-        """
-        self.saveItemData([item])
+        # The entry is matched by the item classes with the cached type
+        assert FolderItem.matchEntry(path + "/Mario", studiolibrary.scanDir(path)[0])
+        assert library.itemClassFromPath(path + "/Mario/notes.txt") is None
 
-    def addItems(self, items):
-        """
-        Add the given items to the database.
-        
-        :type items: list[studiolibrary.LibraryItem]
-        """
-        self.saveItemData(items)
+        expected = [
+            ("Mario", FolderItem),
+            ("Mario/Sub", FolderItem),
+            ("Mario/hero_set", SetItem),
+            ("Mario/idle.pose.json", PoseItem),
+            ("Mario/jump.anim", AnimItem),
+            ("Mario/walk.pose", PoseItem),
+        ]
 
-    def saveItemData(self, items, emitDataChanged=True):
-        """
-        Add the given items to the database.
+        # A symlink pointing back to a parent is found but not walked
+        if hasattr(os, "symlink"):
+            os.symlink(path, path + "/Mario/loop")
+            expected.append(("Mario/loop", FolderItem))
 
-        :type items: list[studiolibrary.LibraryItem]
-        :type emitDataChanged: bool
-        """
-        logger.debug("Save item data %s", items)
+        items_, dirs = library.listDirectory(path + "/Mario")
+        assert [(item.path(), type(item)) for item in items_] == [
+            (path + "/" + name, cls) for name, cls in sorted(expected[1:])
+        ]
 
-        data_ = self.read()
+        # The items that don't support nested items are not walked
+        assert sorted(root for root, ancestors in dirs) == sorted(
+            path + "/" + name for name, cls in expected if cls is FolderItem and name != "Mario"
+        )
 
-        for item in items:
-            path = item.path()
-            data = item.itemData()
-            data_.setdefault(path, {})
-            data_[path].update(data)
+        found = sorted(itemData["path"] for itemData in library.walker(path))
+        assert found == sorted(path + "/" + name for name, cls in expected), found
 
-        self.save(data_)
 
-        if emitDataChanged:
-            self.search()
-            self.dataChanged.emit()
+def testSync():
+    """Test that only the modified folders and items are read when syncing."""
+    from studiolibrary.folderitem import FolderItem
 
-    def addPaths(self, paths, data=None):
-        """
-        Add the given path and the given data to the database.    
-    
-        :type paths: list[str]
-        :type data: dict or None
-        :rtype: None 
-        """
-        data = data or {}
-        self.updatePaths(paths, data)
+    created = []
+    createItemData = FolderItem.createItemData
 
-    def updatePaths(self, paths, data):
-        """
-        Update the given paths with the given data in the database.
+    def countItemData(self):
+        created.append(self.path())
+        return createItemData(self)
 
-        :type paths: list[str]
-        :type data: dict
-        :rtype: None
-        """
-        data_ = self.read()
-        paths = studiolibrary.normPaths(paths)
+    def setModified(mtime):
+        for root, dirs, files in os.walk(path):
+            for name in dirs + files:
+                os.utime(os.path.join(root, name), (mtime, mtime))
+        os.utime(path, (mtime, mtime))
 
-        for path in paths:
-            if path in data_:
-                data_[path].update(data)
-            else:
-                data_[path] = data
+    def sync():
+        del created[:]
+        library.sync()
+        return sorted(created)
 
-        self.save(data_)
+    with _testLibrary(items=[FolderItem], config={"ignorePaths": ["/."]}) as library:
+        path = library.path()
 
-    def copyPath(self, src, dst):
-        """
-        Copy the given source path to the given destination path.
+        try:
+            FolderItem.createItemData = countItemData
 
-        :type src: str
-        :type dst: str
-        :rtype: str
-        """
-        self.addPaths([dst])
-        return dst
+            for name in ["walk", "idle"]:
+                studiolibrary.saveJson(path + "/Mario/" + name + "/.studiolibrary/metadata.json", {})
 
-    def renamePath(self, src, dst):
-        """
-        Rename the source path to the given name.
+            library.sync()
 
-        :type src: str
-        :type dst: str
-        :rtype: str
-        """
-        studiolibrary.renamePathInFile(self.databasePath(), src, dst)
-        self.setDirty(True)
-        return dst
+            # The folders modified within the resolution are listed again
+            setModified(time.time() - 60)
+            assert sync() == [path + "/Mario", path + "/Mario/idle", path + "/Mario/walk"]
+            assert sync() == []
+
+            # Editing the metadata doesn't change the modified time of the folders
+            metadataPath = path + "/Mario/walk/.studiolibrary/metadata.json"
+            studiolibrary.saveJson(metadataPath, {"description": "jump"})
+            os.utime(metadataPath, (time.time() - 30, time.time() - 30))
+
+            assert sync() == [path + "/Mario/walk"]
+            assert library.read()[path + "/Mario/walk"]["description"] == "jump"
+
+            # A new folder is found and checked again while it is recent
+            os.makedirs(path + "/Mario/run")
+            assert path + "/Mario/run" in sync()
+            assert path + "/Mario/run" in sync()
+
+            # Changing the ignored paths lists all the folders again
+            setModified(time.time() - 60)
+            library.sync()
+            studiolibrary.config.set("ignorePaths", ["/.", "/idle"])
+
+            assert sync() == [path + "/Mario", path + "/Mario/run", path + "/Mario/walk"]
+            assert path + "/Mario/idle" not in library.read()
+
+            # Forcing a sync creates the item data even if nothing has changed
+            setModified(time.time() - 60)
+            library.sync()
+
+            del created[:]
+            library.sync(force=True)
+            assert len(created) == 3, created
+        finally:
+            FolderItem.createItemData = createItemData
+
+
+def testLiveUpdate():
+    """Test that the folders created, renamed and removed on disc are synced."""
+    import time
+    import shutil
+
+    from studiolibrary.folderitem import FolderItem
+
+    created = []
+    createItemData = FolderItem.createItemData
+
+    def countItemData(self):
+        created.append(self.path())
+        return createItemData(self)
+
+    with _testLibrary(items=[FolderItem]) as library:
+        path = library.path()
+
+        try:
+            app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+            FolderItem.createItemData = countItemData
+
+            os.makedirs(path + "/Mario/walk")
+            os.makedirs(path + "/Mario/idle")
+
+            library.sync()
+            library.setLiveUpdateEnabled(True)
+            library.folderWatcher().setDelay(50)
+
+            changes = []
+            library.pathsAdded.connect(lambda paths: changes.append(("added", paths)))
+            library.pathsRemoved.connect(lambda paths: changes.append(("removed", paths)))
+
+            def wait(count):
+                end = time.time() + 5
+                while len(changes) < count and time.time() < end:
+                    app.processEvents()
+                    time.sleep(0.01)
+                return set(r.path() for r in library.records())
+
+            del created[:]
+            os.makedirs(path + "/Mario/jump")
+            os.rename(path + "/Mario/walk", path + "/Mario/run")
+            os.makedirs(path + "/Luigi/sit")
+
+            paths = wait(2)
+            assert path + "/Mario/walk" not in paths
+            assert set([
+                path + "/Mario/jump",
+                path + "/Mario/run",
+                path + "/Luigi",
+                path + "/Luigi/sit",
+            ]).issubset(paths), paths
+
+            # The item data is only created for the changed folders
+            assert sorted(created) == [
+                path + "/Luigi",
+                path + "/Luigi/sit",
+                path + "/Mario/jump",
+                path + "/Mario/run",
+            ], created
+
+            # The new folder is watched and removing it removes its children
+            os.makedirs(path + "/Luigi/wave")
+            assert path + "/Luigi/wave" in wait(3)
+
+            shutil.rmtree(path + "/Luigi")
+            paths = wait(4)
+            assert changes[-1] == ("removed", [
+                path + "/Luigi",
+                path + "/Luigi/sit",
+                path + "/Luigi/wave",
+            ]), changes[-1]
+            assert path + "/Mario/idle" in paths
+
+            library.setLiveUpdateEnabled(False)
+        finally:
+            FolderItem.createItemData = createItemData
+
+
+def testShards():
+    """Test that the shards are only read for the folders being searched."""
+    with _testLibrary(config={"databaseShardDepth": 0}) as library:
+        path = library.path()
+
+        folder = "studiolibrary.folderitem.FolderItem"
+        module = "studiolibrary.libraryitem.LibraryItem"
+        data = {}
+
+        for name in ["Mario", "Mario/Sub", "Luigi"]:
+            itemPath = path + "/" + name
+            data[itemPath] = {
+                "type": "Folder",
+                "folder": os.path.dirname(itemPath),
+                "__class__": folder,
+            }
+
+        for name in ["Mario/walk.anim", "Mario/Sub/jump.anim", "Luigi/idle.anim", "root.anim"]:
+            itemPath = path + "/" + name
+            data[itemPath] = {
+                "name": os.path.basename(itemPath),
+                "folder": os.path.dirname(itemPath),
+                "__class__": module,
+            }
+
+        # The existing database is split into shards
+        library.save(data)
+        studiolibrary.config.set("databaseShardDepth", 1)
+
+        library = Library(path)
+        storage = library.storage()
+
+        assert storage.shards() == ["", "Luigi", "Mario"]
+        assert not storage.loaded()
+
+        assert Library.queryFolders([{"filters": [("name", "is", "walk")]}]) is None
+        assert Library.queryFolders([{"filters": [("type", "is", "Folder")]}]) == []
+
+        # The folders for the sidebar are found without loading any shard
+        items = library.findItems([{"filters": [("type", "is", "Folder")]}])
+        assert len(items) == 3
+        assert not storage.loaded()
+
+        def selectFolder(name):
+            folderPath = path + "/" + name
+            library.addQuery({
+                "name": "sidebar",
+                "operator": "or",
+                "filters": [
+                    ("folder", "startswith", folderPath + "/"),
+                    ("folder", "is", folderPath),
+                ],
+            })
+            library.search()
+            return sorted(os.path.basename(item.path()) for item in library.results())
 
-    def removePath(self, path):
-        """
-        Remove the given path from the database.
+        assert selectFolder("Mario") == ["Sub", "jump.anim", "walk.anim"]
+        assert storage.loaded() == ["Mario"]
 
-        :type path: str
-        :rtype: None
-        """
-        self.removePaths([path])
+        # Saving an item in a shard that is not loaded does not load it
+        library.addPaths([path + "/Luigi/run.anim"], {
+            "folder": path + "/Luigi",
+            "__class__": module,
+        })
+        assert storage.loaded() == ["Mario"]
 
-    def removePaths(self, paths):
-        """
-        Remove the given paths from the database.
+        assert selectFolder("Luigi") == ["idle.anim", "run.anim"]
+        assert storage.loaded() == ["Luigi", "Mario"]
 
-        :type paths: list[str]
-        :rtype: None
-        """
-        data = self.read()
+        # Renaming a folder moves its items to another shard
+        library.removePaths([path + "/Mario/walk.anim"])
+        library.renamePath(path + "/Mario", path + "/Peach")
 
-        paths = studiolibrary.normPaths(paths)
+        assert storage.shards() == ["", "Luigi", "Peach"]
+        assert selectFolder("Peach") == ["Sub", "jump.anim"]
 
-        for path in paths:
-            if path in data:
-                del data[path]
+        # Searching without a folder loads all the shards
+        library.removeQuery("sidebar")
+        library.search()
 
-        self.save(data)
+        assert storage.loaded() == ["", "Luigi", "Peach"]
+        assert len(library.results()) == 7
 
-    @staticmethod
-    def match(data, queries):
-        """
-        Match the given data with the given queries.
-        
-        Examples:
-            
-            queries = [
-                {
-                    'operator': 'or',
-                    'filters': [
-                        ('folder', 'is' '/library/proj/test'),
-                        ('folder', 'startswith', '/library/proj/test'),
-                    ]
-                },
-                {
-                    'operator': 'and',
-                    'filters': [
-                        ('path', 'contains' 'test'),
-                        ('path', 'contains', 'run'),
-                    ]
-                }
-            ]
-            
-            print(library.find(queries))
-        """
-        matches = []
 
-        for query in queries:
+def testMoveLibrary():
+    """Test that the database paths are relative to the library root."""
+    import json
+    import shutil
 
-            filters = query.get('filters')
-            operator = query.get('operator', 'and')
+    for extension in [".json", ".db"]:
+        databasePath = "{root}/.studiolibrary/database" + extension
 
-            if not filters:
-                continue
+        with _testLibrary(config={"databasePath": databasePath}) as library:
+            path = library.path()
+            moved = path + "_moved"
 
-            match = False
+            library.save({path + "/Mario/jump.anim": {"folder": path + "/Mario"}})
+            library.addPaths([path + "/Mario/walk.anim"], {"folder": path + "/Mario"})
 
-            for key, cond, value in filters:
+            if extension == ".json":
+                with open(library.databasePath()) as f:
+                    assert path not in f.read()
 
-                if key == '*':
-                    itemValue = six.text_type(data)
-                else:
-                    itemValue = data.get(key)
+            shutil.move(path, moved)
+            try:
+                data = Library(moved).read()
+                assert sorted(data) == [moved + "/Mario/jump.anim", moved + "/Mario/walk.anim"], data
+                assert data[moved + "/Mario/jump.anim"]["folder"] == moved + "/Mario"
+            finally:
+                shutil.move(moved, path)
 
-                if isinstance(value, six.string_types):
-                    value = value.lower()
+    # The paths saved relative to the database by older versions
+    databasePath = "{root}/.studiolibrary/database.json"
 
-                if isinstance(itemValue, six.string_types):
-                    itemValue = itemValue.lower()
+    with _testLibrary(config={"databasePath": databasePath}) as library:
+        path = library.path()
 
-                if not itemValue:
-                    match = False
+        itemPath = path + "/Mario/jump.anim"
+        itemData = {"folder": path + "/Mario", "description": "../jump"}
 
-                elif cond == 'contains':
-                    match = value in itemValue
+        text = studiolibrary.relPath(json.dumps({itemPath: itemData}), library.databasePath())
+        studiolibrary.write(library.databasePath(), text)
 
-                elif cond == 'not_contains':
-                    match = value not in itemValue
+        # Only the path fields are resolved and not the other text
+        assert library.read() == {itemPath: itemData}, library.read()
 
-                elif cond == 'is':
-                    match = value == itemValue
+        metadataPath = studiolibrary.formatPath(
+            studiolibrary.config.get("metadataPath"), itemPath
+        )
+        metadata = {"mayaSceneFile": path + "/Mario/jump.ma", "description": "../.."}
 
-                elif cond == 'not':
-                    match = value != itemValue
+        text = studiolibrary.relPath(json.dumps(metadata), metadataPath)
+        studiolibrary.write(metadataPath, text)
 
-                elif cond == 'startswith':
-                    match = itemValue.startswith(value)
+        assert studiolibrary.LibraryItem(itemPath).readMetadata() == metadata
 
-                if operator == 'or' and match:
-                    break
+    # The paths in the metadata are saved relative to the item
+    with _testLibrary() as library:
+        path = library.path()
+        itemPath = path + "/Mario/jump.anim"
 
-                if operator == 'and' and not match:
-                    break
+        studiolibrary.LibraryItem(itemPath).saveMetadata({"icon": itemPath + "/thumbnail.jpg"})
+        shutil.move(path + "/Mario", path + "/Luigi")
 
-            matches.append(match)
+        metadata = studiolibrary.LibraryItem(path + "/Luigi/jump.anim").readMetadata()
+        assert metadata == {"icon": path + "/Luigi/jump.anim/thumbnail.jpg"}, metadata
 
-        return all(matches)
 
-    @staticmethod
-    def sorted(items, sortBy):
-        """
-        Return the given data sorted using the sortBy argument.
-        
-        Example:
-            data = [
-                {'name':'red', 'index':1},
-                {'name':'green', 'index':2},
-                {'name':'blue', 'index':3},
-            ]
-            
-            sortBy = ['index:asc', 'name']
-            # sortBy = ['index:dsc', 'name']
-            
-            print(sortedData(data, sortBy))
-            
-        :type items: list[Item]
-        :type sortBy: list[str]
-        :rtype: list[Item]
-        """
-        logger.debug('Sort by: %s', sortBy)
+def testFacets():
+    """Test that the facet counts match the items found by Library.match."""
+    with _testLibrary() as library:
+        path = library.path()
 
-        t = time.time()
+        module = "studiolibrary.libraryitem.LibraryItem"
+        data = {}
 
-        for field in reversed(sortBy):
+        for i in range(60):
+            folder = "{0}/Mario{1}".format(path, i % 3)
+            itemPath = "{0}/item{1}{2}".format(folder, i, [".anim", ".pose", ".set"][i % 4 % 3])
+            data[itemPath] = {
+                "name": "item{0}".format(i),
+                "path": itemPath,
+                "type": [".anim", ".pose", ".set"][i % 4 % 3],
+                "folder": folder,
+                "tags": ["hero"] if i % 5 else [],
+                "__class__": module,
+            }
 
-            tokens = field.split(':')
+        library.save(data)
+        library.addGlobalQuery({"name": "trash", "filters": [("path", "not_contains", "Trash")]})
 
-            reverse = False
-            if len(tokens) > 1:
-                field = tokens[0]
-                reverse = tokens[1] != 'asc'
+        def check(queries, fields=("type", "folder", "name")):
+            queries_ = copy.deepcopy(queries)
+            facets = library.facets(list(fields), queries)
+            assert queries == queries_, "The queries should not change"
 
-            def sortKey(item):
+            allQueries = queries + list(library._globalQueries.values())
 
-                default = False if reverse else ''
+            for field in fields:
+                expected = {}
+                for record in library.records():
+                    value = record.itemData().get(field)
+                    if value:
+                        expected.setdefault(value, 0)
+                        if library.match(record.itemData(), allQueries):
+                            expected[value] += 1
 
-                return item.itemData().get(field, default)
+                found = dict((f["name"], f["count"]) for f in facets[field])
+                assert found == expected, (field, found, expected)
 
-            items = sorted(items, key=sortKey, reverse=reverse)
+            return facets
 
-        logger.debug("Sort items took %s", time.time() - t)
+        check([])
+        check([{"filters": [("folder", "is", path + "/Mario1")]}])
+        check([{"operator": "or", "filters": [("folder", "is", path + "/mario1"), ("folder", "startswith", path + "/Mario2")]}])
+        check([{"filters": [("type", "not", ".set"), ("*", "contains", "item1")]}])
+        check([{"filters": [("tags", "contains", "hero")]}, {"filters": [("type", "is", ".anim")]}])
 
-        return items
+        facets = library.distinct("type", queries=[{"filters": [("folder", "is", path + "/Mario0")]}])
+        assert facets == [{"count": 10, "name": ".anim"}, {"count": 5, "name": ".pose"}, {"count": 5, "name": ".set"}], facets
 
-    @staticmethod
-    def groupItems(items, fields):
-        """
-        Group the given items by the given field.
+        # The index is updated with the changes saved by the library
+        assert library._facetIndex.hasField("type")
+        library.updatePaths([path + "/Mario0/item0.anim"], {"type": ".pose"})
+        library.removePaths([path + "/Mario0/item3.anim"])
 
-        :type items: list[Item]
-        :type fields: list[str]
-        :rtype: dict
-        """
-        logger.debug('Group by: %s', fields)
+        check([{"filters": [("folder", "is", path + "/Mario0")]}])
+        assert library._facetIndex.hasField("type")
 
-        # Only support for top level grouping at the moment.
-        if fields:
-            field = fields[0]
-        else:
-            return {'None': items}
 
-        t = time.time()
+def testCompileQueries():
+    """Test that the compiled queries match the same data as Library.match."""
+    import random
 
-        results_ = {}
-        tokens = field.split(':')
+    rand = random.Random(0)
 
-        reverse = False
-        if len(tokens) > 1:
-            field = tokens[0]
-            reverse = tokens[1] != 'asc'
+    values = ["red", "Red", "blue", "re", "", None, 3, "3", ["red", "blue"]]
+    conds = ["is", "not", "contains", "not_contains", "startswith"]
+    keys = ["name", "color", "*"]
 
-        for item in items:
-            value = item.itemData().get(field)
-            if value:
-                results_.setdefault(value, [])
-                results_[value].append(item)
+    items = []
+    for i in range(200):
+        data = {}
+        for key in ["name", "color"]:
+            value = rand.choice(values)
+            if value is not None:
+                data[key] = value
+        items.append(data)
 
-        groups = sorted(results_.keys(), reverse=reverse)
+    for i in range(500):
+        queries = []
 
-        results = collections.OrderedDict()
-        for group in groups:
-            results[group] = results_[group]
+        for j in range(rand.randint(0, 3)):
+            filters = []
+            for k in range(rand.randint(0, 3)):
+                filters.append((rand.choice(keys), rand.choice(conds), rand.choice(values[:4])))
 
-        logger.debug("Group Items Took %s", time.time() - t)
+            queries.append({
+                "operator": rand.choice(["and", "or"]),
+                "filters": filters,
+            })
 
-        return results
+        match = Library.compileQueries(queries)
+
+        for data in items:
+            try:
+                expected = Library.match(data, queries)
+            except (AttributeError, TypeError):
+                continue
+            assert match(data) == expected, (data, queries)
+
+
+def testSearchCache():
+    """Test that repeated searches are cached until the data changes."""
+    with _testLibrary() as library:
+        path = library.path()
+
+        module = "studiolibrary.libraryitem.LibraryItem"
+        data = {}
+
+        for i in range(20):
+            itemPath = "{0}/Mario{1}/item{2}.anim".format(path, i % 2, i)
+            data[itemPath] = {"folder": path + "/Mario" + str(i % 2), "__class__": module}
+
+        library.save(data)
+
+        def selectFolder(name):
+            library.addQuery({
+                "name": "sidebar",
+                "filters": [("folder", "is", path + "/" + name)],
+            })
+            library.search()
+            return library.results()
+
+        mario0 = selectFolder("Mario0")
+        mario1 = selectFolder("Mario1")
+
+        assert selectFolder("Mario0") is mario0
+        assert selectFolder("Mario1") is mario1
+        assert library.searchCacheStats()["hits"] == 2
+        assert library.searchCacheStats()["misses"] == 2
+
+        # Changing the sort order or the data misses the cache
+        library.setSortBy(["name:dsc"])
+        assert selectFolder("Mario1") is not mario1
+
+        library.saveItemData([mario1[0]])
+        assert selectFolder("Mario1") is not mario1
+
+        mario1 = selectFolder("Mario1")
+        assert library.searchCacheStats()["misses"] == 4
+
+        library.save(library.read())
+        assert selectFolder("Mario1") is not mario1
+        assert library.searchCacheStats()["misses"] == 5
 
 
 def testsuite():
 
+    testRecords()
+    testSearchCache()
+    testSearchText()
+    testRefinedSearch()
+    testAsyncSearch()
+    testPagedSearch()
+    testConcurrentUpdates()
+    testSqliteStorage()
+    testCompactWhileUpdating()
+    testJournal()
+    testBackgroundCompaction()
+    testRenamePaths()
+    testWatchDatabase()
+    testWalk()
+    testSync()
+    testLiveUpdate()
+    testShards()
+    testMoveLibrary()
+    testFacets()
+    testCompileQueries()
+
     data = [
         {'name': 'blue', 'index': 3},
         {'name': 'red', 'index': 1},
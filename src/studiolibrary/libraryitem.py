@@ -172,6 +172,20 @@ class LibraryItem(studiolibrary.widgets.Item):
 
         return False
 
+    @classmethod
+    def matchEntry(cls, path, entry):
+        """
+        Return True if the given directory entry is supported by the item.
+
+        This is called when walking the library so that items can use the
+        cached type information of the entry instead of calling stat.
+
+        :type path: str
+        :type entry: os.DirEntry
+        :rtype: bool
+        """
+        return cls.match(path)
+
     def __init__(
             self,
             path="",
@@ -575,12 +589,15 @@ class LibraryItem(studiolibrary.widgets.Item):
     def saveMetadata(self, metadata):
         """
         Save the given metadata to disc.
+
+        The paths inside the item are saved relative to the item so that
+        they are still valid after the item or the library has been moved.
         
         :type metadata: dict
         """
         formatString = studiolibrary.config.get('metadataPath')
         path = studiolibrary.formatPath(formatString, self.path())
-        studiolibrary.saveJson(path, metadata)
+        studiolibrary.saveJson(path, metadata, root=self.path())
         self.setMetadata(metadata)
         self.syncItemData(emitDataChanged=False)
         self.dataChanged.emit(self)
@@ -596,7 +613,10 @@ class LibraryItem(studiolibrary.widgets.Item):
             path = studiolibrary.formatPath(formatString, self.path())
 
             if os.path.exists(path):
-                self._metadata = studiolibrary.readJson(path)
+                metadata = studiolibrary.readJson(path, root=self.path())
+
+                # Older versions saved the paths relative to the metadata file
+                self._metadata = studiolibrary.resolveLegacyPaths(metadata, path)
             else:
                 self._metadata = {}
 
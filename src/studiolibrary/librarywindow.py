@@ -238,13 +238,20 @@ class LibraryWindow(QtWidgets.QWidget):
         self._sidebarWidgetVisible = True
         self._previewWidgetVisible = True
         self._statusBarWidgetVisible = True
+        self._pendingSelection = None
 
         # --------------------------------------------------------------------
         # Create Widgets
         # --------------------------------------------------------------------
 
         library = self.LIBRARY_CLASS(libraryWindow=self)
+        library.setSearchAsync(studiolibrary.config.get("searchAsync", False))
+        library.setSearchPageSize(studiolibrary.config.get("searchPageSize", 0))
+        library.setWatchEnabled(studiolibrary.config.get("databaseWatch", False))
+        library.setLiveUpdateEnabled(studiolibrary.config.get("liveUpdate", False))
         library.dataChanged.connect(self.refresh)
+        library.pathsAdded.connect(self._pathsChanged)
+        library.pathsRemoved.connect(self._pathsChanged)
         library.searchTimeFinished.connect(self._searchFinished)
 
         self._sidebarFrame = SidebarFrame(self)
@@ -258,6 +265,7 @@ class LibraryWindow(QtWidgets.QWidget):
         self._searchWidget = self.SEARCH_WIDGET_CLASS(self)
         self._searchWidget.setToolTip(tip)
         self._searchWidget.setStatusTip(tip)
+        self._searchWidget.setSearchDelay(studiolibrary.config.get("searchDelay", 0))
 
         self._sortByMenu = self.SORTBY_MENU_CLASS(self)
         self._groupByMenu = self.GROUPBY_MENU_CLASS(self)
@@ -335,8 +343,9 @@ class LibraryWindow(QtWidgets.QWidget):
         name = "Sync items"
         icon = studiolibrary.resource.icon("sync")
         icon.setColor(iconColor)
-        tip = "Sync with the filesystem"
-        self.addMenuBarAction(name, icon, tip, callback=self.sync)
+        tip = "Sync with the filesystem.\n" \
+              "CTRL + Click will rescan all the folders and items."
+        self.addMenuBarAction(name, icon, tip, callback=self._syncClicked)
 
         name = "Settings"
         icon = studiolibrary.resource.icon("settings")
@@ -434,6 +443,13 @@ class LibraryWindow(QtWidgets.QWidget):
     def _searchFinished(self):
         self.showRefreshMessage()
 
+        # Select the paths that were selected while the search was running
+        paths = self._pendingSelection
+        if paths is not None:
+            self._pendingSelection = None
+            self.selectPaths(paths)
+            self.scrollToSelectedItem()
+
     def _foldersMenuRequested(self, menu):
         """
         Triggered when the folders settings menu has been requested.
@@ -706,10 +722,26 @@ class LibraryWindow(QtWidgets.QWidget):
         self._refreshEnabled = enable
 
     @studioqt.showWaitCursor
-    def sync(self):
+    def _syncClicked(self):
+        """Triggered when the user clicks the sync action in the menu bar."""
+        self.sync(force=studioqt.isControlModifier())
+
+    def rescan(self):
+        """
+        Sync all the folders and items even if they haven't been modified.
+
+        :rtype: None
+        """
+        self.sync(force=True)
+
+    def sync(self, force=False):
         """
         Sync any data that might be out of date with the model. 
         
+        Only the folders and items that have been modified since the last
+        sync are read again unless force is True.
+
+        :type force: bool
         :rtype: None 
         """
         progressBar = self.statusWidget().progressBar()
@@ -717,7 +749,7 @@ class LibraryWindow(QtWidgets.QWidget):
         @studioqt.showWaitCursor
         def _sync():
             elapsedTime = time.time()
-            self.library().sync(progressCallback=self.setProgressBarValue)
+            self.library().sync(progressCallback=self.setProgressBarValue, force=force)
 
             elapsedTime = time.time() - elapsedTime
 
@@ -746,6 +778,7 @@ class LibraryWindow(QtWidgets.QWidget):
         progressBar.setValue(value)
         progressBar.setText(label)
 
+    @studiolibrary.metrics.timed("window.refresh")
     def refresh(self):
         """
         Refresh all sidebar items and library items.
@@ -755,6 +788,19 @@ class LibraryWindow(QtWidgets.QWidget):
         if self.isRefreshEnabled():
             self.update()
 
+    def _pathsChanged(self, paths):
+        """
+        Triggered when the live update has added or removed items.
+
+        Only the folders and the current search are updated instead of
+        refreshing the whole window.
+
+        :type paths: list[str]
+        """
+        if self.isRefreshEnabled():
+            self.updateSidebar()
+            self.library().search()
+
     def update(self):
         """Update the library widget and the data. """
         self.refreshSidebar()
@@ -822,6 +868,7 @@ class LibraryWindow(QtWidgets.QWidget):
 
         self.updateSidebar()
 
+    @studiolibrary.metrics.timed("window.updateSidebar")
     def updateSidebar(self):
         """
         Update the folders to be shown in the folders widget.
@@ -895,9 +942,17 @@ class LibraryWindow(QtWidgets.QWidget):
         """
         Select items with the given paths.
 
+        When the search is running on a worker thread the items are
+        selected after the results have been shown.
+
         :type paths: list[str]
         :rtype: None
         """
+        if self.library().isSearching():
+            self._pendingSelection = list(paths)
+            return
+
+        self._pendingSelection = None
         selection = self.selectedItems()
 
         self.clearPreviewWidget()
@@ -1233,6 +1288,9 @@ class LibraryWindow(QtWidgets.QWidget):
         action.triggered.connect(self.sync)
         action.setIcon(icon)
 
+        action = menu.addAction("Rescan All")
+        action.triggered.connect(self.rescan)
+
         menu.addSeparator()
         action = menu.addAction("Settings")
         action.triggered.connect(self.showSettingDialog)
@@ -2418,7 +2476,7 @@ class LibraryWindow(QtWidgets.QWidget):
 
     def showRefreshMessage(self):
         """Show how long the current refresh took."""
-        itemCount = len(self.library().results())
+        itemCount = self.library().resultCount()
         elapsedTime = self.library().searchTime()
 
         plural = ""
@@ -2429,6 +2487,13 @@ class LibraryWindow(QtWidgets.QWidget):
         msg = msg.format(itemCount, plural, elapsedTime)
         self.statusWidget().showInfoMessage(msg)
 
+        # Show how long each stage of the search took in debug mode
+        toolTip = ""
+        if self.isDebug():
+            toolTip = studiolibrary.metrics.summary("search")
+
+        self.statusWidget().setToolTip(toolTip)
+
         logger.debug(msg)
 
     def showInfoDialog(self, title, text):
@@ -0,0 +1,455 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import time
+import uuid
+import errno
+import random
+import socket
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import studiolibrary
+
+
+__all__ = [
+    "FileLock",
+    "LockError",
+]
+
+logger = logging.getLogger(__name__)
+
+
+_held = threading.local()
+
+
+class LockError(IOError):
+    """Raised when a lock cannot be acquired before the timeout."""
+
+
+class FileLock(object):
+    """
+    A cross process lock for writing to a file shared by many users.
+
+    The lock is held by exclusively creating a lease file next to the
+    given path. The lease contains the pid, host and time of the owner so
+    that a lock left behind by a crashed process can be broken. Where
+    fcntl is available the lease is also locked with an advisory lock,
+    which the system releases when the owner dies.
+
+    The lock is reentrant for the same thread.
+
+    Example:
+        with FileLock("P:/Library/.studiolibrary/database.json"):
+            data = studiolibrary.readJson(path)
+            data["P:/Library/jump.anim"] = {}
+            studiolibrary.saveJson(path, data)
+    """
+
+    def __init__(self, path, timeout=None, staleTimeout=None):
+        """
+        :type path: str
+        :type timeout: float or None
+        :type staleTimeout: float or None
+        """
+        if timeout is None:
+            timeout = studiolibrary.config.get("lockTimeout")
+
+        if staleTimeout is None:
+            staleTimeout = studiolibrary.config.get("lockStaleTimeout")
+
+        self._path = studiolibrary.normPath(path) + ".lock"
+        self._timeout = 30 if timeout is None else timeout
+        self._staleTimeout = 120 if staleTimeout is None else staleTimeout
+        self._fd = None
+        self._token = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def path(self):
+        """
+        Get the path of the lease file.
+
+        :rtype: str
+        """
+        return self._path
+
+    def _depths(self):
+        """
+        Get the lock depths for the current thread.
+
+        :rtype: dict
+        """
+        if not hasattr(_held, "depths"):
+            _held.depths = {}
+        return _held.depths
+
+    def acquire(self):
+        """
+        Wait until the lock has been acquired.
+
+        The wait time is doubled after each attempt up to one second.
+
+        :raises: LockError
+        """
+        depths = self._depths()
+        if depths.get(self.path()):
+            depths[self.path()] += 1
+            return
+
+        dirname = os.path.dirname(self.path())
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        interval = 0.01
+        start = time.time()
+
+        while not self._tryAcquire():
+            if time.time() - start > self._timeout:
+                msg = u'Timed out waiting for the lock "{0}" held by {1}'
+                msg = msg.format(self.path(), self.owner())
+                raise LockError(msg)
+
+            time.sleep(interval * random.uniform(0.5, 1.5))
+            interval = min(interval * 2, 1.0)
+
+        depths[self.path()] = 1
+
+    def release(self):
+        """Release the lock and remove the lease file."""
+        depths = self._depths()
+        depth = depths.get(self.path(), 0)
+
+        if depth > 1:
+            depths[self.path()] = depth - 1
+            return
+
+        depths.pop(self.path(), None)
+
+        if self._fd is None:
+            return
+
+        # Only remove the lease if it is still ours
+        if self.owner().get("token") == self._token:
+            studiolibrary.utils.silentRemove(self.path())
+
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+        os.close(self._fd)
+        self._fd = None
+        self._token = None
+
+    def owner(self):
+        """
+        Get the lease of the current owner of the lock.
+
+        :rtype: dict
+        """
+        return _readLease(self.path())
+
+    def _tryAcquire(self):
+        """
+        Try to create the lease file once.
+
+        :rtype: bool
+        """
+        flags = os.O_CREAT | os.O_EXCL | os.O_WRONLY
+
+        try:
+            fd = os.open(self.path(), flags)
+        except OSError as error:
+            if error.errno not in (errno.EEXIST, errno.EACCES):
+                raise
+
+            try:
+                stat = os.stat(self.path())
+            except OSError:
+                return False
+
+            owner = self.owner()
+            if self._isStale(stat, owner):
+                self._breakLock(stat, owner)
+
+            return False
+
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        self._token = str(uuid.uuid4())
+
+        lease = {
+            "pid": os.getpid(),
+            "host": socket.gethostname(),
+            "user": studiolibrary.user(),
+            "time": time.time(),
+            "token": self._token,
+        }
+
+        os.write(fd, json.dumps(lease).encode("utf-8"))
+        os.fsync(fd)
+
+        self._fd = fd
+        return True
+
+    def _isHeld(self, stat):
+        """
+        Check if the advisory lock on the given lease is held by its owner.
+
+        Returns None when it cannot be checked, such as when fcntl is not
+        available or the file system doesn't support advisory locks.
+
+        :type stat: os.stat_result
+        :rtype: bool or None
+        """
+        if not fcntl:
+            return None
+
+        try:
+            fd = os.open(self.path(), os.O_RDONLY)
+        except OSError:
+            return True
+
+        try:
+            # The lease was replaced after it was checked
+            if not _isSameFile(stat, os.fstat(fd)):
+                return True
+
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            return False
+        except (IOError, OSError) as error:
+            if error.errno in (errno.EAGAIN, errno.EACCES, errno.EWOULDBLOCK):
+                return True
+            return None
+        finally:
+            os.close(fd)
+
+    def _isStale(self, stat, owner):
+        """
+        Check if the given lease was left behind by a process that died.
+
+        The advisory lock is released by the system when the owner dies,
+        so it is checked first. The age of the lease is only used when
+        the advisory lock and the owner process cannot be checked.
+
+        :type stat: os.stat_result
+        :type owner: dict
+        :rtype: bool
+        """
+        age = time.time() - stat.st_mtime
+
+        # Give the owner time to write the lease after creating the file
+        if age < 1.0:
+            return False
+
+        held = self._isHeld(stat)
+        if held is not None:
+            return not held
+
+        if owner.get("host") == socket.gethostname() and owner.get("pid"):
+            return not _isProcessRunning(owner["pid"])
+
+        return age > self._staleTimeout
+
+    def _breakLock(self, stat, owner):
+        """
+        Remove the given lease file of an owner that is no longer running.
+
+        :type stat: os.stat_result
+        :type owner: dict
+        """
+        stale = "{0}.{1}.stale".format(self.path(), uuid.uuid4())
+
+        # Rename before removing so only one process breaks the lock
+        try:
+            os.rename(self.path(), stale)
+        except OSError:
+            return
+
+        # Another process could have broken the lock and acquired it
+        # again after the lease was checked, so put it back if it changed
+        try:
+            same = _isSameFile(stat, os.stat(stale)) and _readLease(stale) == owner
+        except OSError:
+            same = False
+
+        if not same:
+            try:
+                os.link(stale, self.path())
+            except (AttributeError, OSError):
+                logger.warning(u'Cannot restore the lock "%s"', self.path())
+            studiolibrary.utils.silentRemove(stale)
+            return
+
+        logger.warning(u'Broke the stale lock "%s" held by %s', self.path(), owner)
+        studiolibrary.utils.silentRemove(stale)
+
+
+def _readLease(path):
+    """
+    Read the lease saved at the given path.
+
+    :type path: str
+    :rtype: dict
+    """
+    try:
+        with open(path) as f:
+            return json.loads(f.read() or "{}")
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def _isSameFile(stat1, stat2):
+    """
+    Check if the given stats are for the same file and contents.
+
+    :type stat1: os.stat_result
+    :type stat2: os.stat_result
+    :rtype: bool
+    """
+    return (
+        stat1.st_dev == stat2.st_dev and
+        stat1.st_ino == stat2.st_ino and
+        stat1.st_mtime == stat2.st_mtime
+    )
+
+
+def _isProcessRunning(pid):
+    """
+    Check if a process with the given pid is running on this host.
+
+    :type pid: int
+    :rtype: bool
+    """
+    if studiolibrary.isWindows():
+        return True
+
+    try:
+        os.kill(pid, 0)
+    except OSError as error:
+        return error.errno == errno.EPERM
+
+    return True
+
+
+def _stressWorker(path, worker, count):
+    """Add unique items to the database from a separate process."""
+    library = studiolibrary.Library(path)
+
+    for i in range(count):
+        itemPath = "{0}/worker{1}_{2}.anim".format(path, worker, i)
+
+        if i % 2:
+            library.addPaths([itemPath], {"worker": worker})
+        else:
+            data = library.read()
+            data[itemPath] = {"worker": worker}
+            library.save(data)
+
+
+def testStress(processes=8, count=20):
+    """
+    Test that concurrent writers from many processes never lose an update.
+
+    :type processes: int
+    :type count: int
+    """
+    import shutil
+    import tempfile
+    import multiprocessing
+
+    path = studiolibrary.normPath(tempfile.mkdtemp())
+    try:
+        workers = [
+            multiprocessing.Process(target=_stressWorker, args=(path, i, count))
+            for i in range(processes)
+        ]
+
+        for worker in workers:
+            worker.start()
+
+        for worker in workers:
+            worker.join()
+            assert worker.exitcode == 0, "A worker failed to write"
+
+        data = studiolibrary.Library(path).read()
+
+        expected = processes * count
+        msg = "Lost {0} of {1} updates".format(expected - len(data), expected)
+        assert len(data) == expected, msg
+    finally:
+        shutil.rmtree(path)
+
+
+def testStaleLock():
+    """Test that only a lease whose owner is no longer running is broken."""
+    import shutil
+    import tempfile
+
+    path = studiolibrary.normPath(tempfile.mkdtemp()) + "/database.json"
+    errors = []
+
+    def acquire():
+        lock = FileLock(path, timeout=0.5, staleTimeout=0)
+        try:
+            with lock:
+                pass
+        except LockError as error:
+            errors.append(error)
+
+    def acquireInThread():
+        # The lock is reentrant for the same thread
+        del errors[:]
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        thread.join()
+        return not errors
+
+    try:
+        old = time.time() - 60
+
+        # An old lease is not broken while the owner holds the advisory lock
+        with FileLock(path) as lock:
+            os.utime(lock.path(), (old, old))
+            assert not acquireInThread()
+
+        # A lease left behind by a process that died is broken
+        with open(path + ".lock", "w") as f:
+            f.write(json.dumps({"host": "unknown", "pid": 0}))
+        os.utime(path + ".lock", (old, old))
+
+        assert acquireInThread()
+        assert not os.path.exists(path + ".lock")
+    finally:
+        shutil.rmtree(os.path.dirname(path))
+
+
+def testsuite():
+    testStaleLock()
+    testStress()
+
+
+if __name__ == "__main__":
+    testsuite()
@@ -0,0 +1,223 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import time
+import logging
+
+import studiolibrary
+
+
+__all__ = [
+    "Manifest",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class Manifest(object):
+    """
+    A persistent record of the directories visited when syncing a library.
+
+    Each directory entry holds the modified time of the directory, the names
+    that matched an item, the stamps of those items and the names of the
+    sub directories to walk. When the modified time of a directory has not
+    changed the entry can be used instead of listing the directory, and the
+    item data is only created again for the items whose stamp has changed.
+
+    The manifest is saved with a key for the configuration used when
+    walking, such as the registered items and the ignored paths. When the
+    key has changed all the directories are listed again.
+
+    Example:
+        {
+            "key": "5d41402abc4b2a76b9719d911017c592",
+            "dirs": {
+                "{root}/Characters": {
+                    "mtime": 1592469832.26,
+                    "items": ["jump.anim", "Mario"],
+                    "stamps": {"jump.anim": [1592469832.26, 1592469840.1]},
+                    "dirs": ["Mario"],
+                }
+            }
+        }
+    """
+
+    # The coarsest modified time resolution of the supported file systems.
+    # A directory modified within this time of being listed could still be
+    # changed without changing its modified time. eg: FAT and some network
+    # shares only store the modified time in steps of two seconds.
+    RESOLUTION = 2.0
+
+    def __init__(self, path, root=None, key=""):
+        """
+        :type path: str
+        :type root: str or None
+        :type key: str
+        """
+        self._path = path
+        self._key = key
+
+        # The manifest is saved in a folder below the root by default.
+        # eg: {root}/.studiolibrary/manifest.json
+        if root is None:
+            root = os.path.dirname(os.path.dirname(path))
+
+        self._root = studiolibrary.normPath(root)
+        self._data = None
+        self._visited = {}
+
+    def path(self):
+        """
+        Get the location of the manifest on disc.
+
+        :rtype: str
+        """
+        return self._path
+
+    def root(self):
+        """
+        Get the root folder that the directories are saved relative to.
+
+        :rtype: str
+        """
+        return self._root
+
+    def key(self):
+        """
+        Get the key for the configuration used when walking the library.
+
+        :rtype: str
+        """
+        return self._key
+
+    def data(self):
+        """
+        Get the directory entries from the last saved manifest.
+
+        The entries are ignored when the manifest was saved with a
+        different key or by an older version.
+
+        :rtype: dict
+        """
+        if self._data is None:
+            self._data = {}
+            try:
+                data = json.loads(studiolibrary.read(self.path()) or "{}")
+                if data.get("key") == self._key and "dirs" in data:
+                    self._data = self.decode(data["dirs"])
+            except Exception:
+                logger.exception('Cannot read the manifest "%s"', self.path())
+
+        return self._data
+
+    def get(self, path, mtime):
+        """
+        Get the entry for the given directory if it has not changed.
+
+        :type path: str
+        :type mtime: float
+        :rtype: dict or None
+        """
+        entry = self.data().get(path)
+
+        if entry and entry.get("mtime") is not None and entry.get("mtime") == mtime:
+            return entry
+
+        return None
+
+    def isRacy(self, mtime, now):
+        """
+        Check if the given modified time is too close to now to be trusted.
+
+        :type mtime: float
+        :type now: float
+        :rtype: bool
+        """
+        return abs(now - mtime) < self.RESOLUTION
+
+    def set(self, path, mtime, items, dirs, stamps=None):
+        """
+        Set the entry for the given directory visited during the current sync.
+
+        Modified times that are too close to now are not saved so that
+        the directory and the items are checked again on the next sync.
+
+        :type path: str
+        :type mtime: float
+        :type items: list[str]
+        :type dirs: list[str]
+        :type stamps: dict or None
+        """
+        now = time.time()
+        stamps = stamps or {}
+
+        if self.isRacy(mtime, now):
+            mtime = None
+
+        for name, stamp in stamps.items():
+            if any(value is not None and self.isRacy(value, now) for value in stamp):
+                stamps[name] = None
+
+        self._visited[path] = {
+            "mtime": mtime,
+            "items": items,
+            "stamps": stamps,
+            "dirs": dirs,
+        }
+
+    def save(self):
+        """
+        Save the directories visited during the current sync to disc.
+
+        Directories that were not visited have been removed or are no
+        longer walked, so they are not kept in the manifest.
+        """
+        data = {
+            "key": self._key,
+            "dirs": self.encode(self._visited),
+        }
+
+        studiolibrary.saveJson(self.path(), data)
+        self._data = self._visited
+        self._visited = {}
+
+    def encode(self, data):
+        """
+        Get the given directory entries with the directories relative to the root.
+
+        :type data: dict
+        :rtype: dict
+        """
+        return dict(
+            (studiolibrary.encodePath(path, self._root), entry)
+            for path, entry in data.items()
+        )
+
+    def decode(self, data):
+        """
+        Get the given directory entries with the absolute directories.
+
+        :type data: dict
+        :rtype: dict
+        """
+        return dict(
+            (studiolibrary.decodePath(path, self._root, start=self.path()), entry)
+            for path, entry in data.items()
+        )
+
+    def clear(self):
+        """Remove the manifest from disc so that the next sync walks everything."""
+        studiolibrary.utils.silentRemove(self.path())
+        self._data = {}
+        self._visited = {}
@@ -0,0 +1,578 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import time
+import bisect
+import logging
+import functools
+import threading
+import contextlib
+import collections
+
+
+__all__ = [
+    "Histogram",
+    "Metrics",
+    "registry",
+    "increment",
+    "record",
+    "timer",
+    "timed",
+    "mark",
+    "breakdown",
+    "summary",
+    "saveTrace",
+]
+
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram(object):
+    """
+    Count the values recorded for a metric in buckets of increasing size.
+
+    The buckets are the upper bounds in seconds, so the distribution of
+    the times is kept without keeping every value.
+    """
+
+    BOUNDS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+    def __init__(self):
+        self._counts = [0] * (len(self.BOUNDS) + 1)
+        self._count = 0
+        self._total = 0.0
+        self._min = None
+        self._max = None
+        self._last = None
+
+    def add(self, value):
+        """
+        Add the given value to the histogram.
+
+        :type value: float
+        """
+        self._counts[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self._count += 1
+        self._total += value
+        self._last = value
+
+        if self._min is None or value < self._min:
+            self._min = value
+
+        if self._max is None or value > self._max:
+            self._max = value
+
+    def count(self):
+        """
+        :rtype: int
+        """
+        return self._count
+
+    def total(self):
+        """
+        :rtype: float
+        """
+        return self._total
+
+    def mean(self):
+        """
+        :rtype: float
+        """
+        return self._total / self._count if self._count else 0.0
+
+    def min(self):
+        """
+        :rtype: float or None
+        """
+        return self._min
+
+    def max(self):
+        """
+        :rtype: float or None
+        """
+        return self._max
+
+    def last(self):
+        """
+        :rtype: float or None
+        """
+        return self._last
+
+    def buckets(self):
+        """
+        Get the number of values up to each bound.
+
+        The last bucket has no bound and is keyed by None.
+
+        :rtype: list[(float or None, int)]
+        """
+        return list(zip(self.BOUNDS + (None,), self._counts))
+
+    def data(self):
+        """
+        Get the values of the histogram as a dict that can be saved as JSON.
+
+        :rtype: dict
+        """
+        return {
+            "count": self._count,
+            "total": self._total,
+            "mean": self.mean(),
+            "min": self._min,
+            "max": self._max,
+            "last": self._last,
+            "buckets": self.buckets(),
+        }
+
+
+class Metrics(object):
+    """
+    A registry of the counters and the timing histograms for each stage.
+
+    The time of every stage is also kept as a span in a fixed size
+    buffer, which can be saved as a Chrome trace and used for showing
+    how long each stage took since a mark, such as the start of the
+    last search. Metrics can be recorded from any thread.
+
+    Example:
+        metrics = Metrics()
+
+        with metrics.timer("library.read"):
+            data = storage.read()
+
+        metrics.increment("library.read.items", len(data))
+        metrics.saveTrace("/tmp/trace.json")
+    """
+
+    # The number of spans kept for the trace and the breakdown
+    MAX_SPANS = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._enabled = True
+        self._counters = collections.OrderedDict()
+        self._histograms = collections.OrderedDict()
+        self._spans = collections.deque(maxlen=self.MAX_SPANS)
+        self._marks = {}
+
+    def setEnabled(self, enabled):
+        """
+        Enable or disable recording the metrics.
+
+        :type enabled: bool
+        """
+        self._enabled = enabled
+
+    def isEnabled(self):
+        """
+        :rtype: bool
+        """
+        return self._enabled
+
+    def reset(self):
+        """Remove all the counters, histograms, spans and marks."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._spans.clear()
+            self._marks.clear()
+
+    def increment(self, name, value=1):
+        """
+        Add the given value to the counter with the given name.
+
+        :type name: str
+        :type value: int
+        """
+        if not self._enabled:
+            return
+
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def record(self, name, seconds, start=None):
+        """
+        Add the given time to the histogram with the given name.
+
+        :type name: str
+        :type seconds: float
+        :type start: float or None
+        """
+        if not self._enabled:
+            return
+
+        if start is None:
+            start = time.time() - seconds
+
+        thread = threading.current_thread()
+
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+
+            histogram.add(seconds)
+            self._spans.append((name, start, seconds, thread.ident, thread.name))
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """
+        Record the time taken by the code in the with statement.
+
+        Example:
+            with metrics.timer("library.sync"):
+                library.sync()
+
+        :type name: str
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(name, time.time() - start, start)
+
+    def timed(self, name):
+        """
+        Return a decorator that records the time taken by the function.
+
+        :type name: str
+        :rtype: func
+        """
+        def decorator(func):
+
+            @functools.wraps(func)
+            def wrapped(*args, **kwargs):
+                start = time.time()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(name, time.time() - start, start)
+
+            return wrapped
+
+        return decorator
+
+    def mark(self, name):
+        """
+        Keep the current time with the given name.
+
+        :type name: str
+        """
+        self._marks[name] = time.time()
+
+    def counter(self, name):
+        """
+        Get the value of the counter with the given name.
+
+        :type name: str
+        :rtype: int
+        """
+        return self._counters.get(name, 0)
+
+    def counters(self):
+        """
+        Get the value of each counter.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return dict(self._counters)
+
+    def histogram(self, name):
+        """
+        Get the histogram with the given name.
+
+        :type name: str
+        :rtype: Histogram or None
+        """
+        return self._histograms.get(name)
+
+    def histograms(self):
+        """
+        Get the histogram for each stage.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return dict(self._histograms)
+
+    def spans(self):
+        """
+        Get the name, start, duration, thread id and thread name of the spans.
+
+        :rtype: list[tuple]
+        """
+        with self._lock:
+            return list(self._spans)
+
+    def data(self):
+        """
+        Get all the counters and histograms as a dict that can be saved as JSON.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "histograms": dict(
+                    (name, histogram.data()) for name, histogram in self._histograms.items()
+                ),
+            }
+
+    def breakdown(self, since=None):
+        """
+        Get the total time and the number of spans for each stage.
+
+        The stages are in the order they started. Only the spans that
+        started after the given mark or time are used.
+
+        Example:
+            metrics.mark("search")
+            library.search()
+            print(metrics.breakdown("search"))
+            # [('library.search', 0.012, 1), ('library.sorted', 0.004, 3)]
+
+        :type since: str or float or None
+        :rtype: list[(str, float, int)]
+        """
+        if not isinstance(since, (int, float)):
+            since = self._marks.get(since, 0) if since else 0
+
+        stages = collections.OrderedDict()
+
+        spans = sorted(self.spans(), key=lambda span: span[1])
+
+        for name, start, seconds, threadId, threadName in spans:
+            if start >= since:
+                total, count = stages.get(name, (0.0, 0))
+                stages[name] = (total + seconds, count + 1)
+
+        return [(name, total, count) for name, (total, count) in stages.items()]
+
+    def summary(self, since=None):
+        """
+        Get the breakdown as text with a line for each stage.
+
+        :type since: str or float or None
+        :rtype: str
+        """
+        lines = []
+
+        for name, total, count in self.breakdown(since):
+            line = u"{0}: {1:.1f} ms".format(name, total * 1000)
+            if count > 1:
+                line += u" ({0} calls)".format(count)
+            lines.append(line)
+
+        return u"\n".join(lines)
+
+    def trace(self):
+        """
+        Get the spans as events in the Chrome trace event format.
+
+        The trace can be opened with chrome://tracing or Perfetto.
+
+        :rtype: dict
+        """
+        pid = os.getpid()
+        events = []
+        threads = {}
+
+        for name, start, seconds, threadId, threadName in self.spans():
+            threads[threadId] = threadName
+            events.append({
+                "name": name,
+                "cat": name.split(".")[0],
+                "ph": "X",
+                "ts": start * 1000000,
+                "dur": seconds * 1000000,
+                "pid": pid,
+                "tid": threadId,
+            })
+
+        for threadId, threadName in threads.items():
+            events.append({
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": threadId,
+                "args": {"name": threadName},
+            })
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def saveTrace(self, path):
+        """
+        Save the spans to the given path as a Chrome trace.
+
+        :type path: str
+        """
+        with open(path, "w") as f:
+            json.dump(self.trace(), f)
+
+        logger.info(u'Saved the trace to "%s"', path)
+
+
+_registry = Metrics()
+
+
+def registry():
+    """
+    Get the metrics registry used by the library and the widgets.
+
+    :rtype: Metrics
+    """
+    return _registry
+
+
+def increment(name, value=1):
+    """
+    Add the given value to the counter with the given name.
+
+    :type name: str
+    :type value: int
+    """
+    _registry.increment(name, value)
+
+
+def record(name, seconds, start=None):
+    """
+    Add the given time to the histogram with the given name.
+
+    :type name: str
+    :type seconds: float
+    :type start: float or None
+    """
+    _registry.record(name, seconds, start)
+
+
+def timer(name):
+    """
+    Record the time taken by the code in the with statement.
+
+    :type name: str
+    """
+    return _registry.timer(name)
+
+
+def timed(name):
+    """
+    Return a decorator that records the time taken by the function.
+
+    Example:
+        @studiolibrary.metrics.timed("library.sync")
+        def sync(self):
+            ...
+
+    :type name: str
+    :rtype: func
+    """
+    return _registry.timed(name)
+
+
+def mark(name):
+    """
+    Keep the current time with the given name.
+
+    :type name: str
+    """
+    _registry.mark(name)
+
+
+def breakdown(since=None):
+    """
+    Get the total time and the number of spans for each stage since the mark.
+
+    :type since: str or float or None
+    :rtype: list[(str, float, int)]
+    """
+    return _registry.breakdown(since)
+
+
+def summary(since=None):
+    """
+    Get the breakdown as text with a line for each stage.
+
+    :type since: str or float or None
+    :rtype: str
+    """
+    return _registry.summary(since)
+
+
+def saveTrace(path):
+    """
+    Save the spans to the given path as a Chrome trace.
+
+    :type path: str
+    """
+    _registry.saveTrace(path)
+
+
+def testMetrics():
+    """Test that the stages are recorded as histograms, spans and a trace."""
+    import tempfile
+
+    metrics = Metrics()
+
+    @metrics.timed("test.sleep")
+    def sleep(seconds):
+        time.sleep(seconds)
+
+    with metrics.timer("test.read"):
+        sleep(0.002)
+
+    metrics.mark("search")
+
+    for i in range(3):
+        sleep(0.001)
+
+    metrics.increment("test.items", 10)
+    metrics.increment("test.items")
+
+    assert metrics.counter("test.items") == 11
+    assert metrics.histogram("test.sleep").count() == 4
+    assert metrics.histogram("test.read").total() >= 0.002
+
+    buckets = dict(metrics.histogram("test.sleep").buckets())
+    assert sum(buckets.values()) == 4
+
+    stages = metrics.breakdown("search")
+    assert [(name, count) for name, total, count in stages] == [("test.sleep", 3)]
+    assert "test.sleep" in metrics.summary("search")
+    assert [name for name, total, count in metrics.breakdown()] == ["test.read", "test.sleep"]
+
+    path = tempfile.mktemp(suffix=".json")
+    try:
+        metrics.saveTrace(path)
+        with open(path) as f:
+            events = json.load(f)["traceEvents"]
+        assert len([e for e in events if e["ph"] == "X"]) == 5
+    finally:
+        os.remove(path)
+
+    metrics.setEnabled(False)
+    sleep(0.001)
+    assert metrics.histogram("test.sleep").count() == 4
+
+    metrics.reset()
+    assert not metrics.counters()
+
+
+def testsuite():
+    testMetrics()
+
+
+if __name__ == "__main__":
+    testsuite()
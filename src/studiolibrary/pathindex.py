@@ -0,0 +1,261 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+
+__all__ = [
+    "PathIndex",
+]
+
+
+class _Node(object):
+
+    __slots__ = ("children", "terminal")
+
+    def __init__(self):
+        self.children = {}
+        self.terminal = False
+
+
+class PathIndex(object):
+    """
+    A prefix tree of paths keyed by the path segments.
+
+    Finding, moving and renaming all the paths below a folder only visits
+    the nodes of that folder instead of every path in the index.
+
+    Example:
+        index = PathIndex(["P:/Library/Mario/jump.anim", "P:/Library/Mario"])
+        print(index.rename("P:/Library/Mario", "P:/Library/Luigi"))
+        # [('P:/Library/Mario', 'P:/Library/Luigi'),
+        #  ('P:/Library/Mario/jump.anim', 'P:/Library/Luigi/jump.anim')]
+    """
+
+    def __init__(self, paths=None):
+        """
+        :type paths: list[str] or None
+        """
+        self._root = _Node()
+        self._count = 0
+
+        for path in paths or []:
+            self.add(path)
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, path):
+        node = self._find(path)
+        return bool(node and node.terminal)
+
+    def __iter__(self):
+        return self.paths()
+
+    @staticmethod
+    def split(path):
+        """
+        Split the given path into its segments.
+
+        :type path: str
+        :rtype: list[str]
+        """
+        return path.split("/")
+
+    def _find(self, path):
+        """
+        Get the node for the given path.
+
+        :type path: str
+        :rtype: _Node or None
+        """
+        node = self._root
+
+        for segment in self.split(path):
+            node = node.children.get(segment)
+            if node is None:
+                return None
+
+        return node
+
+    def add(self, path):
+        """
+        Add the given path to the index.
+
+        :type path: str
+        """
+        node = self._root
+
+        for segment in self.split(path):
+            child = node.children.get(segment)
+            if child is None:
+                child = node.children[segment] = _Node()
+            node = child
+
+        if not node.terminal:
+            node.terminal = True
+            self._count += 1
+
+    def remove(self, path):
+        """
+        Remove the given path from the index.
+
+        The children of the path are kept.
+
+        :type path: str
+        """
+        nodes = [self._root]
+
+        for segment in self.split(path):
+            node = nodes[-1].children.get(segment)
+            if node is None:
+                return
+            nodes.append(node)
+
+        if not nodes[-1].terminal:
+            return
+
+        nodes[-1].terminal = False
+        self._count -= 1
+
+        self._prune(nodes, self.split(path))
+
+    def _prune(self, nodes, segments):
+        """
+        Remove the empty nodes at the end of the given branch.
+
+        :type nodes: list[_Node]
+        :type segments: list[str]
+        """
+        for i in range(len(segments), 0, -1):
+            node = nodes[i]
+            if node.terminal or node.children:
+                break
+            del nodes[i - 1].children[segments[i - 1]]
+
+    def paths(self, prefix=None):
+        """
+        Return the given path and all the paths below it.
+
+        :type prefix: str or None
+        :rtype: collections.Iterable[str]
+        """
+        if prefix is None:
+            stack = [(None, self._root)]
+        else:
+            node = self._find(prefix)
+            if node is None:
+                return
+            stack = [(prefix, node)]
+
+        while stack:
+            path, node = stack.pop()
+
+            if node.terminal:
+                yield path
+
+            for segment in sorted(node.children, reverse=True):
+                if path is None:
+                    path_ = segment
+                else:
+                    path_ = path + "/" + segment
+                stack.append((path_, node.children[segment]))
+
+    def rename(self, src, dst):
+        """
+        Move the given path and all the paths below it to the destination.
+
+        :type src: str
+        :type dst: str
+        :rtype: list[(str, str)]
+        """
+        if src == dst:
+            return []
+
+        srcSegments = self.split(src)
+
+        nodes = [self._root]
+        for segment in srcSegments:
+            node = nodes[-1].children.get(segment)
+            if node is None:
+                return []
+            nodes.append(node)
+
+        renamed = [(path, dst + path[len(src):]) for path in self.paths(src)]
+
+        # Detach the source branch and merge it into the destination
+        del nodes[-2].children[srcSegments[-1]]
+        self._prune(nodes[:-1], srcSegments[:-1])
+
+        self._count -= len(renamed)
+        for old, new in renamed:
+            self.add(new)
+
+        return renamed
+
+
+def testPathIndex():
+    """Test that the paths below a folder are found, renamed and removed."""
+    index = PathIndex([
+        "/library/Mario",
+        "/library/Mario/jump.anim",
+        "/library/Mario/Sub/walk.anim",
+        "/library/Mario2/idle.pose",
+    ])
+
+    assert len(index) == 4
+    assert "/library/Mario" in index
+    assert "/library/Mario/Sub" not in index
+    assert list(index.paths("/library/Mario")) == [
+        "/library/Mario",
+        "/library/Mario/Sub/walk.anim",
+        "/library/Mario/jump.anim",
+    ]
+
+    # Adding a path twice is only counted once
+    index.add("/library/Mario/jump.anim")
+    index.add("/library/Luigi")
+    assert len(index) == 5
+
+    # The children of a removed path are kept
+    index.remove("/library/Mario")
+    index.remove("/library/Peach")
+    assert len(index) == 4
+    assert list(index.paths("/library/Mario")) == [
+        "/library/Mario/Sub/walk.anim",
+        "/library/Mario/jump.anim",
+    ]
+
+    # A sibling starting with the same name is not renamed
+    assert index.rename("/library/Mario", "/library/Luigi/Mario") == [
+        ("/library/Mario/Sub/walk.anim", "/library/Luigi/Mario/Sub/walk.anim"),
+        ("/library/Mario/jump.anim", "/library/Luigi/Mario/jump.anim"),
+    ]
+    assert index.rename("/library/Peach", "/library/Daisy") == []
+
+    assert len(index) == 4
+    assert list(index) == [
+        "/library/Luigi",
+        "/library/Luigi/Mario/Sub/walk.anim",
+        "/library/Luigi/Mario/jump.anim",
+        "/library/Mario2/idle.pose",
+    ]
+
+    # The empty nodes of the renamed and removed paths are pruned
+    index.remove("/library/Mario2/idle.pose")
+    assert list(index._root.children[""].children["library"].children) == ["Luigi"]
+
+
+def testsuite():
+    testPathIndex()
+
+
+if __name__ == "__main__":
+    testsuite()
@@ -0,0 +1,420 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import collections
+
+from studiovendor.Qt import QtCore
+
+import studiolibrary
+
+
+__all__ = [
+    "SearchCancelled",
+    "SearchTask",
+    "SearchExecutor",
+]
+
+
+logger = logging.getLogger(__name__)
+
+
+class SearchCancelled(Exception):
+    """Raised when a search task is cancelled before it has finished."""
+
+
+class SearchTask(object):
+    """
+    Match, sort and group a fixed list of item records.
+
+    The task only uses the arguments it was created with, so it can run
+    on a worker thread while the library changes on the main thread. The
+    library replaces the records and their item data when they change
+    instead of changing them, so the records of a task are never changed.
+    Creating the Qt items for the results is left to the main thread.
+
+    When a limit is given, only the first page of the results is sorted
+    and grouped. The next pages are fetched after sorting all the results
+    the first time a page after the first one is needed.
+    """
+
+    # The number of records matched between checking for cancellation
+    CHECK_INTERVAL = 1024
+
+    def __init__(self, records, allRecords=None, paths=None, match=None,
+                 sortBy=None, groupBy=None, sortKeys=None, state=None,
+                 limit=None, offset=0):
+        """
+        :type records: tuple[studiolibrary.ItemRecord]
+        :type allRecords: tuple[studiolibrary.ItemRecord] or None
+        :type paths: set[str] or None
+        :type match: func or None
+        :type sortBy: list[str] or None
+        :type groupBy: list[str] or None
+        :type sortKeys: studiolibrary.SortKeys or None
+        :type state: object
+        :type limit: int or None
+        :type offset: int
+        """
+        self._records = records
+        self._allRecords = allRecords
+        self._paths = paths
+        self._match = match
+        self._sortBy = sortBy
+        self._groupBy = groupBy
+        self._sortKeys = sortKeys
+        self._state = state
+        self._limit = limit or None
+        self._offset = offset
+        self._cancelled = False
+        self._results = None
+        self._page = None
+        self._order = None
+        self._more = False
+
+    def state(self):
+        """
+        Get the state of the library the task was created from.
+
+        :rtype: object
+        """
+        return self._state
+
+    def cancel(self):
+        """Stop the task the next time it checks for cancellation."""
+        self._cancelled = True
+
+    def isCancelled(self):
+        """
+        Check if the task has been cancelled.
+
+        :rtype: bool
+        """
+        return self._cancelled
+
+    def limit(self):
+        """
+        Get the number of records in the first page or None for all.
+
+        :rtype: int or None
+        """
+        return self._limit
+
+    def offset(self):
+        """
+        Get the position of the first page in all the results.
+
+        :rtype: int
+        """
+        return self._offset
+
+    def results(self):
+        """
+        Get all the records found by the task.
+
+        The records are only in the sorted order when isSorted is True.
+
+        :rtype: list[studiolibrary.ItemRecord] or None
+        """
+        return self._results
+
+    def isSorted(self):
+        """
+        Check if all the records found by the task are sorted.
+
+        :rtype: bool
+        """
+        return self._limit is None or not self._sortBy
+
+    def count(self):
+        """
+        Get the number of records found by the task.
+
+        :rtype: int
+        """
+        return len(self._results or [])
+
+    def groupedResults(self):
+        """
+        Get the records in the first page grouped by the groupBy fields.
+
+        :rtype: dict or None
+        """
+        if self._page is None:
+            return None
+
+        return collections.OrderedDict(self._page)
+
+    def hasMore(self, offset):
+        """
+        Check if there are more records to fetch from the given position.
+
+        :type offset: int
+        :rtype: bool
+        """
+        if self._order is not None:
+            return offset < len(self._order)
+
+        # The first page was full when the other pages have not been sorted
+        return self._more
+
+    @studiolibrary.metrics.timed("search.order")
+    def order(self):
+        """
+        Get the group and the record for all the results in the order shown.
+
+        :rtype: list[(str, studiolibrary.ItemRecord)]
+        """
+        if self._order is None:
+            results = self._results
+
+            # Sorting all the results at once can use the sort positions
+            if not self.isSorted():
+                results = studiolibrary.Library.sorted(
+                    results, self._sortBy, self._sortKeys, self._allRecords
+                )
+
+            groups = studiolibrary.Library.sortedGroups(results, None, self._groupBy)
+
+            self._order = [(group, r) for group, records in groups for r in records]
+
+        return self._order
+
+    def fetch(self, offset, limit=None):
+        """
+        Get the grouped records for the page at the given position.
+
+        :type offset: int
+        :type limit: int or None
+        :rtype: dict
+        """
+        end = None if limit is None else offset + limit
+
+        groups = collections.OrderedDict()
+        for group, record in self.order()[offset:end]:
+            groups.setdefault(group, []).append(record)
+
+        return groups
+
+    def _check(self):
+        if self._cancelled:
+            raise SearchCancelled()
+
+    @studiolibrary.metrics.timed("search.run")
+    def run(self):
+        """
+        Find the records and return the records in the first page.
+
+        :raises: SearchCancelled
+        :rtype: list[studiolibrary.ItemRecord]
+        """
+        interval = self.CHECK_INTERVAL
+        records = self._records
+        paths = self._paths
+        match = self._match
+
+        self._check()
+
+        if paths is not None:
+            records = [r for r in records if r.path() in paths]
+
+        self._check()
+
+        if match:
+            results = []
+
+            with studiolibrary.metrics.timer("search.match"):
+                for i, record in enumerate(records):
+                    if not i % interval:
+                        self._check()
+                    if match(record.itemData()):
+                        results.append(record)
+        else:
+            results = list(records)
+
+        self._check()
+
+        if self._limit is None:
+            if self._sortBy:
+                results = studiolibrary.Library.sorted(
+                    results, self._sortBy, self._sortKeys, self._allRecords
+                )
+
+            self._check()
+            page = studiolibrary.Library.sortedGroups(results, None, self._groupBy)
+        else:
+            # Only sort the records in the groups needed for the first page
+            end = self._offset + self._limit
+            page = studiolibrary.Library.sortedGroups(
+                results, self._sortBy, self._groupBy, limit=end,
+                sortKeys=self._sortKeys, allItems=self._allRecords,
+            )
+            self._more = sum(len(records) for group, records in page) >= end
+
+        self._check()
+
+        # Remove the records before the offset from the first groups
+        skip = self._offset
+        while skip and page:
+            group, records = page[0]
+            if len(records) > skip:
+                page[0] = (group, records[skip:])
+                break
+            skip -= len(records)
+            page.pop(0)
+
+        self._page = page
+        self._results = results
+
+        return [record for group, records in page for record in records]
+
+
+class SearchWorkerSignals(QtCore.QObject):
+    """The signals emitted by the search worker."""
+    finished = QtCore.Signal(object)
+    failed = QtCore.Signal(object)
+
+
+class SearchWorker(QtCore.QRunnable):
+    """Run a search task on a thread from the thread pool."""
+
+    def __init__(self, task):
+        QtCore.QRunnable.__init__(self)
+
+        self._task = task
+        self._done = False
+        self.signals = SearchWorkerSignals()
+
+    def isDone(self):
+        """
+        Check if the worker has finished running the task.
+
+        :rtype: bool
+        """
+        return self._done
+
+    def run(self):
+        """The starting point for the thread."""
+        try:
+            self._task.run()
+            self.signals.finished.emit(self._task)
+        except SearchCancelled:
+            logger.debug("Search cancelled")
+        except Exception:
+            logger.exception("Cannot run the search task.")
+            self.signals.failed.emit(self._task)
+        finally:
+            self._done = True
+
+
+class SearchExecutor(QtCore.QObject):
+    """
+    Run one search task at a time on a worker thread.
+
+    Starting a new task cancels the current one, and only the results
+    of the latest task are emitted with the finished signal. The signal
+    is emitted on the thread of the executor, which is the main thread
+    for the executor created by the library. When the latest task raises
+    an error the failed signal is emitted instead.
+    """
+
+    finished = QtCore.Signal(object)
+    failed = QtCore.Signal(object)
+
+    def __init__(self, *args):
+        QtCore.QObject.__init__(self, *args)
+
+        self._task = None
+        self._workers = []
+
+        self._threadPool = QtCore.QThreadPool(self)
+        self._threadPool.setMaxThreadCount(1)
+
+    def task(self):
+        """
+        Get the latest task that has been started.
+
+        :rtype: SearchTask or None
+        """
+        return self._task
+
+    def isRunning(self):
+        """
+        Check if the latest task has not finished yet.
+
+        :rtype: bool
+        """
+        return self._task is not None
+
+    def start(self, task):
+        """
+        Cancel the current task and start the given one.
+
+        :type task: SearchTask
+        """
+        self.cancel()
+
+        # Keep the workers alive while the thread pool is running them
+        self._workers = [w for w in self._workers if not w.isDone()]
+
+        worker = SearchWorker(task)
+        worker.setAutoDelete(False)
+        worker.signals.finished.connect(self._taskFinished, QtCore.Qt.QueuedConnection)
+        worker.signals.failed.connect(self._taskFailed, QtCore.Qt.QueuedConnection)
+
+        self._task = task
+        self._workers.append(worker)
+        self._threadPool.start(worker)
+
+    def cancel(self):
+        """Cancel the current task so that its results are never emitted."""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def wait(self, msecs=-1):
+        """
+        Wait for the started tasks and emit the results of the latest one.
+
+        :type msecs: int
+        :rtype: bool
+        """
+        done = self._threadPool.waitForDone(msecs)
+        task = self._task
+
+        if done and task:
+            if task.results() is not None:
+                self._taskFinished(task)
+            else:
+                self._taskFailed(task)
+
+        return done
+
+    def _taskFinished(self, task):
+        """
+        Triggered on the thread of the executor when a task has finished.
+
+        :type task: SearchTask
+        """
+        if task is self._task and not task.isCancelled():
+            self._task = None
+            self.finished.emit(task)
+
+    def _taskFailed(self, task):
+        """
+        Triggered on the thread of the executor when a task has raised an error.
+
+        :type task: SearchTask
+        """
+        if task is self._task and not task.isCancelled():
+            self._task = None
+            self.failed.emit(task)
@@ -0,0 +1,282 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+import re
+
+from studiovendor import six
+
+
+__all__ = [
+    "SearchIndex",
+]
+
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_WORDS = re.compile(r"^\w+$", re.UNICODE)
+
+
+def trigrams(text):
+    """
+    Get the set of three character substrings of the given text.
+
+    :type text: str
+    :rtype: set[str]
+    """
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+class SearchIndex(object):
+    """
+    An inverted index of the words in the item data for full text search.
+
+    The text of each item is the same text matched by the "*" field in
+    Library.match. Each word in the text has a posting set of the paths
+    that contain it, and each three characters of a word have a posting
+    set of the words that contain them, so finding the words that contain
+    a substring does not scan every word.
+
+    Example:
+        index = SearchIndex()
+        index.add("P:/Library/jump.anim", {"name": "jump.anim"})
+        print(index.search("jum"))
+        # ({'P:/Library/jump.anim'}, True)
+    """
+
+    def __init__(self):
+        self._words = {}
+        self._trigrams = {}
+        self._paths = {}
+        self._lastWords = None
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __contains__(self, path):
+        return path in self._paths
+
+    @staticmethod
+    def text(itemData):
+        """
+        Get the text to search for the given item data.
+
+        :type itemData: dict
+        :rtype: str
+        """
+        return six.text_type(itemData).lower()
+
+    @classmethod
+    def split(cls, text):
+        """
+        Get the unique words in the given text.
+
+        :type text: str
+        :rtype: set[str]
+        """
+        return set(_WORD.findall(text))
+
+    def add(self, path, itemData):
+        """
+        Add or replace the words for the given path.
+
+        :type path: str
+        :type itemData: dict
+        """
+        if path in self._paths:
+            self.remove(path)
+
+        words = self.split(self.text(itemData))
+        self._paths[path] = tuple(words)
+        self._lastWords = None
+
+        for word in words:
+            paths = self._words.get(word)
+
+            if paths is None:
+                paths = self._words[word] = set()
+
+                for trigram in trigrams(word):
+                    self._trigrams.setdefault(trigram, set()).add(word)
+
+            paths.add(path)
+
+    def update(self, data):
+        """
+        Add or replace the words for all the items in the given data.
+
+        :type data: dict
+        """
+        for path, itemData in data.items():
+            self.add(path, itemData)
+
+    def remove(self, path):
+        """
+        Remove the words for the given path.
+
+        :type path: str
+        """
+        words = self._paths.pop(path, None)
+        self._lastWords = None
+
+        for word in words or []:
+            paths = self._words[word]
+            paths.discard(path)
+
+            if not paths:
+                del self._words[word]
+
+                for trigram in trigrams(word):
+                    words_ = self._trigrams[trigram]
+                    words_.discard(word)
+                    if not words_:
+                        del self._trigrams[trigram]
+
+    def clear(self):
+        """Remove all the paths from the index."""
+        self._words = {}
+        self._trigrams = {}
+        self._paths = {}
+        self._lastWords = None
+
+    def words(self, text):
+        """
+        Get the words in the index that contain the given text.
+
+        :type text: str
+        :rtype: collections.Iterable[str]
+        """
+        # Words that contain the text also contain the previous text, so
+        # typing more characters only has to check the previous words
+        if self._lastWords is not None and self._lastWords[0] in text:
+            words = [word for word in self._lastWords[1] if text in word]
+        elif len(text) < 3:
+            words = [word for word in self._words if text in word]
+        else:
+            words = self._trigramWords(text)
+
+        self._lastWords = (text, words)
+
+        return words
+
+    def _trigramWords(self, text):
+        """
+        Get the words that contain the given text using the trigram postings.
+
+        :type text: str
+        :rtype: list[str]
+        """
+        words = None
+
+        # Start with the smallest posting to keep the intersection small
+        postings = [self._trigrams.get(trigram) for trigram in trigrams(text)]
+        if not all(postings):
+            return []
+
+        for posting in sorted(postings, key=len):
+            if words is None:
+                words = set(posting)
+            else:
+                words &= posting
+
+        return [word for word in words if text in word]
+
+    def paths(self, word):
+        """
+        Get the paths that contain a word which contains the given text.
+
+        :type word: str
+        :rtype: set[str]
+        """
+        paths = set()
+
+        for word_ in self.words(word):
+            paths.update(self._words[word_])
+
+        return paths
+
+    def search(self, text):
+        """
+        Get the paths whose item data might contain the given text.
+
+        When the text is a single word the result is exact. Otherwise the
+        paths contain every word in the text and still need to be checked
+        with Library.match. None is returned when the text has no words.
+
+        :type text: str
+        :rtype: (set[str] or None, bool)
+        """
+        text = text.lower()
+        words = _WORD.findall(text)
+
+        if not words:
+            return None, False
+
+        result = None
+
+        for word in sorted(words, key=len, reverse=True):
+            paths = self.paths(word)
+
+            if result is None:
+                result = paths
+            else:
+                result &= paths
+
+            if not result:
+                break
+
+        exact = bool(_WORDS.match(text))
+
+        return result, exact
+
+
+def testSearchIndex():
+    """Test that the index finds the same paths as matching the text."""
+    data = {
+        "/library/Mario/jump.anim": {"name": "jump.anim", "tags": ["hero"]},
+        "/library/Mario/walk.anim": {"name": "walk.anim", "tags": ["Hero2"]},
+        "/library/Luigi/jumping.pose": {"name": "jumping.pose"},
+    }
+
+    index = SearchIndex()
+    index.update(data)
+
+    for text in ["jump", "um", "hero", "o", "ero2", "mario/jump", "anim'", "xyz"]:
+        paths, exact = index.search(text)
+        expected = set(
+            path for path, itemData in data.items()
+            if text.lower() in SearchIndex.text(itemData)
+        )
+
+        if exact:
+            assert paths == expected, (text, paths, expected)
+        else:
+            assert expected <= paths, (text, paths, expected)
+
+    assert index.search("mping") == (set(["/library/Luigi/jumping.pose"]), True)
+    assert index.search("mpi") == (set(["/library/Luigi/jumping.pose"]), True)
+    assert index.search("ju")[0] == index.search("j")[0]
+    assert index.search("./") == (None, False)
+
+    index.remove("/library/Mario/jump.anim")
+    index.add("/library/Mario/walk.anim", {"name": "run.anim"})
+
+    assert index.search("jump")[0] == set(["/library/Luigi/jumping.pose"])
+    assert index.search("run")[0] == set(["/library/Mario/walk.anim"])
+    assert "hero" not in index._words
+    assert "her" not in index._trigrams
+
+
+def testsuite():
+    testSearchIndex()
+
+
+if __name__ == "__main__":
+    testsuite()
@@ -0,0 +1,595 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import mmap
+import uuid
+import struct
+import logging
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+import studiolibrary
+
+from studiovendor import six
+
+
+__all__ = [
+    "Snapshot",
+    "SnapshotData",
+    "Record",
+    "readSnapshot",
+    "writeSnapshot",
+]
+
+logger = logging.getLogger(__name__)
+
+
+MAGIC = b"SLSNAP01"
+
+# magic, meta size, record count, field count, string count
+HEADER = struct.Struct("<8sIIII")
+
+OFFSET = struct.Struct("<Q")
+INDEX = struct.Struct("<I")
+TAG = struct.Struct("<B")
+INT = struct.Struct("<q")
+FLOAT = struct.Struct("<d")
+
+MISSING, STRING, INTEGER, REAL, JSON, TRUE, FALSE, NULL = range(8)
+
+INT_MIN = -(1 << 63)
+INT_MAX = (1 << 63) - 1
+
+
+def _align(size):
+    """
+    Round the given size up to the next multiple of eight bytes.
+
+    :type size: int
+    :rtype: int
+    """
+    return (size + 7) & ~7
+
+
+class Snapshot(object):
+    """
+    A read only view of a binary snapshot of the library item data.
+
+    The file is memory mapped and contains a string table, the string id
+    of each record path and a column of fixed width values for each field.
+    Strings and records are only decoded when they are accessed.
+
+    Layout:
+        header      magic, meta size and the record, field and string counts
+        meta        JSON describing the database the snapshot was made from
+        offsets     (string count + 1) uint64 offsets into the string data
+        strings     the utf-8 encoded strings
+        paths       a uint32 string id for each record
+        fields      a uint32 string id for each field name
+        columns     for each field a uint8 tag and a 64 bit value per record
+    """
+
+    def __init__(self, path):
+        """
+        :type path: str
+        """
+        self._path = path
+
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            self._parse()
+        except Exception:
+            self._mmap.close()
+            raise
+
+    def _parse(self):
+        """Read the header and compute the position of each section."""
+        buffer_ = self._mmap
+
+        magic, metaSize, recordCount, fieldCount, stringCount = \
+            HEADER.unpack_from(buffer_, 0)
+
+        if magic != MAGIC:
+            raise ValueError(u'Not a snapshot file "{0}"'.format(self._path))
+
+        pos = HEADER.size
+        self._meta = json.loads(buffer_[pos:pos + metaSize].decode("utf-8"))
+        pos += _align(metaSize)
+
+        self._offsetsPos = pos
+        pos += OFFSET.size * (stringCount + 1)
+
+        self._stringsPos = pos
+        end, = OFFSET.unpack_from(buffer_, self._offsetsPos + OFFSET.size * stringCount)
+        pos += _align(end)
+
+        self._pathsPos = pos
+        pos += _align(INDEX.size * recordCount)
+
+        fieldsPos = pos
+        pos += _align(INDEX.size * fieldCount)
+
+        self._recordCount = recordCount
+        self._strings = [None] * stringCount
+        self._columns = {}
+
+        for i in range(fieldCount):
+            nameId, = INDEX.unpack_from(buffer_, fieldsPos + INDEX.size * i)
+            tagsPos = pos
+            valuesPos = tagsPos + _align(recordCount)
+            pos = valuesPos + 8 * recordCount
+            self._columns[self.string(nameId)] = (tagsPos, valuesPos)
+
+        if pos > len(buffer_):
+            raise ValueError(u'Truncated snapshot file "{0}"'.format(self._path))
+
+    def path(self):
+        """
+        Get the location of the snapshot on disc.
+
+        :rtype: str
+        """
+        return self._path
+
+    def meta(self):
+        """
+        Get the description of the database the snapshot was made from.
+
+        :rtype: dict
+        """
+        return self._meta
+
+    def close(self):
+        """Unmap the file. Records can no longer be decoded after closing."""
+        self._mmap.close()
+
+    def __len__(self):
+        return self._recordCount
+
+    def fields(self):
+        """
+        Get the names of all the fields in the snapshot.
+
+        :rtype: list[str]
+        """
+        return list(self._columns.keys())
+
+    def string(self, index):
+        """
+        Get the string with the given id from the string table.
+
+        Each string is only decoded once and is shared by all the records.
+
+        :type index: int
+        :rtype: str
+        """
+        text = self._strings[index]
+
+        if text is None:
+            start, end = struct.unpack_from(
+                "<QQ", self._mmap, self._offsetsPos + OFFSET.size * index
+            )
+            pos = self._stringsPos
+            text = self._mmap[pos + start:pos + end].decode("utf-8")
+            self._strings[index] = text
+
+        return text
+
+    def paths(self):
+        """
+        Get the path of each record in the order they are stored.
+
+        :rtype: list[str]
+        """
+        count = self._recordCount
+        ids = struct.unpack_from("<{0}I".format(count), self._mmap, self._pathsPos)
+        return [self.string(i) for i in ids]
+
+    def value(self, index, field):
+        """
+        Decode the value of the given field for the record at the given index.
+
+        :type index: int
+        :type field: str
+        :raises: KeyError if the record does not have the field
+        :rtype: object
+        """
+        column = self._columns.get(field)
+        if column is None:
+            raise KeyError(field)
+
+        tagsPos, valuesPos = column
+        tag, = TAG.unpack_from(self._mmap, tagsPos + index)
+
+        if tag == MISSING:
+            raise KeyError(field)
+
+        pos = valuesPos + 8 * index
+
+        if tag == STRING:
+            return self.string(INT.unpack_from(self._mmap, pos)[0])
+        elif tag == INTEGER:
+            return INT.unpack_from(self._mmap, pos)[0]
+        elif tag == REAL:
+            return FLOAT.unpack_from(self._mmap, pos)[0]
+        elif tag == JSON:
+            return json.loads(self.string(INT.unpack_from(self._mmap, pos)[0]))
+        elif tag == TRUE:
+            return True
+        elif tag == FALSE:
+            return False
+        elif tag == NULL:
+            return None
+
+        raise ValueError(u"Unknown snapshot value type {0}".format(tag))
+
+    def record(self, index):
+        """
+        Decode all the fields of the record at the given index.
+
+        :type index: int
+        :rtype: dict
+        """
+        data = {}
+
+        for field in self._columns:
+            try:
+                data[field] = self.value(index, field)
+            except KeyError:
+                pass
+
+        return data
+
+
+class Record(MutableMapping):
+    """
+    The item data for a single record in a snapshot.
+
+    Each field is decoded the first time it is read. The record is fully
+    decoded the first time it is changed or iterated.
+    """
+
+    __slots__ = ("_snapshot", "_index", "_data", "_decoded")
+
+    def __init__(self, snapshot, index):
+        """
+        :type snapshot: Snapshot
+        :type index: int
+        """
+        self._snapshot = snapshot
+        self._index = index
+        self._data = {}
+        self._decoded = False
+
+    def _decode(self):
+        """
+        Get the fully decoded item data.
+
+        :rtype: dict
+        """
+        if not self._decoded:
+            data = self._snapshot.record(self._index)
+            data.update(self._data)
+            self._data = data
+            self._decoded = True
+        return self._data
+
+    def isDecoded(self):
+        """
+        Check if all the fields have been decoded.
+
+        :rtype: bool
+        """
+        return self._decoded
+
+    def __getitem__(self, key):
+        data = self._data
+        try:
+            return data[key]
+        except KeyError:
+            # The record may have been decoded by a search on another thread
+            if self._decoded:
+                return self._data[key]
+
+        value = data[key] = self._snapshot.value(self._index, key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._decode()[key] = value
+
+    def __delitem__(self, key):
+        del self._decode()[key]
+
+    def __iter__(self):
+        return iter(self._decode())
+
+    def __len__(self):
+        return len(self._decode())
+
+    def __repr__(self):
+        return repr(self._decode())
+
+    def copy(self):
+        """
+        Return a plain dict copy of the item data.
+
+        :rtype: dict
+        """
+        return dict(self._decode())
+
+
+class SnapshotData(MutableMapping):
+    """
+    The item data of a snapshot as a dict of paths to records.
+
+    Changes are kept in memory on top of the snapshot, so that the
+    journal can be replayed without decoding every record.
+    """
+
+    def __init__(self, snapshot):
+        """
+        :type snapshot: Snapshot
+        """
+        self._snapshot = snapshot
+        self._paths = snapshot.paths()
+        self._index = dict((path, i) for i, path in enumerate(self._paths))
+        self._records = {}
+        self._added = {}
+        self._removed = set()
+
+    def snapshot(self):
+        """
+        Get the snapshot the data was read from.
+
+        :rtype: Snapshot
+        """
+        return self._snapshot
+
+    def fields(self):
+        """
+        Get the names of all the fields used by the records.
+
+        Only the records that have been changed are decoded.
+
+        :rtype: list[str]
+        """
+        fields = set(self._snapshot.fields())
+
+        for itemData in self._added.values():
+            fields.update(itemData.keys())
+
+        for record in self._records.values():
+            if record.isDecoded():
+                fields.update(record.keys())
+
+        return list(fields)
+
+    def __getitem__(self, path):
+        if path in self._added:
+            return self._added[path]
+
+        if path in self._removed:
+            raise KeyError(path)
+
+        record = self._records.get(path)
+        if record is None:
+            record = Record(self._snapshot, self._index[path])
+            self._records[path] = record
+
+        return record
+
+    def __setitem__(self, path, itemData):
+        self._removed.discard(path)
+        self._records.pop(path, None)
+
+        if path in self._index:
+            self._removed.add(path)
+
+        self._added[path] = itemData
+
+    def __delitem__(self, path):
+        if path in self._added:
+            del self._added[path]
+        elif path in self._index and path not in self._removed:
+            self._records.pop(path, None)
+            self._removed.add(path)
+        else:
+            raise KeyError(path)
+
+    def __contains__(self, path):
+        if path in self._added:
+            return True
+        return path in self._index and path not in self._removed
+
+    def __iter__(self):
+        removed = self._removed
+        for path in self._paths:
+            if path not in removed:
+                yield path
+
+        for path in list(self._added):
+            yield path
+
+    def __len__(self):
+        return len(self._paths) - len(self._removed) + len(self._added)
+
+
+def readSnapshot(path):
+    """
+    Read the item data from the given snapshot file.
+
+    :type path: str
+    :rtype: SnapshotData
+    """
+    return SnapshotData(Snapshot(path))
+
+
+def _encode(text):
+    """
+    :type text: str
+    :rtype: bytes
+    """
+    if isinstance(text, six.text_type):
+        return text.encode("utf-8")
+    return text
+
+
+def writeSnapshot(path, data, meta=None):
+    """
+    Write the given item data to a binary snapshot at the given path.
+
+    The file is written to a temporary file first and then moved to the
+    given path, so readers that have mapped the old snapshot keep it.
+
+    :type path: str
+    :type data: dict
+    :type meta: dict or None
+    """
+    strings = {}
+    blobs = []
+
+    def intern(text):
+        index = strings.get(text)
+        if index is None:
+            index = strings[text] = len(blobs)
+            blobs.append(_encode(text))
+        return index
+
+    paths = sorted(data.keys())
+    count = len(paths)
+
+    fields = {}
+    for i, itemPath in enumerate(paths):
+        for field, value in data[itemPath].items():
+            column = fields.get(field)
+            if column is None:
+                column = fields[field] = (bytearray(count), bytearray(8 * count))
+            tags, values = column
+            pos = 8 * i
+
+            if isinstance(value, bool):
+                tags[i] = TRUE if value else FALSE
+            elif value is None:
+                tags[i] = NULL
+            elif isinstance(value, six.string_types):
+                tags[i] = STRING
+                INT.pack_into(values, pos, intern(value))
+            elif isinstance(value, six.integer_types) and INT_MIN <= value <= INT_MAX:
+                tags[i] = INTEGER
+                INT.pack_into(values, pos, value)
+            elif isinstance(value, float):
+                tags[i] = REAL
+                FLOAT.pack_into(values, pos, value)
+            else:
+                tags[i] = JSON
+                INT.pack_into(values, pos, intern(json.dumps(value, sort_keys=True)))
+
+    pathIds = [intern(itemPath) for itemPath in paths]
+    fieldNames = sorted(fields.keys())
+    fieldIds = [intern(field) for field in fieldNames]
+
+    metaBytes = json.dumps(meta or {}, sort_keys=True).encode("utf-8")
+
+    offsets = [0]
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+
+    def pad(chunk):
+        return chunk + b"\0" * (_align(len(chunk)) - len(chunk))
+
+    chunks = [
+        HEADER.pack(MAGIC, len(metaBytes), count, len(fieldNames), len(blobs)),
+        pad(metaBytes),
+        struct.pack("<{0}Q".format(len(offsets)), *offsets),
+        pad(b"".join(blobs)),
+        pad(struct.pack("<{0}I".format(count), *pathIds)),
+        pad(struct.pack("<{0}I".format(len(fieldIds)), *fieldIds)),
+    ]
+
+    for field in fieldNames:
+        tags, values = fields[field]
+        chunks.append(pad(bytes(tags)))
+        chunks.append(bytes(values))
+
+    dirname = os.path.dirname(path)
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+
+    tmp = u"{0}.{1}.tmp".format(path, uuid.uuid4().hex)
+
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+
+        if hasattr(os, "replace"):
+            os.replace(tmp, path)
+        else:
+            studiolibrary.utils.silentRemove(path)
+            os.rename(tmp, path)
+    finally:
+        studiolibrary.utils.silentRemove(tmp)
+
+
+def testSnapshot():
+    """Test that the item data survives writing and reading a snapshot."""
+    import tempfile
+
+    data = {
+        u"/library/Mario/jump.anim": {
+            "name": u"jump.anim",
+            "modified": 1592469832.26,
+            "frames": 24,
+            "tags": ["hero", u"l\xe9ft"],
+            "visible": True,
+            "color": None,
+        },
+        u"/library/Mario": {
+            "name": u"Mario",
+            "icon": u"folder",
+        },
+    }
+
+    path = os.path.join(tempfile.mkdtemp(), "database.snapshot")
+    writeSnapshot(path, data, meta={"source": [1, 2]})
+
+    data_ = readSnapshot(path)
+
+    assert data_.snapshot().meta() == {"source": [1, 2]}
+    assert sorted(data_.keys()) == sorted(data.keys())
+    assert data_[u"/library/Mario"].get("frames") is None
+
+    for path_, itemData in data.items():
+        assert dict(data_[path_]) == itemData, dict(data_[path_])
+
+    data_[u"/library/Mario"]["color"] = "red"
+    del data_[u"/library/Mario/jump.anim"]
+    data_[u"/library/Luigi"] = {"name": "Luigi"}
+
+    assert data_[u"/library/Mario"]["color"] == "red"
+    assert u"/library/Mario/jump.anim" not in data_
+    assert sorted(data_) == [u"/library/Luigi", u"/library/Mario"]
+
+
+def testsuite():
+    testSnapshot()
+
+
+if __name__ == "__main__":
+    testsuite()
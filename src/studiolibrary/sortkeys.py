@@ -0,0 +1,420 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+import re
+import heapq
+import logging
+import threading
+
+from studiovendor import six
+
+
+__all__ = [
+    "SortKeys",
+    "naturalKey",
+    "sortKey",
+    "parseSortBy",
+]
+
+
+logger = logging.getLogger(__name__)
+
+
+_DIGITS = re.compile(r"([0-9]+)")
+
+_NUMBER_TYPES = six.integer_types + (float,)
+
+
+def naturalKey(text):
+    """
+    Get a key for sorting the numbers in the given text by their value.
+
+    The key is a string so that comparing two keys is as fast as comparing
+    two strings. Each number is replaced by its length and its digits.
+
+    Example:
+        sorted(["item10", "Item2"], key=naturalKey)
+        # ['Item2', 'item10']
+
+    :type text: str
+    :rtype: str
+    """
+    parts = _DIGITS.split(text.lower())
+
+    for i in range(1, len(parts), 2):
+        digits = parts[i].lstrip("0") or "0"
+        parts[i] = u"\x01" + six.unichr(len(digits)) + digits
+
+    return u"".join(parts)
+
+
+def sortKey(value):
+    """
+    Get a key for the given value that can be compared to any other key.
+
+    Empty values sort first, then numbers by value, then strings in
+    natural order and then any other values by their text.
+
+    :type value: object
+    :rtype: tuple
+    """
+    if value is None or value == "":
+        return 0, 0
+
+    if isinstance(value, _NUMBER_TYPES):
+        return 1, value
+
+    if isinstance(value, six.string_types):
+        return 2, naturalKey(value)
+
+    return 3, naturalKey(six.text_type(value))
+
+
+def parseSortBy(sortBy):
+    """
+    Get the field name and reverse flag for each of the given sort fields.
+
+    Example:
+        parseSortBy(["modified:dsc", "name"])
+        # [('modified', True), ('name', False)]
+
+    :type sortBy: list[str]
+    :rtype: list[(str, bool)]
+    """
+    fields = []
+
+    for field in sortBy:
+        tokens = field.split(":")
+
+        reverse = False
+        if len(tokens) > 1:
+            field = tokens[0]
+            reverse = tokens[1] != "asc"
+
+        fields.append((field, reverse))
+
+    return fields
+
+
+class SortKeys(object):
+    """
+    Sort items by several fields with one sort and keep the order for reuse.
+
+    Each field is converted to a key that sorts like its value, so the
+    items are sorted once by a tuple of the keys. Descending fields are
+    negated when the fields are sorted in different directions.
+
+    The position of every item in the library is kept for each sort
+    order, so the results of the next search are sorted by looking up
+    their positions. The positions must be cleared when the data changes.
+    The natural keys of the strings are kept after clearing, since they
+    only depend on the string.
+
+    Example:
+        sortKeys = SortKeys()
+        items = sortKeys.sorted(items, ["modified:dsc", "name:asc"])
+    """
+
+    # The number of sort orders to keep the positions for
+    MAX_ORDERS = 4
+
+    # The number of strings to keep the natural keys for
+    MAX_TEXT_KEYS = 1000000
+
+    def __init__(self):
+        self._positions = {}
+        self._textKeys = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Remove the positions for all the sort orders."""
+        with self._lock:
+            self._version += 1
+            self._positions = {}
+
+    def fieldRanks(self, items, field):
+        """
+        Get the rank of the value of the given field for each item.
+
+        :type items: list[studiolibrary.ItemRecord]
+        :type field: str
+        :rtype: list[int]
+        """
+        values = [item.itemData().get(field) for item in items]
+
+        try:
+            distinct = set(values)
+        except TypeError:
+            # Compare the keys of the values that cannot be hashed instead
+            values = [sortKey(value) for value in values]
+            distinct = set(values)
+            ranks = dict((key, i) for i, key in enumerate(sorted(distinct)))
+            return [ranks[key] for key in values]
+
+        textKeys = self._textKeys
+        if len(textKeys) > self.MAX_TEXT_KEYS:
+            textKeys = self._textKeys = {}
+
+        empty = []
+        numbers = []
+        texts = []
+        others = []
+
+        for value in distinct:
+            if value is None or value == "":
+                empty.append(value)
+            elif isinstance(value, _NUMBER_TYPES):
+                numbers.append(value)
+            elif isinstance(value, six.string_types):
+                if value not in textKeys:
+                    textKeys[value] = naturalKey(value)
+                texts.append(value)
+            else:
+                others.append(value)
+
+        def otherKey(value):
+            return naturalKey(six.text_type(value))
+
+        # Sort each type on its own, so the values are compared without
+        # the type in the key, and give equal keys the same rank
+        groups = [
+            (sorted(numbers), None),
+            (sorted(texts, key=textKeys.__getitem__), textKeys.__getitem__),
+            (sorted(others, key=otherKey), otherKey),
+        ]
+
+        ranks = dict((value, 0) for value in empty)
+        rank = 0
+
+        for values_, keyFunc in groups:
+            previous = None
+
+            for value in values_:
+                key = keyFunc(value) if keyFunc else value
+                if previous is None or key != previous:
+                    rank += 1
+                    previous = key
+                ranks[value] = rank
+
+        return [ranks[value] for value in values]
+
+    def fieldKeys(self, items, field, negate=False):
+        """
+        Get a key of the given field for each item that sorts like its value.
+
+        Fields with only text or only numbers use the natural key of the
+        text or the number itself. Other fields use the rank of the value.
+
+        :type items: list[studiolibrary.ItemRecord]
+        :type field: str
+        :type negate: bool
+        :rtype: list
+        """
+        values = [item.itemData().get(field) for item in items]
+        types = set(map(type, values))
+        types.discard(type(None))
+
+        if types and all(issubclass(t, six.string_types) for t in types) and not negate:
+            textKeys = self._textKeys
+            if len(textKeys) > self.MAX_TEXT_KEYS:
+                textKeys = self._textKeys = {}
+
+            for value in set(values).difference(textKeys):
+                if value is not None:
+                    textKeys[value] = naturalKey(value)
+
+            keyOf = textKeys.get
+            return [keyOf(value, u"") for value in values]
+
+        if types and all(issubclass(t, _NUMBER_TYPES) for t in types):
+            if negate:
+                empty = float("inf")
+                return [empty if value is None else -value for value in values]
+
+            empty = float("-inf")
+            return [empty if value is None else value for value in values]
+
+        ranks = self.fieldRanks(items, field)
+
+        if negate:
+            ranks = [-rank for rank in ranks]
+
+        return ranks
+
+    def keys(self, items, sortBy):
+        """
+        Get the key for sorting each item by the given fields.
+
+        :type items: list[studiolibrary.ItemRecord]
+        :type sortBy: list[str]
+        :rtype: (list, bool)
+        """
+        fields = parseSortBy(sortBy)
+
+        # Only negate the descending fields when the directions are mixed
+        reverse = fields[0][1]
+        mixed = any(reverse_ != reverse for field, reverse_ in fields)
+
+        columns = []
+
+        for field, reverse_ in fields:
+            columns.append(self.fieldKeys(items, field, mixed and reverse_))
+
+        if len(columns) == 1:
+            return columns[0], reverse
+
+        return list(zip(*columns)), reverse and not mixed
+
+    def positions(self, items, sortBy):
+        """
+        Get the position of each of the given items when sorted.
+
+        :type items: list[studiolibrary.ItemRecord]
+        :type sortBy: list[str]
+        :rtype: dict
+        """
+        key = tuple(sortBy)
+        positions = self._positions.get(key)
+
+        if positions is None:
+            version = self._version
+            positions = dict(
+                (item, i) for i, item in enumerate(self.sorted(items, sortBy))
+            )
+
+            # Only keep the positions when the data has not changed
+            with self._lock:
+                if version == self._version:
+                    if len(self._positions) >= self.MAX_ORDERS:
+                        self._positions.clear()
+                    self._positions[key] = positions
+
+        return positions
+
+    def sorted(self, items, sortBy, allItems=None, limit=None):
+        """
+        Return the given items sorted by the given fields.
+
+        When all the items are given, the items are sorted by their
+        position in all the items, which is only computed once for each
+        sort order. When a limit is given, only the first items are
+        returned and the rest of the items are not sorted.
+
+        :type items: list[studiolibrary.ItemRecord]
+        :type sortBy: list[str]
+        :type allItems: list[studiolibrary.ItemRecord] or None
+        :type limit: int or None
+        :rtype: list[studiolibrary.ItemRecord]
+        """
+        partial = limit is not None and limit < len(items)
+
+        if not sortBy:
+            return list(items[:limit] if partial else items)
+
+        # Sorting a few items is faster than finding the positions of all
+        if allItems is not None and (
+                tuple(sortBy) in self._positions or len(items) * 4 >= len(allItems)):
+            positions = self.positions(allItems, sortBy)
+            try:
+                if partial:
+                    return heapq.nsmallest(limit, items, key=positions.__getitem__)
+                return sorted(items, key=positions.__getitem__)
+            except KeyError:
+                logger.debug("Cannot find the position of the items")
+
+        keys, reverse = self.keys(items, sortBy)
+        indexes = range(len(keys))
+
+        if partial:
+            select = heapq.nlargest if reverse else heapq.nsmallest
+            order = select(limit, indexes, key=keys.__getitem__)
+        else:
+            order = sorted(indexes, key=keys.__getitem__, reverse=reverse)
+
+        return [items[i] for i in order]
+
+
+def testSortKeys():
+    """Test that sorting once gives the same order as sorting each field."""
+    import random
+
+    class Item(object):
+
+        def __init__(self, path, itemData):
+            self._path = path
+            self._itemData = itemData
+
+        def path(self):
+            return self._path
+
+        def itemData(self):
+            return self._itemData
+
+    assert sorted(["item10", "Item2", "item1"], key=naturalKey) == ["item1", "Item2", "item10"]
+    assert sorted([None, "a", 3, -1.5, ["x"]], key=sortKey) == [None, -1.5, 3, "a", ["x"]]
+
+    rand = random.Random(0)
+    items = []
+
+    for i in range(500):
+        itemData = {
+            "name": "item{0}".format(rand.randint(0, 20)),
+            "type": rand.choice([".anim", ".pose", "", None]),
+            "modified": rand.choice([1.5, 2, 3.25, ""]),
+            "index": rand.choice([-1, 0, 2.5, 7, None]),
+        }
+        items.append(Item("/library/item{0}".format(i), itemData))
+
+    sortKeys = SortKeys()
+
+    for sortBy in [
+        ["name:asc"],
+        ["name:dsc"],
+        ["type:dsc", "name:dsc"],
+        ["type:asc", "modified:dsc", "name"],
+        ["modified:dsc", "type:asc"],
+        ["index:dsc", "name:asc"],
+        ["name:asc", "index:dsc", "type:dsc"],
+    ]:
+        expected = list(items)
+
+        for field, reverse in reversed(parseSortBy(sortBy)):
+            def key(item):
+                return sortKey(item.itemData().get(field))
+            expected = sorted(expected, key=key, reverse=reverse)
+
+        assert sortKeys.sorted(items, sortBy) == expected, sortBy
+
+        # Sorting by the positions in all the items gives the same order
+        subset = expected[::3]
+        rand.shuffle(subset)
+        expected = [item for item in expected if item in subset]
+        assert sortKeys.sorted(subset, sortBy, allItems=items) == expected, sortBy
+
+        # Only the first items are sorted when there is a limit
+        assert sortKeys.sorted(subset, sortBy, limit=10) == sortKeys.sorted(subset, sortBy)[:10], sortBy
+        assert sortKeys.sorted(subset, sortBy, allItems=items, limit=10) == expected[:10], sortBy
+
+    # The positions are computed again after the data has changed
+    assert sortKeys.sorted(items, ["name:dsc"], allItems=items)[0] is not items[0]
+    items[0].itemData()["name"] = "item100"
+    sortKeys.clear()
+    assert sortKeys.sorted(items, ["name:dsc"], allItems=items)[0] is items[0]
+
+
+def testsuite():
+    testSortKeys()
+
+
+if __name__ == "__main__":
+    testsuite()
@@ -0,0 +1,1778 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import hashlib
+import logging
+import threading
+import contextlib
+import collections
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+import studiolibrary
+
+from studiovendor import six
+
+
+__all__ = [
+    "Storage",
+    "JsonStorage",
+    "SqliteStorage",
+    "ShardedStorage",
+    "createStorage",
+    "createShardedStorage",
+    "registerStorage",
+]
+
+logger = logging.getLogger(__name__)
+
+
+_storageClasses = collections.OrderedDict()
+
+
+def registerStorage(extension, cls):
+    """
+    Register the given storage class for the given database extension.
+
+    Example:
+        registerStorage(".db", SqliteStorage)
+
+    :type extension: str
+    :type cls: Storage.__class__
+    """
+    _storageClasses[extension.lower()] = cls
+
+
+def storageClass(path):
+    """
+    Get the storage class registered for the extension of the given path.
+
+    :type path: str
+    :rtype: Storage.__class__
+    """
+    extension = os.path.splitext(path)[1].lower()
+    return _storageClasses.get(extension, JsonStorage)
+
+
+def createStorage(path, root=None):
+    """
+    Create a new storage instance for the given database path.
+
+    The storage class is resolved from the extension of the path, so the
+    "databasePath" config key can be used to switch between backends.
+
+    Example:
+        "databasePath": "{root}/.studiolibrary/database.db"
+
+    :type path: str
+    :type root: str or None
+    :rtype: Storage
+    """
+    cls = storageClass(path)
+    storage = cls(path, root)
+
+    # Import the legacy database.json when switching to a new backend
+    _importLegacy(storage)
+
+    return storage
+
+
+def createShardedStorage(path, root, depth):
+    """
+    Create a storage that splits the database at the given path into shards.
+
+    The manifest is saved next to the database path, and the shards use
+    the backend of the database extension. The existing database is split
+    into the shards the first time.
+
+    Example:
+        storage = createShardedStorage("/library/.studiolibrary/database.json", "/library", 1)
+        print(storage.path())
+        # /library/.studiolibrary/database.shards.json
+
+    :type path: str
+    :type root: str
+    :type depth: int
+    :rtype: ShardedStorage
+    """
+    base, extension = os.path.splitext(path)
+
+    storage = ShardedStorage(
+        base + ".shards.json",
+        root,
+        depth=depth,
+        extension=extension,
+        legacyPath=path,
+    )
+
+    _importLegacy(storage)
+
+    return storage
+
+
+def _importLegacy(storage):
+    """
+    Import the legacy database of the given storage if it does not exist.
+
+    :type storage: Storage
+    """
+    if not storage.exists():
+        legacyPath = storage.legacyPath()
+        if legacyPath and os.path.exists(legacyPath):
+            storage.importJson(legacyPath)
+
+
+class Storage(object):
+    """
+    The base class for reading and writing the library item data.
+
+    The data is a dict of item paths to item data. Reimplement the
+    update, remove and rename methods for backends that can write
+    single rows without serializing the whole database.
+
+    The paths below the root are saved with the root token, so the
+    library can be moved without changing the database.
+
+    Example:
+        {"{root}/Mario/jump.anim": {"folder": "{root}/Mario"}}
+    """
+
+    def __init__(self, path, root=None):
+        """
+        :type path: str
+        :type root: str or None
+        """
+        self._path = studiolibrary.normPath(path)
+
+        # The database is saved in a folder below the root by default.
+        # eg: {root}/.studiolibrary/database.json
+        if root is None:
+            root = os.path.dirname(os.path.dirname(self._path))
+
+        self._root = studiolibrary.normPath(root)
+
+    def path(self):
+        """
+        Get the location of the database on disc.
+
+        :rtype: str
+        """
+        return self._path
+
+    def root(self):
+        """
+        Get the root folder that the paths in the database are relative to.
+
+        :rtype: str
+        """
+        return self._root
+
+    def encodeData(self, data):
+        """
+        Get the given item data with the paths relative to the root.
+
+        :type data: dict
+        :rtype: dict
+        """
+        return studiolibrary.encodeItemData(data, self.root())
+
+    def decodeData(self, data):
+        """
+        Get the given item data with the absolute paths.
+
+        The paths saved relative to the database by older versions are
+        also resolved.
+
+        :type data: dict
+        :rtype: dict
+        """
+        return studiolibrary.decodeItemData(data, self.root(), start=self.path())
+
+    def legacyPath(self):
+        """
+        Get the path of the legacy JSON database to import from.
+
+        :rtype: str or None
+        """
+        return None
+
+    def lock(self):
+        """
+        Get the cross process lock used for writing to the database.
+
+        :rtype: studiolibrary.lock.FileLock
+        """
+        return studiolibrary.lock.FileLock(self.path())
+
+    def exists(self):
+        """
+        Check if the database exists on disc.
+
+        :rtype: bool
+        """
+        return os.path.exists(self.path())
+
+    def files(self):
+        """
+        Get the files on disc that the database is written to.
+
+        :rtype: list[str]
+        """
+        return [self.path()]
+
+    def mtime(self):
+        """
+        Return when any of the database files was last modified.
+
+        :rtype: float or None
+        """
+        mtime = None
+
+        for path in self.files():
+            try:
+                mtime = max(mtime or 0, os.path.getmtime(path))
+            except OSError:
+                pass
+
+        return mtime
+
+    def version(self):
+        """
+        Get a value that changes whenever the database is written.
+
+        The inode, size and modified time of each file are used by default.
+        Unlike the modified time alone, the size also changes when a file
+        is appended to within the modified time resolution of the file
+        system, and the inode changes when a file is replaced.
+
+        :rtype: list
+        """
+        return [_fileState(path) for path in self.files()]
+
+    def read(self):
+        """
+        Read all the item data from disc.
+
+        :rtype: dict
+        """
+        raise NotImplementedError("The read method has not been implemented!")
+
+    def save(self, data):
+        """
+        Replace all the item data on disc with the given data.
+
+        :type data: dict
+        """
+        raise NotImplementedError("The save method has not been implemented!")
+
+    def update(self, data):
+        """
+        Insert or update the given item data.
+
+        The data for existing paths is merged with the given data.
+
+        :type data: dict
+        """
+        with self.lock():
+            data_ = self.read()
+
+            for path, itemData in data.items():
+                data_.setdefault(path, {})
+                data_[path].update(itemData)
+
+            self.save(data_)
+
+    def remove(self, paths):
+        """
+        Remove the given paths from the database.
+
+        :type paths: list[str]
+        """
+        with self.lock():
+            data = self.read()
+
+            for path in paths:
+                if path in data:
+                    del data[path]
+
+            self.save(data)
+
+    def rename(self, src, dst):
+        """
+        Rename the given source path and all its children to the destination.
+
+        :type src: str
+        :type dst: str
+        """
+        raise NotImplementedError("The rename method has not been implemented!")
+
+    def renamePaths(self, mapping):
+        """
+        Rename each source path and its children to the destination path.
+
+        The paths are renamed in the order of the given mapping.
+
+        :type mapping: dict or list[(str, str)]
+        """
+        for src, dst in _items(mapping):
+            self.rename(src, dst)
+
+    def compact(self):
+        """
+        Remove the space used by old changes from the database files.
+
+        The base storage writes the whole database on every save, so there
+        is nothing to compact.
+        """
+        pass
+
+    def importJson(self, path):
+        """
+        Import the item data from the given JSON database.
+
+        :type path: str
+        """
+        logger.info(u'Importing database "%s" -> "%s"', path, self.path())
+        self.save(JsonStorage(path, self.root()).read())
+
+
+class JsonStorage(Storage):
+    """
+    The default storage which saves all the item data to a single JSON file.
+
+    Changes to single items are appended to a journal file next to the
+    JSON file instead of writing the whole database. Reading replays the
+    journal on top of the JSON snapshot, and once the journal is larger
+    than the "databaseJournalSize" config value it is folded into a new
+    snapshot on a background thread.
+
+    Example journal:
+        {"op": "update", "data": {"{root}/Mario/jump.anim": {"tags": ["hero"]}}}
+        {"op": "remove", "paths": ["{root}/Mario/walk.anim"]}
+        {"op": "rename", "src": "{root}/Mario", "dst": "{root}/Luigi"}
+    """
+
+    def __init__(self, path, root=None):
+        """
+        :type path: str
+        :type root: str or None
+        """
+        super(JsonStorage, self).__init__(path, root)
+
+        self._lock = threading.RLock()
+        self._generation = 0
+        self._compactThread = None
+
+    def journalPath(self):
+        """
+        Get the path to the journal of changes since the last snapshot.
+
+        :rtype: str
+        """
+        return os.path.splitext(self.path())[0] + ".journal"
+
+    def compactingPath(self):
+        """
+        Get the path to the journal that is being folded into the snapshot.
+
+        :rtype: str
+        """
+        return self.journalPath() + ".compacting"
+
+    def journalSize(self):
+        """
+        Get the journal size in bytes at which the journal is compacted.
+
+        A size of zero disables the journal.
+
+        :rtype: int
+        """
+        size = studiolibrary.config.get("databaseJournalSize")
+        if size is None:
+            size = 1024 * 1024
+        return size
+
+    def files(self):
+        """
+        Get the snapshot and the journal files.
+
+        :rtype: list[str]
+        """
+        return [self.path(), self.journalPath(), self.compactingPath()]
+
+    def read(self):
+        """
+        Read the snapshot and replay the journal on top of it.
+
+        :rtype: dict
+        """
+        with self._lock:
+            for attempt in range(3):
+                state = self._state()
+                data = self._read()
+
+                # Read again if another process compacted while reading
+                if state == self._state():
+                    return data
+
+        # The file lock is always taken before the thread lock
+        with self.lock(), self._lock:
+            return self._read()
+
+    def _read(self):
+        """
+        Read the snapshot and the journals without checking for changes.
+
+        :rtype: dict
+        """
+        data = self.readSnapshot()
+        self._replay(data, self.compactingPath())
+        self._replay(data, self.journalPath())
+        return data
+
+    def snapshotPath(self):
+        """
+        Get the path to the binary snapshot of the JSON database.
+
+        :rtype: str
+        """
+        return os.path.splitext(self.path())[0] + ".snapshot"
+
+    def isSnapshotEnabled(self):
+        """
+        Check if the binary snapshot is used for reading the database.
+
+        :rtype: bool
+        """
+        return bool(studiolibrary.config.get("databaseSnapshot"))
+
+    def snapshotMeta(self):
+        """
+        Get the description of the JSON database stored in the snapshot.
+
+        The snapshot is only used while the JSON database is unchanged and
+        the library has not been moved.
+
+        :rtype: dict
+        """
+        try:
+            stat = os.stat(self.path())
+            source = [stat.st_size, stat.st_mtime]
+        except OSError:
+            source = None
+
+        return {
+            "version": 2,
+            "database": self.path(),
+            "root": self.root(),
+            "source": source,
+        }
+
+    def readSnapshot(self):
+        """
+        Read the item data saved in the JSON database.
+
+        When enabled the binary snapshot is memory mapped instead, and it is
+        created the first time the JSON database is read.
+
+        :rtype: dict or studiolibrary.snapshot.SnapshotData
+        """
+        if not self.isSnapshotEnabled():
+            return self.readJson()
+
+        meta = self.snapshotMeta()
+
+        if os.path.exists(self.snapshotPath()):
+            try:
+                data = studiolibrary.snapshot.readSnapshot(self.snapshotPath())
+            except Exception:
+                logger.exception('Cannot read the snapshot "%s"', self.snapshotPath())
+            else:
+                if data.snapshot().meta() == meta:
+                    return data
+                data.snapshot().close()
+
+        data = self.readJson()
+        self.saveSnapshot(data, meta)
+
+        return data
+
+    def readJson(self):
+        """
+        Read the item data with the absolute paths from the JSON database.
+
+        :rtype: dict
+        """
+        return self.decodeData(_readJson(self.path()))
+
+    def saveSnapshot(self, data, meta=None):
+        """
+        Save the given item data to the binary snapshot if enabled.
+
+        :type data: dict
+        :type meta: dict or None
+        """
+        if not self.isSnapshotEnabled():
+            return
+
+        try:
+            studiolibrary.snapshot.writeSnapshot(
+                self.snapshotPath(), data, meta or self.snapshotMeta()
+            )
+        except (IOError, OSError):
+            # The snapshot may still be mapped by another process on Windows
+            logger.debug('Cannot save the snapshot "%s"', self.snapshotPath())
+
+    def saveJson(self, data):
+        """
+        Save the given item data as the JSON database and its snapshot.
+
+        :type data: dict
+        """
+        if not isinstance(data, dict):
+            data = dict((path, dict(itemData)) for path, itemData in data.items())
+
+        studiolibrary.saveJson(self.path(), self.encodeData(data))
+        self.saveSnapshot(data)
+
+    def save(self, data):
+        """
+        Replace all the item data on disc with the given data.
+
+        :type data: dict
+        """
+        with self.lock(), self._lock:
+            self._generation += 1
+            self.saveJson(data)
+            studiolibrary.utils.silentRemove(self.journalPath())
+            studiolibrary.utils.silentRemove(self.compactingPath())
+
+    def update(self, data):
+        """
+        Insert or update the given item data.
+
+        :type data: dict
+        """
+        self.append({"op": "update", "data": data})
+
+    def remove(self, paths):
+        """
+        Remove the given paths from the database.
+
+        :type paths: list[str]
+        """
+        self.append({"op": "remove", "paths": list(paths)})
+
+    def rename(self, src, dst):
+        """
+        Rename the given source path and all its children to the destination.
+
+        :type src: str
+        :type dst: str
+        """
+        self.renamePaths([(src, dst)])
+
+    def renamePaths(self, mapping):
+        """
+        Rename each source path and its children to the destination path.
+
+        :type mapping: dict or list[(str, str)]
+        """
+        records = []
+        for src, dst in _items(mapping):
+            src = studiolibrary.normPath(src)
+            dst = studiolibrary.normPath(dst)
+            records.append({"op": "rename", "src": src, "dst": dst})
+
+        self.append(*records)
+
+    def append(self, *records):
+        """
+        Append the given changes to the journal.
+
+        :type records: list[dict]
+        """
+        if not self.journalSize():
+            with self.lock():
+                data = self.read()
+                index = studiolibrary.pathindex.PathIndex(data.keys())
+                for record in records:
+                    self.apply(data, record, index=index)
+                self.save(data)
+            return
+
+        lines = []
+        for record in records:
+            line = json.dumps(self.encodeRecord(record), sort_keys=True)
+            lines.append(line + "\n")
+
+        with self.lock(), self._lock:
+            dirname = os.path.dirname(self.journalPath())
+            if not os.path.exists(dirname):
+                os.makedirs(dirname)
+
+            with open(self.journalPath(), "ab") as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+
+                # Start a new line after a partial line from an interrupted write
+                if size and _lastByte(self.journalPath(), size) != b"\n":
+                    lines.insert(0, "\n")
+
+                f.write("".join(lines).encode("utf-8"))
+                size = f.tell()
+
+        if size > self.journalSize():
+            self.compact(background=True)
+
+    def encodeRecord(self, record):
+        """
+        Get the given journal record with the paths relative to the root.
+
+        :type record: dict
+        :rtype: dict
+        """
+        return self._convertRecord(record, self.encodeData, studiolibrary.encodePath)
+
+    def decodeRecord(self, record):
+        """
+        Get the given journal record with the absolute paths.
+
+        :type record: dict
+        :rtype: dict
+        """
+        def decodePath(path, root):
+            return studiolibrary.decodePath(path, root, start=self.path())
+
+        return self._convertRecord(record, self.decodeData, decodePath)
+
+    def _convertRecord(self, record, convertData, convertPath):
+        """
+        Convert the item data and the paths in the given journal record.
+
+        :type record: dict
+        :type convertData: func
+        :type convertPath: func
+        :rtype: dict
+        """
+        record = dict(record)
+        root = self.root()
+
+        if "data" in record:
+            record["data"] = convertData(record["data"])
+
+        if "paths" in record:
+            record["paths"] = [convertPath(path, root) for path in record["paths"]]
+
+        for name in ["src", "dst"]:
+            if name in record:
+                record[name] = convertPath(record[name], root)
+
+        return record
+
+    @staticmethod
+    def apply(data, record, index=None):
+        """
+        Apply the given journal record to the given item data.
+
+        The given path index must contain the paths of the data and is
+        kept up to date with the changes.
+
+        :type data: dict
+        :type record: dict
+        :type index: studiolibrary.pathindex.PathIndex or None
+        """
+        op = record.get("op")
+
+        if op == "update":
+            for path, itemData in record["data"].items():
+                if path not in data:
+                    data[path] = {}
+                    if index is not None:
+                        index.add(path)
+                data[path].update(itemData)
+
+        elif op == "remove":
+            for path in record["paths"]:
+                if data.pop(path, None) is not None and index is not None:
+                    index.remove(path)
+
+        elif op == "rename":
+            if index is None:
+                index = studiolibrary.pathindex.PathIndex(data.keys())
+            renameItemData(data, record["src"], record["dst"], index)
+
+        else:
+            logger.warning("Unknown journal record %s", record)
+
+    def _replay(self, data, path):
+        """
+        Apply all the records in the given journal to the given data.
+
+        :type data: dict
+        :type path: str
+        """
+        if not os.path.exists(path):
+            return
+
+        index = None
+
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+
+                try:
+                    record = self.decodeRecord(json.loads(line))
+                except ValueError:
+                    # A partial line from an interrupted write
+                    logger.warning('Ignoring invalid journal line in "%s"', path)
+                    continue
+
+                # Only index the paths when the journal contains a rename
+                if index is None and record.get("op") == "rename":
+                    index = studiolibrary.pathindex.PathIndex(data.keys())
+
+                self.apply(data, record, index=index)
+
+    def compact(self, background=False):
+        """
+        Fold the journal into a new snapshot.
+
+        :type background: bool
+        """
+        if background:
+            with self._lock:
+                if self._compactThread and self._compactThread.is_alive():
+                    return
+
+                self._compactThread = threading.Thread(target=self._compactInBackground)
+                self._compactThread.daemon = True
+                self._compactThread.start()
+            return
+
+        with self.lock(), self._lock:
+            generation = self._generation
+
+            # New changes are appended to a new journal while compacting
+            if not os.path.exists(self.compactingPath()):
+                if not os.path.exists(self.journalPath()):
+                    return
+                os.rename(self.journalPath(), self.compactingPath())
+
+            state = self._state()[:2]
+
+        data = self.readSnapshot()
+        self._replay(data, self.compactingPath())
+
+        with self.lock(), self._lock:
+            # Ignore the result if the database was saved while compacting.
+            # Changes appended to the new journal are kept.
+            if generation != self._generation or state != self._state()[:2]:
+                return
+
+            self.saveJson(data)
+            studiolibrary.utils.silentRemove(self.compactingPath())
+
+        logger.debug('Compacted the database journal "%s"', self.path())
+
+    def _compactInBackground(self):
+        """Fold the journal into a new snapshot on the compaction thread."""
+        try:
+            self.compact()
+        except studiolibrary.lock.LockError:
+            # The journal is compacted again after the next change
+            logger.warning('Cannot lock the database for compacting "%s"', self.path())
+
+    def _state(self):
+        """
+        Get the inode, size and modified time of the snapshot and the
+        journals, to detect changes made by other processes.
+
+        :rtype: list
+        """
+        return [
+            _fileState(path)
+            for path in [self.path(), self.compactingPath(), self.journalPath()]
+        ]
+
+
+def renameItemData(data, src, dst, index):
+    """
+    Rename the given source path and all its children in the given data.
+
+    Only the items found below the source path in the given index are
+    changed. Their string values that start with the source path are
+    renamed, including the values in nested lists and dicts. Paths to the
+    moved items from the data of other items are not renamed.
+
+    :type data: dict
+    :type src: str
+    :type dst: str
+    :type index: studiolibrary.pathindex.PathIndex
+    """
+    renamed = []
+    for path, path_ in index.rename(src, dst):
+        itemData = renamePathValue(data.pop(path), src, dst)
+        renamed.append((path_, itemData))
+
+    data.update(renamed)
+
+
+def renamePathValue(value, src, dst):
+    """
+    Rename the given source path in the given value and its nested values.
+
+    Example:
+        print(renamePathValue({"refs": ["P:/Mario/jump.anim"]}, "P:/Mario", "P:/Luigi"))
+        # {'refs': ['P:/Luigi/jump.anim']}
+
+    :type value: object
+    :type src: str
+    :type dst: str
+    :rtype: object
+    """
+    if isinstance(value, six.string_types):
+        if value == src or value.startswith(src + "/"):
+            return dst + value[len(src):]
+        return value
+
+    if isinstance(value, Mapping):
+        return dict((key, renamePathValue(v, src, dst)) for key, v in value.items())
+
+    if isinstance(value, (list, tuple)):
+        return [renamePathValue(v, src, dst) for v in value]
+
+    return value
+
+
+def _readJson(path):
+    """
+    Read the given JSON file without resolving the legacy relative paths.
+
+    The storages decode the paths of the item data themselves.
+
+    :type path: str
+    :rtype: dict
+    """
+    return json.loads(studiolibrary.read(path) or "{}")
+
+
+def _lastByte(path, size):
+    """
+    Get the last byte of the given file.
+
+    :type path: str
+    :type size: int
+    :rtype: bytes
+    """
+    with open(path, "rb") as f:
+        f.seek(size - 1)
+        return f.read(1)
+
+
+def _fileState(path):
+    """
+    Get the inode, size and modified time of the given file.
+
+    :type path: str
+    :rtype: (int, int, float) or None
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    return stat.st_ino, stat.st_size, stat.st_mtime
+
+
+def _items(mapping):
+    """
+    Return the (key, value) pairs for the given dict or list of pairs.
+
+    :type mapping: dict or list[(str, str)]
+    :rtype: list[(str, str)]
+    """
+    if isinstance(mapping, dict):
+        return list(mapping.items())
+    return list(mapping)
+
+
+class SqliteStorage(Storage):
+    """
+    Store each item as a row in a SQLite database.
+
+    Saving, removing and renaming items only writes the affected rows.
+    The item data is stored as a JSON string using the same root token
+    as the JSON database so that the library can still be moved.
+    """
+
+    # The version of the path format saved as the database user version.
+    # Version 0 databases have the paths relative to the database file.
+    VERSION = 1
+
+    def __init__(self, path, root=None):
+        """
+        :type path: str
+        :type root: str or None
+        """
+        super(SqliteStorage, self).__init__(path, root)
+
+        if sqlite3 is None:
+            raise ImportError("The sqlite3 module is not available.")
+
+    def legacyPath(self):
+        """
+        Get the path of the legacy JSON database to import from.
+
+        :rtype: str
+        """
+        return os.path.join(os.path.dirname(self.path()), "database.json")
+
+    def files(self):
+        """
+        Get the database and the wal files.
+
+        In WAL mode commits are written to the "-wal" file, so both files
+        are used for the modified time of the database.
+
+        :rtype: list[str]
+        """
+        return [self.path(), self.path() + "-wal"]
+
+    @contextlib.contextmanager
+    def connect(self, write=True):
+        """
+        Open a connection to the database and commit on exit.
+
+        Writes take the database write lock at the start of the transaction
+        so that reading and updating rows cannot be interleaved with other
+        writers.
+
+        :type write: bool
+        :rtype: sqlite3.Connection
+        """
+        dirname = os.path.dirname(self.path())
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        timeout = studiolibrary.config.get("databaseTimeout") or 30
+        journalMode = studiolibrary.config.get("databaseJournalMode") or "WAL"
+
+        connection = sqlite3.connect(
+            self.path(),
+            timeout=timeout,
+            isolation_level=None,
+        )
+
+        try:
+            connection.execute("PRAGMA journal_mode={0}".format(journalMode))
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS items "
+                "(path TEXT PRIMARY KEY, data TEXT NOT NULL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta "
+                "(key TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+
+            if self._version(connection) < self.VERSION:
+                self._upgrade(connection)
+
+            if not write:
+                yield connection
+                return
+
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+
+                # Count the writes so that other users can detect them
+                connection.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('generation', "
+                    "COALESCE((SELECT value FROM meta WHERE key = 'generation'), 0) + 1)"
+                )
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    def version(self):
+        """
+        Get the number of writes to the database and the state of its files.
+
+        Each write transaction increments the generation saved in the
+        database, which changes even when the files are modified within
+        the modified time resolution of the file system.
+
+        :rtype: list
+        """
+        generation = 0
+
+        if self.exists():
+            with self.connect(write=False) as connection:
+                row = connection.execute(
+                    "SELECT value FROM meta WHERE key = 'generation'"
+                ).fetchone()
+                generation = row[0] if row else 0
+
+        return [generation] + super(SqliteStorage, self).version()
+
+    def _version(self, connection):
+        """
+        Get the version of the path format of the database.
+
+        :type connection: sqlite3.Connection
+        :rtype: int
+        """
+        return connection.execute("PRAGMA user_version").fetchone()[0]
+
+    def _upgrade(self, connection):
+        """
+        Save the paths of an older database relative to the root.
+
+        :type connection: sqlite3.Connection
+        """
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have upgraded the database while waiting
+            if self._version(connection) < self.VERSION:
+                data = {}
+                for path, itemData in connection.execute("SELECT path, data FROM items"):
+                    data[path] = json.loads(itemData)
+
+                if data:
+                    logger.info(u'Upgrading the paths in "%s"', self.path())
+
+                    data = studiolibrary.decodeItemData(data, self.root(), start=self.path())
+
+                    connection.execute("DELETE FROM items")
+                    connection.executemany(
+                        "INSERT INTO items (path, data) VALUES (?, ?)",
+                        self.encodeRows(data),
+                    )
+
+                connection.execute("PRAGMA user_version={0}".format(self.VERSION))
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def encodeRows(self, data):
+        """
+        Encode the given item data as rows of root relative paths and JSON text.
+
+        :type data: dict
+        :rtype: list[(str, str)]
+        """
+        return [
+            (path, json.dumps(dict(itemData), sort_keys=True))
+            for path, itemData in self.encodeData(data).items()
+        ]
+
+    def decodeRows(self, rows):
+        """
+        Decode the given rows into item data with the absolute paths.
+
+        :type rows: collections.Iterable[(str, str)]
+        :rtype: dict
+        """
+        data = dict((path, json.loads(itemData)) for path, itemData in rows)
+        return studiolibrary.decodeItemData(data, self.root())
+
+    def encodeKey(self, path):
+        """
+        Get the primary key of the row for the given path.
+
+        :type path: str
+        :rtype: str
+        """
+        return studiolibrary.encodePath(studiolibrary.normPath(path), self.root())
+
+    def _select(self, connection, paths):
+        """
+        Get the existing item data for the given paths.
+
+        :type connection: sqlite3.Connection
+        :type paths: list[str]
+        :rtype: dict
+        """
+        data = {}
+        keys = [self.encodeKey(path) for path in paths]
+
+        # Stay below the default SQLITE_MAX_VARIABLE_NUMBER
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            sql = "SELECT path, data FROM items WHERE path IN ({0})"
+            sql = sql.format(", ".join("?" * len(chunk)))
+            data.update(self.decodeRows(connection.execute(sql, chunk)))
+
+        return data
+
+    def read(self):
+        """
+        Read all the item data from disc.
+
+        :rtype: dict
+        """
+        data = {}
+
+        if not self.exists():
+            return data
+
+        with self.connect(write=False) as connection:
+            return self.decodeRows(connection.execute("SELECT path, data FROM items"))
+
+    def save(self, data):
+        """
+        Replace all the item data on disc with the given data.
+
+        :type data: dict
+        """
+        rows = self.encodeRows(data)
+
+        with self.connect() as connection:
+            connection.execute("DELETE FROM items")
+            connection.executemany(
+                "INSERT INTO items (path, data) VALUES (?, ?)", rows
+            )
+
+    def update(self, data):
+        """
+        Insert or update the given item data.
+
+        The data for existing paths is merged with the given data.
+
+        :type data: dict
+        """
+        with self.connect() as connection:
+            data_ = self._select(connection, list(data.keys()))
+
+            for path, itemData in data.items():
+                data_.setdefault(path, {}).update(itemData)
+
+            rows = self.encodeRows(data_)
+
+            connection.executemany(
+                "INSERT OR REPLACE INTO items (path, data) VALUES (?, ?)", rows
+            )
+
+    def remove(self, paths):
+        """
+        Remove the given paths from the database.
+
+        :type paths: list[str]
+        """
+        keys = [(self.encodeKey(path),) for path in paths]
+
+        with self.connect() as connection:
+            connection.executemany("DELETE FROM items WHERE path = ?", keys)
+
+    def rename(self, src, dst):
+        """
+        Rename the given source path and all its children to the destination.
+
+        :type src: str
+        :type dst: str
+        """
+        self.renamePaths([(src, dst)])
+
+    def renamePaths(self, mapping):
+        """
+        Rename each source path and its children to the destination path.
+
+        The children are found with a range query on the primary key
+        so only the rows below each source path are read and written.
+
+        :type mapping: dict or list[(str, str)]
+        """
+        with self.connect() as connection:
+            for src, dst in _items(mapping):
+                self._rename(connection, src, dst)
+
+    def _rename(self, connection, src, dst):
+        """
+        Rename the rows for the given source path and its children.
+
+        :type connection: sqlite3.Connection
+        :type src: str
+        :type dst: str
+        """
+        src = studiolibrary.normPath(src)
+        dst = studiolibrary.normPath(dst)
+
+        key = self.encodeKey(src)
+
+        # All the children are between "src/" and "src0" as "0" follows "/"
+        sql = "SELECT path, data FROM items " \
+              "WHERE path = ? OR (path >= ? AND path < ?)"
+
+        rows = list(connection.execute(sql, (key, key + "/", key + "0")))
+
+        renamed = {}
+        for path, itemData in self.decodeRows(rows).items():
+            path = dst + path[len(src):]
+            renamed[path] = renamePathValue(itemData, src, dst)
+
+        connection.executemany(
+            "DELETE FROM items WHERE path = ?", [(row[0],) for row in rows]
+        )
+        connection.executemany(
+            "INSERT OR REPLACE INTO items (path, data) VALUES (?, ?)",
+            self.encodeRows(renamed)
+        )
+
+    def compact(self):
+        """
+        Rebuild the database file to free the space used by removed rows.
+
+        The write ahead log is folded into the database first.
+        """
+        with self.connect(write=False) as connection:
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            connection.execute("VACUUM")
+
+        logger.debug('Compacted the database "%s"', self.path())
+
+
+class ShardedStorage(Storage):
+    """
+    Split the item data into a database for each folder near the root.
+
+    Each item is stored in the shard for the first folders of its path
+    relative to the root, up to the shard depth. The folder items and the
+    names of the shard files are kept in a small manifest, so the folder
+    tree can be shown without reading any shard. Only the loaded shards
+    are read, and the library loads a shard when a search needs the
+    items in its folders.
+
+    Example manifest:
+        {
+            "depth": 1,
+            "shards": {"": "cfcd208495d565ef.json", "Mario": "8b1a9953c4611296.json"},
+            "folders": {"{root}/Mario": {"type": "Folder"}}
+        }
+    """
+
+    FOLDER_TYPE = "Folder"
+
+    def __init__(self, path, root, depth=1, extension=".json", legacyPath=None):
+        """
+        :type path: str
+        :type root: str
+        :type depth: int
+        :type extension: str
+        :type legacyPath: str or None
+        """
+        super(ShardedStorage, self).__init__(path, root)
+
+        self._root = studiolibrary.normPath(root).rstrip("/")
+        self._depth = depth
+        self._extension = extension
+        self._legacyPath = legacyPath
+        self._lock = threading.RLock()
+        self._loaded = set()
+        self._loadedAll = False
+        self._storages = {}
+        self._manifest = None
+        self._manifestState = None
+
+    def depth(self):
+        """
+        Get the number of folders below the root used for the shard keys.
+
+        The depth of an existing manifest is used, since the shards on
+        disc were split with it.
+
+        :rtype: int
+        """
+        return self.manifest(refresh=False).get("depth") or self._depth
+
+    def shardsPath(self):
+        """
+        Get the folder that contains the shard files.
+
+        :rtype: str
+        """
+        return os.path.splitext(self.path())[0]
+
+    def legacyPath(self):
+        """
+        Get the path of the unsharded database to split into shards.
+
+        :rtype: str or None
+        """
+        path = self._legacyPath
+
+        if path and not os.path.exists(path):
+            path = storageClass(path)(path).legacyPath()
+
+        return path
+
+    def importJson(self, path):
+        """
+        Split the item data from the given unsharded database into shards.
+
+        :type path: str
+        """
+        logger.info(u'Splitting database "%s" -> "%s"', path, self.path())
+        self._save(createStorage(path, self._root).read(), keys=None)
+
+    def manifest(self, refresh=True):
+        """
+        Get the manifest with the folder items and the shard files.
+
+        The manifest is only read again when it has changed on disc. The
+        last manifest read is returned without checking when refresh is
+        False.
+
+        :type refresh: bool
+        :rtype: dict
+        """
+        with self._lock:
+            if self._manifest is not None and not refresh:
+                return self._manifest
+
+            try:
+                stat = os.stat(self.path())
+                state = (stat.st_mtime, stat.st_size)
+            except OSError:
+                state = None
+
+            if self._manifest is None or state != self._manifestState:
+                manifest = _readJson(self.path()) if state else {}
+                manifest.setdefault("shards", {})
+                manifest["folders"] = self.decodeData(manifest.get("folders", {}))
+
+                self._manifest = manifest
+                self._manifestState = state
+
+            return self._manifest
+
+    def saveManifest(self, shards, folders):
+        """
+        Save the given shard files and folder items as the manifest.
+
+        :type shards: dict
+        :type folders: dict
+        """
+        manifest = {
+            "depth": self.depth(),
+            "shards": shards,
+            "folders": self.encodeData(folders),
+        }
+
+        studiolibrary.saveJson(self.path(), manifest)
+
+        self._manifest = None
+
+    def shards(self, refresh=False):
+        """
+        Get the keys of all the shards in the manifest.
+
+        :type refresh: bool
+        :rtype: list[str]
+        """
+        return sorted(self.manifest(refresh=refresh)["shards"])
+
+    def loaded(self):
+        """
+        Get the keys of the shards that are read with the folder items.
+
+        :rtype: list[str]
+        """
+        shards = self.shards()
+
+        if self._loadedAll:
+            return shards
+
+        return [key for key in shards if key in self._loaded]
+
+    def isLoaded(self, key):
+        """
+        Check if the shard for the given key has been loaded.
+
+        :type key: str
+        :rtype: bool
+        """
+        return self._loadedAll or key in self._loaded
+
+    def load(self, keys=None):
+        """
+        Load the shards for the given keys, or all the shards when None.
+
+        :type keys: list[str] or None
+        :rtype: bool
+        """
+        shards = set(self.shards())
+
+        with self._lock:
+            if self._loadedAll:
+                return False
+
+            if keys is None:
+                self._loadedAll = True
+                keys = shards
+
+            keys = shards.intersection(keys).difference(self._loaded)
+            self._loaded.update(keys)
+
+        if keys:
+            logger.debug("Loaded %s shards", len(keys))
+
+        return bool(keys)
+
+    def shardKey(self, path):
+        """
+        Get the key of the shard that contains the given item path.
+
+        Example:
+            storage = ShardedStorage(path, "/library", depth=1)
+            print(storage.shardKey("/library/Mario/Sub/jump.anim"))
+            # Mario
+
+        :type path: str
+        :rtype: str
+        """
+        root = self._root + "/"
+
+        if not path.startswith(root):
+            return ""
+
+        folders = path[len(root):].split("/")[:-1]
+
+        return "/".join(folders[:self.depth()])
+
+    def shardsForFolders(self, folders):
+        """
+        Get the keys of the shards that contain the items in the given folders.
+
+        The items in a folder and in all its sub folders are included.
+
+        :type folders: list[str]
+        :rtype: list[str]
+        """
+        shards = self.shards()
+        keys = set()
+
+        for folder in folders:
+            folder = studiolibrary.normPath(folder).rstrip("/")
+
+            if folder == self._root:
+                return shards
+
+            if not folder.startswith(self._root + "/"):
+                continue
+
+            folder = folder[len(self._root) + 1:]
+            prefix = folder + "/"
+
+            for key in shards:
+                if key == folder or prefix.startswith(key + "/") or key.startswith(prefix):
+                    keys.add(key)
+
+        return sorted(keys)
+
+    def shardStorage(self, key, shards=None):
+        """
+        Get the storage of the shard for the given key.
+
+        :type key: str
+        :type shards: dict or None
+        :rtype: Storage
+        """
+        if shards is None:
+            shards = self.manifest(refresh=False)["shards"]
+
+        name = shards.get(key)
+
+        if not name:
+            name = hashlib.md5(key.encode("utf-8")).hexdigest()[:16] + self._extension
+
+        path = studiolibrary.normPath(os.path.join(self.shardsPath(), name))
+        storage = self._storages.get(key)
+
+        if storage is None or storage.path() != path:
+            storage = createStorage(path, self._root)
+            self._storages[key] = storage
+
+        return storage
+
+    def version(self):
+        """
+        Get the state of the manifest and the versions of the loaded shards.
+
+        :rtype: list
+        """
+        version = [_fileState(self.path())]
+
+        for key in self.loaded():
+            version.append(self.shardStorage(key).version())
+
+        return version
+
+    def files(self):
+        """
+        Get the manifest and the files of the loaded shards.
+
+        :rtype: list[str]
+        """
+        files = [self.path()]
+
+        for key in self.loaded():
+            files.extend(self.shardStorage(key).files())
+
+        return files
+
+    def isFolder(self, path, itemData, folders):
+        """
+        Check if the given item is stored in the manifest.
+
+        :type path: str
+        :type itemData: dict
+        :type folders: dict
+        :rtype: bool
+        """
+        return itemData.get("type") == self.FOLDER_TYPE or path in folders
+
+    def split(self, data, folders):
+        """
+        Split the given data into the folder items and the data for each shard.
+
+        :type data: dict
+        :type folders: dict
+        :rtype: (dict, dict)
+        """
+        folders_ = {}
+        shards = {}
+
+        for path, itemData in _items(data):
+            if self.isFolder(path, itemData, folders):
+                folders_[path] = itemData
+            else:
+                shards.setdefault(self.shardKey(path), {})[path] = itemData
+
+        return folders_, shards
+
+    def read(self):
+        """
+        Read the folder items and the items in the loaded shards.
+
+        :rtype: dict
+        """
+        with self._lock:
+            manifest = self.manifest()
+
+            data = dict(
+                (path, dict(itemData)) for path, itemData in manifest["folders"].items()
+            )
+
+            for key in self.loaded():
+                data.update(self.shardStorage(key).read())
+
+            return data
+
+    def readAll(self):
+        """
+        Read the folder items and the items in all the shards.
+
+        :rtype: dict
+        """
+        with self._lock:
+            data = dict(
+                (path, dict(itemData)) for path, itemData in self.manifest()["folders"].items()
+            )
+
+            for key in self.shards():
+                data.update(self.shardStorage(key).read())
+
+            return data
+
+    def save(self, data):
+        """
+        Replace the folder items and the loaded shards with the given data.
+
+        The shards that have not been loaded are only written when the
+        data contains items for them.
+
+        :type data: dict
+        """
+        keys = self._save(data, keys=self.loaded())
+
+        # The items saved from the library are in memory from now on
+        with self._lock:
+            self._loaded.update(keys)
+
+    def _save(self, data, keys):
+        """
+        Replace the folder items and the given shards with the given data.
+
+        All the shards are replaced when keys is None.
+
+        :type data: dict
+        :type keys: list[str] or None
+        :rtype: list[str]
+        """
+        with self.lock(), self._lock:
+            manifest = self.manifest()
+            shards = dict(manifest["shards"])
+
+            folders, shardData = self.split(data, manifest["folders"])
+
+            keys = set(shards if keys is None else keys)
+            keys.update(shardData)
+
+            for key in sorted(keys):
+                storage = self.shardStorage(key, shards)
+                items = shardData.get(key)
+
+                if items:
+                    storage.save(items)
+                    shards[key] = os.path.basename(storage.path())
+                elif key in shards:
+                    del shards[key]
+                    for path in storage.files():
+                        studiolibrary.utils.silentRemove(path)
+
+            self.saveManifest(shards, folders)
+
+        return sorted(shardData)
+
+    def update(self, data):
+        """
+        Insert or update the given item data in the folders and the shards.
+
+        :type data: dict
+        """
+        with self.lock(), self._lock:
+            manifest = self.manifest()
+            shards = dict(manifest["shards"])
+
+            folders, shardData = self.split(data, manifest["folders"])
+
+            changed = False
+
+            for key, items in shardData.items():
+                storage = self.shardStorage(key, shards)
+                storage.update(items)
+
+                if key not in shards:
+                    shards[key] = os.path.basename(storage.path())
+                    changed = True
+
+            if folders or changed:
+                folders_ = dict(manifest["folders"])
+
+                for path, itemData in folders.items():
+                    itemData_ = dict(folders_.get(path) or {})
+                    itemData_.update(itemData)
+                    folders_[path] = itemData_
+
+                self.saveManifest(shards, folders_)
+
+    def remove(self, paths):
+        """
+        Remove the given paths from the folders and the shards.
+
+        :type paths: list[str]
+        """
+        with self.lock(), self._lock:
+            manifest = self.manifest()
+            shards = manifest["shards"]
+            folders = dict(manifest["folders"])
+
+            removed = False
+            shardPaths = {}
+
+            for path in paths:
+                if path in folders:
+                    del folders[path]
+                    removed = True
+                else:
+                    shardPaths.setdefault(self.shardKey(path), []).append(path)
+
+            for key, paths_ in shardPaths.items():
+                if key in shards:
+                    self.shardStorage(key, shards).remove(paths_)
+
+            if removed:
+                self.saveManifest(dict(shards), folders)
+
+    def rename(self, src, dst):
+        """
+        Rename the given source path and all its children to the destination.
+
+        :type src: str
+        :type dst: str
+        """
+        self.renamePaths([(src, dst)])
+
+    def renamePaths(self, mapping):
+        """
+        Rename each source path and its children to the destination path.
+
+        The items can move to other shards, so all the shards are read and
+        saved again.
+
+        :type mapping: dict or list[(str, str)]
+        """
+        with self.lock(), self._lock:
+            data = self.readAll()
+            index = studiolibrary.pathindex.PathIndex(data.keys())
+
+            for src, dst in _items(mapping):
+                src = studiolibrary.normPath(src)
+                dst = studiolibrary.normPath(dst)
+                renameItemData(data, src, dst, index)
+
+            self._save(data, keys=None)
+
+    def compact(self):
+        """
+        Compact each shard and remove the shard files left behind.
+
+        Shard files that are not in the manifest are left behind when a
+        process stops while saving.
+        """
+        with self.lock(), self._lock:
+            shards = self.manifest()["shards"]
+
+            for key in sorted(shards):
+                self.shardStorage(key, shards).compact()
+
+            names = set(name.split(".")[0] for name in shards.values())
+
+            if os.path.isdir(self.shardsPath()):
+                for name in os.listdir(self.shardsPath()):
+                    if name.split(".")[0] not in names:
+                        path = os.path.join(self.shardsPath(), name)
+                        logger.debug('Removing the unused shard file "%s"', path)
+                        studiolibrary.utils.silentRemove(path)
+
+
+registerStorage(".json", JsonStorage)
+registerStorage(".db", SqliteStorage)
+registerStorage(".sqlite", SqliteStorage)
+registerStorage(".sqlite3", SqliteStorage)
@@ -40,6 +40,14 @@ try:
 except ImportError:
     from os import walk
 
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
 import studiolibrary
 
 from studiovendor import six
@@ -71,6 +79,13 @@ __all__ = [
     "settingsPath",
     "relPath",
     "absPath",
+    "encodePath",
+    "decodePath",
+    "encodeItemData",
+    "decodeItemData",
+    "encodePaths",
+    "decodePaths",
+    "resolveLegacyPaths",
     "tempPath",
     "realPath",
     "normPath",
@@ -79,6 +94,7 @@ __all__ = [
     "movePath",
     "movePaths",
     "listPaths",
+    "scanDir",
     "splitPath",
     "localPath",
     "removePath",
@@ -802,8 +818,6 @@ def read(path):
         with open(path) as f:
             data = f.read() or data
 
-    data = absPath(data, path)
-
     return data
 
 
@@ -816,55 +830,31 @@ def write(path, data):
     :rtype: None 
     """
     path = normPath(path)
-    data = relPath(data, path)
 
-    tmp = path + ".tmp"
-    bak = path + ".bak"
+    # Use a unique tmp file so that concurrent writers never share it
+    tmp = u"{0}.{1}.tmp".format(path, uuid.uuid4().hex)
 
     # Create the directory if it doesn't exists
     dirname = os.path.dirname(path)
     if not os.path.exists(dirname):
         os.makedirs(dirname)
 
-    # Use the tmp file to check for concurrent writes
-    if os.path.exists(tmp):
-        msg = "The path is locked for writing and cannot be accessed {}"
-        msg = msg.format(tmp)
-        raise IOError(msg)
-
     # Safely write the data to a tmp file and then rename to the given path
     try:
-        # Create and write the new data
-        #  to the path.tmp file
         with open(tmp, "w") as f:
             f.write(data)
             f.flush()
 
-        # Remove any existing path.bak files
-        silentRemove(bak)
-
-        # Rename the existing path to path.bak
-        if os.path.exists(path):
-            os.rename(path, bak)
-
-        # Rename the tmp path to the given path
-        if os.path.exists(tmp):
+        # Atomically replace the path so readers never see a missing file
+        if hasattr(os, "replace"):
+            os.replace(tmp, path)
+        else:
+            silentRemove(path)
             os.rename(tmp, path)
-
-        # Clean up the bak file only if the given path exists
-        if os.path.exists(path) and os.path.exists(bak):
-            silentRemove(bak)
-
-    except:
-        # Remove the tmp file if there are any issues
+    finally:
+        # The tmp file only remains if there were any issues
         silentRemove(tmp)
 
-        # Restore the path from the current .bak file
-        if not os.path.exists(path) and os.path.exists(bak):
-            os.rename(bak, path)
-
-        raise
-
 
 def update(data, other):
     """
@@ -882,39 +872,49 @@ def update(data, other):
     return data
 
 
-def updateJson(path, data):
+def updateJson(path, data, root=None):
     """
     Update a json file with the given data.
 
     :type path: str
     :type data: dict
+    :type root: str or None
     :rtype: None
     """
-    data_ = readJson(path)
+    data_ = readJson(path, root=root)
     data_ = update(data_, data)
-    saveJson(path, data_)
+    saveJson(path, data_, root=root)
 
 
-def saveJson(path, data):
+def saveJson(path, data, root=None):
     """
     Serialize the data to a JSON string and write it to the given path.
 
+    When the root is given the paths below it are saved with the root token.
+
     :type path: str
     :type data: dict
+    :type root: str or None
     :rtype: None
     """
     path = normPath(path)
 
+    if root:
+        data = encodePaths(data, root)
+
     data = collections.OrderedDict(sorted(data.items(), key=lambda t: t[0]))
     data = json.dumps(data, indent=4)
     write(path, data)
 
 
-def readJson(path):
+def readJson(path, root=None):
     """
     Read the given JSON file and deserialize to a Python object.
 
+    When the root is given the root token is replaced by the root.
+
     :type path: str
+    :type root: str or None
     :rtype: dict
     """
     path = normPath(path)
@@ -924,6 +924,9 @@ def readJson(path):
     data = read(path) or "{}"
     data = json.loads(data)
 
+    if root:
+        data = decodePaths(data, root)
+
     return data
 
 
@@ -965,6 +968,11 @@ def readSettings():
     except Exception as error:
         logger.exception('Cannot read settings from "%s"', path)
 
+    # Older versions saved the library paths relative to the settings
+    for name, settings in data.items():
+        if isinstance(settings, dict):
+            data[name] = resolveLegacyPaths(settings, path)
+
     return data
 
 
@@ -1110,6 +1118,266 @@ def absPath(data, start, depth=3):
     return data
 
 
+# The token saved in place of the library root in the database paths
+ROOT_TOKEN = "{root}"
+
+# The item data and settings fields that older versions saved as paths
+# relative to the database, metadata or settings file
+LEGACY_PATH_FIELDS = ("path", "folder", "icon", "mayaSceneFile")
+
+
+def encodePath(path, root):
+    """
+    Return the given path relative to the root using the root token.
+
+    Paths outside of the root are returned unchanged.
+
+    Example:
+        print(encodePath("P:/LibraryData/Mario/jump.anim", "P:/LibraryData"))
+        # {root}/Mario/jump.anim
+
+    :type path: str
+    :type root: str
+    :rtype: str
+    """
+    if path == root:
+        return ROOT_TOKEN
+
+    prefix = root if root.endswith("/") else root + "/"
+
+    if path.startswith(prefix):
+        return ROOT_TOKEN + "/" + path[len(prefix):]
+
+    return path
+
+
+def decodePath(path, root, start=None):
+    """
+    Return the given path with the root token replaced by the root.
+
+    When the start path is given, the paths saved relative to it by
+    older versions are also resolved.
+
+    Example:
+        print(decodePath("{root}/Mario/jump.anim", "P:/LibraryData"))
+        # P:/LibraryData/Mario/jump.anim
+
+    :type path: str
+    :type root: str
+    :type start: str or None
+    :rtype: str
+    """
+    if path.startswith(ROOT_TOKEN):
+        rest = path[len(ROOT_TOKEN):]
+
+        if not rest:
+            return root
+
+        if rest.startswith("/"):
+            prefix = root if root.endswith("/") else root + "/"
+            return prefix + rest[1:]
+
+    elif start and path.startswith(".."):
+        return _legacyPath(path, start)
+
+    return path
+
+
+def encodeItemData(data, root):
+    """
+    Return the given item data with the paths relative to the root.
+
+    The paths and the string values are encoded with the root token.
+    The given data is not changed.
+
+    :type data: dict
+    :type root: str
+    :rtype: dict
+    """
+    prefix = root if root.endswith("/") else root + "/"
+    tokenPrefix = ROOT_TOKEN + "/"
+    size = len(prefix)
+    result = {}
+
+    # The paths are encoded inline since this is called for every item
+    for path, itemData in data.items():
+        itemData_ = itemData
+
+        for name, value in itemData.items():
+            if isinstance(value, six.string_types) and value.startswith(root):
+                if itemData_ is itemData:
+                    itemData_ = dict(itemData)
+
+                if value.startswith(prefix):
+                    itemData_[name] = tokenPrefix + value[size:]
+                else:
+                    itemData_[name] = encodePath(value, root)
+
+        if path.startswith(prefix):
+            path = tokenPrefix + path[size:]
+        else:
+            path = encodePath(path, root)
+
+        result[path] = itemData_
+
+    return result
+
+
+def decodeItemData(data, root, start=None):
+    """
+    Return the given item data with the root token replaced by the root.
+
+    The paths and the string values are decoded in place. When the start
+    path is given, the paths and the path fields saved relative to it by
+    older versions are also resolved.
+
+    :type data: dict
+    :type root: str
+    :type start: str or None
+    :rtype: dict
+    """
+    prefix = root if root.endswith("/") else root + "/"
+    prefixes = (ROOT_TOKEN, "..") if start else (ROOT_TOKEN,)
+    tokenPrefix = ROOT_TOKEN + "/"
+    size = len(tokenPrefix)
+    result = {}
+
+    # The paths are decoded inline since this is called for every item
+    for path, itemData in data.items():
+        for name, value in itemData.items():
+            if isinstance(value, six.string_types) and value.startswith(ROOT_TOKEN):
+                if value.startswith(tokenPrefix):
+                    itemData[name] = prefix + value[size:]
+                else:
+                    itemData[name] = decodePath(value, root)
+
+        if start:
+            resolveLegacyPaths(itemData, start, inplace=True)
+
+        if path.startswith(tokenPrefix):
+            path = prefix + path[size:]
+        elif path.startswith(prefixes):
+            path = decodePath(path, root, start)
+
+        result[path] = itemData
+
+    return result
+
+
+def encodePaths(data, root):
+    """
+    Return the given JSON data with the paths relative to the root.
+
+    The keys and the strings in nested dicts and lists are encoded with
+    the root token. The given data is not changed.
+
+    :type data: object
+    :type root: str
+    :rtype: object
+    """
+    if isinstance(data, six.string_types):
+        return encodePath(data, root)
+
+    elif isinstance(data, dict):
+        return dict(
+            (encodePaths(key, root), encodePaths(value, root))
+            for key, value in data.items()
+        )
+
+    elif isinstance(data, list):
+        return [encodePaths(value, root) for value in data]
+
+    return data
+
+
+def decodePaths(data, root):
+    """
+    Return the given JSON data with the root token replaced by the root.
+
+    :type data: object
+    :type root: str
+    :rtype: object
+    """
+    if isinstance(data, six.string_types):
+        return decodePath(data, root)
+
+    elif isinstance(data, dict):
+        return dict(
+            (decodePaths(key, root), decodePaths(value, root))
+            for key, value in data.items()
+        )
+
+    elif isinstance(data, list):
+        return [decodePaths(value, root) for value in data]
+
+    return data
+
+
+def resolveLegacyPaths(data, start, inplace=False):
+    """
+    Resolve the path fields saved relative to the start path by older versions.
+
+    Older versions replaced the parent directories of the file with "..",
+    "../.." and "../../.." in the whole text. Only the values of the known
+    path fields are resolved, so that other text starting with ".." is
+    never changed.
+
+    Example:
+        start = "P:/LibraryData/.studiolibrary/database.json"
+        print(resolveLegacyPaths({"folder": "../../Mario"}, start))
+        # {'folder': 'P:/LibraryData/Mario'}
+
+    :type data: dict
+    :type start: str
+    :type inplace: bool
+    :rtype: dict
+    """
+    if not inplace:
+        data = dict(data)
+
+    for name in LEGACY_PATH_FIELDS:
+        value = data.get(name)
+        if isinstance(value, six.string_types) and value.startswith(".."):
+            data[name] = _legacyPath(value, start)
+
+    return data
+
+
+def _legacyPath(path, start, depth=3):
+    """
+    Resolve the given path saved relative to the start path by relPath.
+
+    :type path: str
+    :type start: str
+    :type depth: int
+    :rtype: str
+    """
+    count = 0
+    rest = path
+
+    while count < depth:
+        if rest == "..":
+            rest = ""
+        elif rest.startswith("../"):
+            rest = rest[3:]
+        else:
+            break
+        count += 1
+
+    if not count:
+        return path
+
+    for i in range(count):
+        start = os.path.dirname(start)
+
+    start = normPath(start)
+
+    if not rest:
+        return start
+
+    return start.rstrip("/") + "/" + rest
+
+
 def realPath(path):
     """
     Return the given path eliminating any symbolic link.
@@ -1221,6 +1489,37 @@ def listPaths(path):
         yield value
 
 
+class DirEntry(object):
+    """
+    A minimal version of os.DirEntry for when scandir is not available.
+    """
+    def __init__(self, dirname, name):
+        self.name = name
+        self.path = os.path.join(dirname, name)
+
+    def is_dir(self):
+        return os.path.isdir(self.path)
+
+    def is_symlink(self):
+        return os.path.islink(self.path)
+
+
+def scanDir(path):
+    """
+    Return the directory entries for the given path.
+
+    The entries cache the file type from the directory listing so that
+    checking if an entry is a directory doesn't need an extra stat call.
+
+    :type path: str
+    :rtype: list[os.DirEntry]
+    """
+    if scandir is None:
+        return [DirEntry(path, name) for name in os.listdir(path)]
+
+    return list(scandir(path))
+
+
 def generateUniquePath(path, attempts=1000):
     """
     Generate a unique path on disc.
@@ -1679,12 +1978,77 @@ def testRelativePaths():
     assert data_ == expected, msg
 
 
+def testRootPaths():
+    """Test that the paths are saved relative to the root and read back."""
+    root = "P:/LibraryData"
+    start = "P:/LibraryData/.studiolibrary/database.json"
+
+    data = {
+        "P:/LibraryData": {"type": "Folder"},
+        "P:/LibraryData/Mario/jump.anim": {
+            "path": "P:/LibraryData/Mario/jump.anim",
+            "folder": "P:/LibraryData/Mario",
+            "description": "Copied from P:/LibraryData/Luigi",
+            "other": "P:/LibraryData2/Mario",
+            "modified": 1592469832.26,
+        },
+    }
+
+    expected = {
+        "{root}": {"type": "Folder"},
+        "{root}/Mario/jump.anim": {
+            "path": "{root}/Mario/jump.anim",
+            "folder": "{root}/Mario",
+            "description": "Copied from P:/LibraryData/Luigi",
+            "other": "P:/LibraryData2/Mario",
+            "modified": 1592469832.26,
+        },
+    }
+
+    encoded = encodeItemData(data, root)
+    assert encoded == expected, encoded
+    assert data["P:/LibraryData/Mario/jump.anim"]["folder"] == "P:/LibraryData/Mario"
+
+    decoded = decodeItemData(encoded, root, start=start)
+    assert decoded == data, decoded
+
+    assert encodePath("P:/Mario", "P:/") == "{root}/Mario"
+    assert decodePath("{root}/Mario", "P:/") == "P:/Mario"
+    assert decodePath("{root}", root) == root
+    assert decodePath("{root}Mario", root) == "{root}Mario"
+
+    # The paths saved relative to the database by older versions
+    legacy = {"../../Mario/jump.anim": {"folder": "../../Mario", "name": "..", "description": "../.."}}
+    decoded = decodeItemData(legacy, root, start=start)
+    assert decoded == {
+        "P:/LibraryData/Mario/jump.anim": {
+            "folder": "P:/LibraryData/Mario", "name": "..", "description": "../.."
+        }
+    }, decoded
+
+    # Only the path fields are resolved
+    itemData = {"path": "../..", "icon": "../../../x", "description": "../.. and more"}
+    assert resolveLegacyPaths(itemData, start) == {
+        "path": "P:/LibraryData", "icon": "P:/x", "description": "../.. and more"
+    }
+    assert itemData["path"] == "../.."
+
+    # The nested paths in the metadata are saved relative to the item
+    root = "P:/LibraryData/Mario/jump.anim"
+    metadata = {"icon": root + "/icon.png", "files": [root + "/pose.json", "P:/x"], "count": 2}
+
+    encoded = encodePaths(metadata, root)
+    assert encoded == {"icon": "{root}/icon.png", "files": ["{root}/pose.json", "P:/x"], "count": 2}
+    assert decodePaths(encoded, root) == metadata
+
+
 def runTests():
     """Run all the tests for this file."""
     testUpdate()
     testSplitPath()
     testFormatPath()
     testRelativePaths()
+    testRootPaths()
     testNormPath()
 
 
@@ -0,0 +1,371 @@
+# Copyright 2020 by Kurt Rathjen. All Rights Reserved.
+#
+# This library is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version. This library is distributed in the
+# hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Lesser General Public License for more details.
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import logging
+
+from studiovendor.Qt import QtCore
+
+
+__all__ = [
+    "DatabaseWatcher",
+    "FolderWatcher",
+]
+
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseWatcher(QtCore.QObject):
+    """
+    Emit the changed signal when any of the database files change on disc.
+
+    The files are watched with a QFileSystemWatcher, which uses inotify on
+    Linux and the native file notifications on Windows and macOS. The
+    folders of the files are also watched, since saving a file by
+    replacing it, or creating the journal, changes the folder and not
+    the watched file.
+
+    The signal is only emitted when the modified time or the size of one
+    of the files has changed, so the lock files written next to the
+    database are ignored.
+    """
+
+    changed = QtCore.Signal()
+
+    def __init__(self, *args):
+        QtCore.QObject.__init__(self, *args)
+
+        self._paths = []
+        self._state = None
+
+        self._watcher = QtCore.QFileSystemWatcher(self)
+        self._watcher.fileChanged.connect(self._pathChanged)
+        self._watcher.directoryChanged.connect(self._pathChanged)
+
+    def paths(self):
+        """
+        Get the files that are being watched for changes.
+
+        :rtype: list[str]
+        """
+        return self._paths
+
+    def setPaths(self, paths):
+        """
+        Watch the given files for changes instead of the current files.
+
+        :type paths: list[str]
+        """
+        self.clear()
+
+        self._paths = list(paths)
+        self._state = self.state()
+
+        self._addPaths()
+
+    def clear(self):
+        """Stop watching all the files."""
+        watched = self._watcher.files() + self._watcher.directories()
+        if watched:
+            self._watcher.removePaths(watched)
+
+        self._paths = []
+        self._state = None
+
+    def isWatching(self):
+        """
+        Check if the changes to the files will be emitted.
+
+        The files can only be watched once their folder exists.
+
+        :rtype: bool
+        """
+        return bool(self._watcher.directories())
+
+    def state(self):
+        """
+        Get the modified time and the size of each file.
+
+        :rtype: tuple
+        """
+        state = []
+
+        for path in self._paths:
+            try:
+                stat = os.stat(path)
+                state.append((stat.st_mtime, stat.st_size))
+            except OSError:
+                state.append(None)
+
+        return tuple(state)
+
+    def _addPaths(self):
+        """Watch the files and the folders that exist and are not watched."""
+        watched = set(self._watcher.files() + self._watcher.directories())
+
+        paths = set(self._paths)
+        paths.update(os.path.dirname(path) for path in self._paths)
+
+        paths = [p for p in paths - watched if os.path.exists(p)]
+
+        if paths:
+            self._watcher.addPaths(paths)
+
+    def _pathChanged(self, path):
+        """
+        Triggered when a watched file or folder has changed.
+
+        :type path: str
+        """
+        # A file that has been replaced is no longer watched
+        self._addPaths()
+
+        state = self.state()
+
+        if state != self._state:
+            logger.debug("Database changed: %s", path)
+            self._state = state
+            self.changed.emit()
+
+
+class FolderWatcher(QtCore.QObject):
+    """
+    Emit the folders that have changed after the changes have settled.
+
+    The changes are coalesced, so extracting an archive with thousands
+    of files emits the changed folders once instead of for each file.
+    The folders are emitted when there have been no changes for the
+    delay, or at the latest after the maximum delay during a long burst.
+    """
+
+    foldersChanged = QtCore.Signal(object)
+
+    DELAY = 500
+    MAX_DELAY = 3000
+
+    def __init__(self, *args):
+        QtCore.QObject.__init__(self, *args)
+
+        self._pending = set()
+        self._pendingTime = None
+        self._delay = self.DELAY
+        self._maxDelay = self.MAX_DELAY
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+
+        self._watcher = QtCore.QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._directoryChanged)
+
+    def setDelay(self, msecs, maxMsecs=None):
+        """
+        Set the milliseconds to wait for more changes before emitting them.
+
+        :type msecs: int
+        :type maxMsecs: int or None
+        """
+        self._delay = msecs
+
+        if maxMsecs is not None:
+            self._maxDelay = maxMsecs
+
+    def paths(self):
+        """
+        Get the folders that are being watched.
+
+        :rtype: list[str]
+        """
+        return self._watcher.directories()
+
+    def addPaths(self, paths):
+        """
+        Watch the given folders for created, removed and renamed files.
+
+        :type paths: list[str]
+        """
+        paths = set(paths).difference(self._watcher.directories())
+        paths = [path for path in paths if os.path.isdir(path)]
+
+        if paths:
+            failed = self._watcher.addPaths(paths)
+            if failed:
+                logger.warning("Cannot watch %s folders", len(failed))
+
+    def setPaths(self, paths):
+        """
+        Watch the given folders instead of the current folders.
+
+        :type paths: list[str]
+        """
+        self.clear()
+        self.addPaths(paths)
+
+    def clear(self):
+        """Stop watching all the folders and forget the pending changes."""
+        paths = self._watcher.directories()
+        if paths:
+            self._watcher.removePaths(paths)
+
+        self._timer.stop()
+        self._pending = set()
+        self._pendingTime = None
+
+    def isWatching(self):
+        """
+        Check if any folders are being watched.
+
+        :rtype: bool
+        """
+        return bool(self._watcher.directories())
+
+    def pending(self):
+        """
+        Get the folders that have changed but have not been emitted.
+
+        :rtype: set[str]
+        """
+        return self._pending
+
+    def flush(self):
+        """Emit the folders that have changed without waiting."""
+        self._timer.stop()
+
+        pending = self._pending
+        self._pending = set()
+        self._pendingTime = None
+
+        if pending:
+            logger.debug("Folders changed: %s", len(pending))
+            self.foldersChanged.emit(sorted(pending))
+
+    def _directoryChanged(self, path):
+        """
+        Triggered when a file is created, removed or renamed in the folder.
+
+        :type path: str
+        """
+        now = time.time()
+
+        if self._pendingTime is None:
+            self._pendingTime = now
+
+        self._pending.add(path)
+
+        # Wait for the burst to settle, but not longer than the maximum
+        remaining = self._maxDelay - (now - self._pendingTime) * 1000
+        self._timer.start(int(max(0, min(self._delay, remaining))))
+
+
+def testDatabaseWatcher():
+    """Test that changing the file emits the changed signal."""
+    import time
+    import shutil
+    import tempfile
+
+    path = tempfile.mkdtemp()
+
+    try:
+        app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+        database = os.path.join(path, "database.json")
+        journal = os.path.join(path, "database.journal")
+
+        with open(database, "w") as f:
+            f.write("{}")
+
+        watcher = DatabaseWatcher()
+        watcher.setPaths([database, journal])
+        assert watcher.isWatching()
+
+        changes = []
+        watcher.changed.connect(lambda: changes.append(True))
+
+        def wait(count, timeout=5):
+            end = time.time() + timeout
+            while len(changes) < count and time.time() < end:
+                app.processEvents()
+                time.sleep(0.01)
+            return len(changes)
+
+        # Writing the lock file does not change the database
+        with open(os.path.join(path, "database.json.lock"), "w") as f:
+            f.write("lock")
+        assert wait(1, timeout=0.5) == 0
+
+        with open(journal, "w") as f:
+            f.write("[]\n")
+        assert wait(1) == 1
+
+        # The file is still watched after it has been replaced
+        temp = database + ".tmp"
+        with open(temp, "w") as f:
+            f.write('{"a": {}}')
+        os.rename(temp, database)
+        assert wait(2) == 2
+
+        with open(database, "a") as f:
+            f.write(" ")
+        assert wait(3) == 3
+
+        watcher.clear()
+        assert not watcher.isWatching()
+    finally:
+        shutil.rmtree(path)
+
+
+def testFolderWatcher():
+    """Test that a burst of changes is emitted once with the changed folders."""
+    import shutil
+    import tempfile
+
+    path = tempfile.mkdtemp()
+
+    try:
+        app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+        folders = [os.path.join(path, name) for name in ["Mario", "Luigi"]]
+        for folder in folders:
+            os.makedirs(folder)
+
+        watcher = FolderWatcher()
+        watcher.setDelay(200)
+        watcher.setPaths([path] + folders)
+
+        changes = []
+        watcher.foldersChanged.connect(changes.append)
+
+        for i in range(200):
+            os.makedirs(os.path.join(folders[0], "item{0}.anim".format(i)))
+        os.rmdir(os.path.join(folders[0], "item0.anim"))
+        os.makedirs(os.path.join(path, "Peach"))
+
+        end = time.time() + 5
+        while not changes and time.time() < end:
+            app.processEvents()
+            time.sleep(0.01)
+
+        assert changes == [sorted([path, folders[0]])], changes
+        assert not watcher.pending()
+    finally:
+        shutil.rmtree(path)
+
+
+def testsuite():
+    testDatabaseWatcher()
+    testFolderWatcher()
+
+
+if __name__ == "__main__":
+    testsuite()
@@ -146,9 +146,7 @@ class Item(QtWidgets.QTreeWidgetItem):
         self._sliderPosition = None
         self._sliderEnabled = False
 
-        self._worker = ImageWorker()
-        self._worker.setAutoDelete(False)
-        self._worker.signals.triggered.connect(self._thumbnailFromImage)
+        self._worker = None
         self._workerStarted = False
 
     def __eq__(self, other):
@@ -555,6 +553,11 @@ class Item(QtWidgets.QTreeWidgetItem):
         if not self._thumbnailIcon:
             if self.ENABLE_THUMBNAIL_THREAD and not self._workerStarted:
                 self._workerStarted = True
+
+                # Only create the worker for items that are shown
+                self._worker = ImageWorker()
+                self._worker.setAutoDelete(False)
+                self._worker.signals.triggered.connect(self._thumbnailFromImage)
                 self._worker.setPath(thumbnailPath)
 
                 self.ThreadPool.start(self._worker)
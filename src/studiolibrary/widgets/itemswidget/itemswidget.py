@@ -17,6 +17,8 @@ from studiovendor.Qt import QtGui
 from studiovendor.Qt import QtCore
 from studiovendor.Qt import QtWidgets
 
+import studiolibrary
+
 from .item import Item
 from .item import LabelDisplayOption
 from .listview import ListView
@@ -74,6 +76,7 @@ class ItemsWidget(QtWidgets.QWidget):
         self._labelDisplayOption = self.LABEL_DISPLAY_OPTION
 
         self._dataset = None
+        self._lastGroup = None
         self._treeWidget = TreeWidget(self)
 
         self._listView = ListView(self)
@@ -113,6 +116,11 @@ class ItemsWidget(QtWidgets.QWidget):
         self.treeWidget().itemClicked.connect(self._itemClicked)
         self.treeWidget().itemDoubleClicked.connect(self._itemDoubleClicked)
 
+        for scrollBar in [self.listView().verticalScrollBar(),
+                          self.treeWidget().verticalScrollBar()]:
+            scrollBar.valueChanged.connect(self._scrollBarChanged)
+            scrollBar.rangeChanged.connect(self._scrollBarChanged)
+
         self.itemMoved = self._listView.itemMoved
         self.itemDropped = self._listView.itemDropped
         self.itemSelectionChanged = self._treeWidget.itemSelectionChanged
@@ -156,10 +164,12 @@ class ItemsWidget(QtWidgets.QWidget):
         self._dataset = dataset
         self.setColumnLabels(dataset.fieldNames())
         dataset.searchFinished.connect(self.updateItems)
+        dataset.resultsFetched.connect(self.addGroupedItems)
 
     def dataset(self):
         return self._dataset
 
+    @studiolibrary.metrics.timed("itemsWidget.updateItems")
     def updateItems(self):
         """Sets the items to the widget."""
         selectedItems = self.selectedItems()
@@ -169,15 +179,9 @@ class ItemsWidget(QtWidgets.QWidget):
         try:
             self.clearSelection()
 
-            results = self.dataset().groupedResults()
-
-            items = []
+            self._lastGroup = None
 
-            for group in results:
-                if group != "None":
-                    groupItem = self.createGroupItem(group)
-                    items.append(groupItem)
-                items.extend(results[group])
+            items = self.itemsFromGroups(self.dataset().groupedResults())
 
             self.treeWidget().setItems(items)
 
@@ -189,6 +193,67 @@ class ItemsWidget(QtWidgets.QWidget):
             self.treeWidget().blockSignals(False)
             self.itemSelectionChanged.emit()
 
+    def itemsFromGroups(self, groups):
+        """
+        Get the items for the given groups with a group item for each new group.
+
+        A group that continues the last group does not get another group
+        item, so that the next page of a search can be added to the end.
+
+        :type groups: dict
+        :rtype: list[studioqt.Item]
+        """
+        items = []
+
+        for group in groups:
+            if group != "None" and group != self._lastGroup:
+                groupItem = self.createGroupItem(group)
+                items.append(groupItem)
+            items.extend(groups[group])
+            self._lastGroup = group
+
+        return items
+
+    @studiolibrary.metrics.timed("itemsWidget.addGroupedItems")
+    def addGroupedItems(self, groups):
+        """
+        Add the next page of the search results to the end of the items.
+
+        :type groups: dict
+        :rtype: None
+        """
+        self.treeWidget().blockSignals(True)
+
+        try:
+            self.addItems(self.itemsFromGroups(groups))
+        finally:
+            self.treeWidget().blockSignals(False)
+
+    def fetchMore(self):
+        """
+        Fetch the next page of the search results if there is one.
+
+        :rtype: None
+        """
+        dataset = self.dataset()
+
+        if dataset and dataset.canFetchMore():
+            dataset.fetchMore()
+
+    def _scrollBarChanged(self, *args):
+        """
+        Triggered when the scroll bar moves or the items change size.
+
+        Fetch the next page when the end of the items is less than a
+        page away, so the view is filled as the user scrolls.
+
+        :rtype: None
+        """
+        scrollBar = self.verticalScrollBar()
+
+        if scrollBar.value() >= scrollBar.maximum() - scrollBar.pageStep():
+            self.fetchMore()
+
     def createGroupItem(self, text, children=None):
         """
         Create a new group item for the given text and children.
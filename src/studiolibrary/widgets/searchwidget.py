@@ -28,6 +28,9 @@ class SearchWidget(QtWidgets.QLineEdit):
     SPACE_OPERATOR = "and"
     PLACEHOLDER_TEXT = "Search"
 
+    # The milliseconds to wait after the last key press before searching
+    SEARCH_DELAY = 0
+
     searchChanged = QtCore.Signal()
 
     def __init__(self, *args):
@@ -35,6 +38,12 @@ class SearchWidget(QtWidgets.QLineEdit):
 
         self._dataset = None
         self._spaceOperator = "and"
+
+        self._searchTimer = QtCore.QTimer(self)
+        self._searchTimer.setSingleShot(True)
+        self._searchTimer.setInterval(self.SEARCH_DELAY)
+        self._searchTimer.timeout.connect(self.search)
+
         self._iconButton = QtWidgets.QPushButton(self)
         self._iconButton.clicked.connect(self._iconClicked)
 
@@ -99,10 +108,34 @@ class SearchWidget(QtWidgets.QLineEdit):
         :type text: str
         :rtype: None
         """
-        self.search()
+        if self.searchDelay() > 0:
+            self.updateClearButton()
+            self._searchTimer.start()
+        else:
+            self.search()
+
+    def searchDelay(self):
+        """
+        Get the milliseconds to wait after the text changes before searching.
+
+        :rtype: int
+        """
+        return self._searchTimer.interval()
+
+    def setSearchDelay(self, msecs):
+        """
+        Set the milliseconds to wait after the text changes before searching.
+
+        Typing several characters within the delay only runs one search.
+
+        :type msecs: int
+        """
+        self._searchTimer.setInterval(msecs)
 
     def search(self):
         """Run the search query on the data set."""
+        self._searchTimer.stop()
+
         if self.dataset():
             self.dataset().addQuery(self.query())
             self.dataset().search()
@@ -49,6 +49,9 @@ def read():
     """
     Return the local settings from the location of the SETTING_PATH.
 
+    The paths are saved as absolute paths, since the settings hold the
+    paths of the libraries and are saved in the local user folder.
+
     :rtype: dict
     """
     global _settings